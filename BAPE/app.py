@@ -10,14 +10,24 @@ BAPE 商品爬蟲 + Shopify Bulk Operations 上架工具 v2.3
 6. v2.3: variant 級別庫存同步 - 自動刪除缺貨選項，新商品只建立有貨選項
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from bs4 import BeautifulSoup, SoupStrainer
 import re
 import json
 import os
 import time
 import threading
+import queue
+import random
+import itertools
+import sqlite3
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 app = Flask(__name__)
 
@@ -40,20 +50,137 @@ CATEGORIES = {
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 MIN_PRICE = 1000
 DEFAULT_WEIGHT = 0.5
+# 安全機制：來源商品少於此數（多半是抓取異常）時不刪除下架商品
+MIN_PRODUCTS_FOR_CLEANUP = 10
+# 商品分類（Shopify Standard Product Taxonomy；預設 Apparel & Accessories）
+PRODUCT_CATEGORY_ID = os.environ.get('BAPE_PRODUCT_CATEGORY', 'gid://shopify/TaxonomyCategory/aa')
 JSONL_DIR = "/tmp/bape_jsonl"
 
 HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
     'Accept': 'application/json, text/html', 'Accept-Language': 'ja,en;q=0.9'}
 
+# products.json 每頁筆數（Shopify storefront 上限 250）、同時抓取的頁數
+PRODUCTS_PAGE_SIZE = 250
+PAGE_WINDOW = int(os.environ.get('BAPE_PAGE_WINDOW', '6'))
+
 os.makedirs(JSONL_DIR, exist_ok=True)
 
+# 狀態紀錄（商品 / 錯誤）最多保留的筆數；/api/status 只附最近 STATUS_RECENT 筆
+STATUS_LOG_SIZE = int(os.environ.get('STATUS_LOG_SIZE', '500'))
+STATUS_RECENT = 20
+# /api/events（SSE）：檢查間隔、單一連線最長秒數（之後瀏覽器自動重連）、keep-alive、開始前等待秒數
+SSE_INTERVAL, SSE_MAX_SECONDS, SSE_KEEPALIVE, SSE_START_GRACE = 1.0, 300, 15, 5
+# 每條 SSE 連線佔用一個 gunicorn thread
+SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', '2'))
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_CLIENTS)
+
+
+class RingLog:
+    """只保留最近 maxlen 筆；total 為累計筆數，offset 以累計序號計算"""
+    def __init__(self, maxlen=STATUS_LOG_SIZE):
+        self._items = deque(maxlen=maxlen); self._lock = threading.Lock(); self.total = 0
+
+    def append(self, item):
+        with self._lock: self._items.append(item); self.total += 1
+
+    def __len__(self): return self.total
+
+    def page(self, offset=0, limit=50):
+        with self._lock:
+            first = self.total - len(self._items); start = max(offset, first)
+            items = list(itertools.islice(self._items, start - first, start - first + limit)); total = self.total
+        return {'total': total, 'first_available': first, 'offset': start, 'limit': limit, 'items': items}
+
+    def tail(self, n):
+        with self._lock: return list(itertools.islice(self._items, max(len(self._items) - n, 0), None))
+
+    def since(self, cursor):
+        """序號 >= cursor 的紀錄 + 新 cursor；cursor 比 total 大代表是上一輪的 → 從頭"""
+        with self._lock:
+            first = self.total - len(self._items); start = max(0 if cursor > self.total else cursor, first)
+            return list(itertools.islice(self._items, start - first, None)), self.total
+
+
 scrape_status = {
     "running": False, "phase": "", "progress": 0, "total": 0,
-    "current_product": "", "products": [], "errors": [],
+    "current_product": "", "products": RingLog(), "errors": RingLog(),
     "jsonl_file": "", "bulk_operation_id": "", "bulk_status": "",
     "deleted": 0, "variants_deleted": 0,
 }
 
+# ========== Run lease（SQLite）：跨 gunicorn worker / 重啟只允許一個執行 ==========
+RUN_LEASE_DB = os.environ.get('RUN_LEASE_DB', '/tmp/bape_run.sqlite3')
+RUN_LEASE_TTL = int(os.environ.get('RUN_LEASE_TTL', '120'))  # 超過 TTL 沒有心跳 → 視為中斷，可被接手
+RUN_HEARTBEAT = 10
+
+
+class RunLease:
+    """acquire 成功才可開始執行；執行中 heartbeat（延長期限 + 寫入狀態快照）；結束 release"""
+    def __init__(self, path, name='sync', ttl=RUN_LEASE_TTL):
+        self.path, self.name, self.ttl = path, name, ttl
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS run_lease (name TEXT PRIMARY KEY, owner TEXT, job TEXT, expires_at REAL, heartbeat_at REAL, status TEXT)')
+
+    def _connect(self): return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def acquire(self, job):
+        owner, now = uuid.uuid4().hex, time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT owner, expires_at FROM run_lease WHERE name = ?', (self.name,)).fetchone()
+            if row and row[0] and row[1] > now: conn.execute('ROLLBACK'); return None
+            if row and row[0]: print(f"[LEASE] 上一次執行的租約已過期（{row[0][:8]}），接手執行")
+            conn.execute('INSERT INTO run_lease (name, owner, job, expires_at, heartbeat_at, status) VALUES (?, ?, ?, ?, ?, NULL) '
+                'ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, job = excluded.job, expires_at = excluded.expires_at, '
+                'heartbeat_at = excluded.heartbeat_at, status = NULL', (self.name, owner, job, now + self.ttl, now))
+            conn.execute('COMMIT')
+            return owner
+        finally: conn.close()
+
+    def heartbeat(self, owner, status):
+        now = time.time()
+        with self._connect() as conn:
+            return conn.execute('UPDATE run_lease SET expires_at = ?, heartbeat_at = ?, status = ? WHERE name = ? AND owner = ?',
+                (now + self.ttl, now, json.dumps(status, ensure_ascii=False), self.name, owner)).rowcount == 1
+
+    def release(self, owner, status):
+        with self._connect() as conn:
+            conn.execute('UPDATE run_lease SET owner = NULL, expires_at = 0, heartbeat_at = ?, status = ? WHERE name = ? AND owner = ?',
+                (time.time(), json.dumps(status, ensure_ascii=False), self.name, owner))
+
+    def current(self):
+        with self._connect() as conn:
+            row = conn.execute('SELECT owner, job, expires_at, heartbeat_at, status FROM run_lease WHERE name = ?', (self.name,)).fetchone()
+        if not row: return None
+        owner, job, expires_at, heartbeat_at, status = row
+        return {'owner': owner, 'job': job, 'active': bool(owner) and expires_at > time.time(),
+            'expired': bool(owner) and expires_at <= time.time(), 'heartbeat_at': heartbeat_at,
+            'status': json.loads(status) if status else None}
+
+
+run_lease = RunLease(RUN_LEASE_DB)
+_run_owner = None  # 本 process 目前持有的租約
+
+
+def start_run(job, target, *args):
+    """取得租約後在背景執行 target；任一 worker 已在執行則回傳 False"""
+    global _run_owner
+    owner = run_lease.acquire(job)
+    if not owner: return False
+    _run_owner = owner
+    def heartbeat_loop(stop):
+        while not stop.wait(RUN_HEARTBEAT):
+            if not run_lease.heartbeat(owner, status_snapshot()): print("[LEASE] 租約已被其他執行接手"); return
+    def runner():
+        global _run_owner
+        stop = threading.Event()
+        threading.Thread(target=heartbeat_loop, args=(stop,), daemon=True).start()
+        try: target(*args)
+        finally: stop.set(); run_lease.release(owner, status_snapshot()); _run_owner = None
+    threading.Thread(target=runner, daemon=True).start()
+    return True
+
 
 def load_shopify_token():
     global SHOPIFY_SHOP, SHOPIFY_ACCESS_TOKEN
@@ -61,19 +188,162 @@ def load_shopify_token():
     if not SHOPIFY_ACCESS_TOKEN: SHOPIFY_ACCESS_TOKEN = os.environ.get("SHOPIFY_ACCESS_TOKEN", "")
 
 
-def graphql_request(query, variables=None):
-    load_shopify_token()
-    url = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/2024-10/graphql.json"
-    headers = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
-    payload = {'query': query}
-    if variables: payload['variables'] = variables
-    return requests.post(url, headers=headers, json=payload, timeout=60).json()
+# GraphQL：重試次數、退避基準秒數、每個請求預扣的點數（不知道實際成本時；cost-based throttling）
+GRAPHQL_MAX_RETRIES = int(os.environ.get('BAPE_GRAPHQL_RETRIES', '5'))
+GRAPHQL_BACKOFF = 1.0
+GRAPHQL_MIN_AVAILABLE = int(os.environ.get('BAPE_GRAPHQL_MIN_AVAILABLE', '100'))
+
+
+class ShopifyGraphQL:
+    """
+    Shopify Admin GraphQL client（所有執行緒共用）
+    - 共用 Session（keep-alive 連線池）
+    - 依 extensions.cost.throttleStatus 追蹤剩餘點數；送出前預扣預估成本（進行中的請求也算），點數不足時先等回復
+    - query：THROTTLED / 429 / 5xx / 連線錯誤 → jitter 指數退避重試
+    - mutation：只在確定沒被執行時重試（連線建立失敗 / 429 / THROTTLED），避免重送建立出重複資料
+    - 重試用盡則丟例外（不再把錯誤當成空資料）
+    - stats(): 呼叫次數、花費點數、重試 / 節流次數
+    """
+
+    def __init__(self, version='2024-10'):
+        self.version = version; self._session = None; self._lock = threading.Lock()
+        self.available = None; self.maximum = 1000.0; self.restore_rate = 50.0
+        self.pending = 0.0; self._updated = time.monotonic()  # 進行中請求預扣的點數、available 的回報時間
+        self.calls = 0; self.cost = 0.0; self.retries = 0; self.throttled = 0; self.failures = 0
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=16))
+                self._session = session
+            return self._session
+
+    def reserve(self, needed=GRAPHQL_MIN_AVAILABLE):
+        """
+        預扣 needed 點並等到點數足夠：上次回報的點數 + 之後回復的點數 - 其他進行中請求已預扣的點數
+        回傳預扣量，請求結束後以 release() 歸還
+        """
+        needed = min(needed, self.maximum)
+        with self._lock:
+            wait = 0
+            if self.available is not None:
+                estimate = min(self.maximum, self.available + (time.monotonic() - self._updated) * self.restore_rate)
+                wait = max(0.0, (needed + self.pending - estimate) / self.restore_rate)
+            self.pending += needed
+        if wait: time.sleep(wait)
+        return needed
+
+    def release(self, reserved):
+        with self._lock: self.pending = max(0.0, self.pending - reserved)
+
+    @staticmethod
+    def _not_sent(error):
+        """連線建立階段就失敗（請求確定沒送到 Shopify）"""
+        if isinstance(error, requests.ConnectTimeout): return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+    def _record(self, data):
+        cost = (data.get('extensions') or {}).get('cost') or {}
+        throttle = cost.get('throttleStatus') or {}
+        with self._lock:
+            self.calls += 1
+            self.cost += cost.get('actualQueryCost') or 0  # 被節流的請求沒有 actualQueryCost（不扣點）
+            if throttle:
+                self.available = throttle.get('currentlyAvailable', self.available); self._updated = time.monotonic()
+                self.maximum = throttle.get('maximumAvailable', self.maximum)
+                self.restore_rate = throttle.get('restoreRate', self.restore_rate) or self.restore_rate
+        return cost
+
+    def _backoff(self, attempt, minimum=0):
+        with self._lock: self.retries += 1
+        time.sleep(max(minimum, GRAPHQL_BACKOFF * 2 ** attempt) + random.uniform(0, GRAPHQL_BACKOFF))
+
+    def request(self, query, variables=None, cost=None):
+        """cost：預估的 requestedQueryCost（送出前預扣），不給則用 GRAPHQL_MIN_AVAILABLE"""
+        load_shopify_token()
+        url = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/{self.version}/graphql.json"
+        headers = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
+        payload = {'query': query}
+        if variables: payload['variables'] = variables
+        error = ''; mutation = query.lstrip().startswith('mutation')
+        for attempt in range(GRAPHQL_MAX_RETRIES + 1):
+            reserved = self.reserve(cost or GRAPHQL_MIN_AVAILABLE)
+            try:
+                response = self.session().post(url, headers=headers, json=payload, timeout=60)
+            except requests.RequestException as e:
+                self.release(reserved); error = f'連線錯誤: {e}'
+                if mutation and not self._not_sent(e): break  # 可能已執行，不重送
+                self._backoff(attempt); continue
+            if response.status_code == 429 or response.status_code >= 500:
+                self.release(reserved); error = f'HTTP {response.status_code}'
+                if response.status_code == 429:
+                    with self._lock: self.throttled += 1
+                elif mutation: break  # 5xx 時 mutation 可能已執行，不重送
+                self._backoff(attempt, float(response.headers.get('Retry-After', 0) or 0)); continue
+            try: data = response.json()
+            except ValueError:
+                self.release(reserved); raise Exception(f'GraphQL 回應不是 JSON: HTTP {response.status_code} {response.text[:200]}')
+            spent = self._record(data); self.release(reserved)  # 先更新回報的點數再歸還預扣
+            if any((e.get('extensions') or {}).get('code') == 'THROTTLED' for e in data.get('errors') or [] if isinstance(e, dict)):
+                with self._lock: self.throttled += 1
+                error = 'THROTTLED'
+                cost = spent.get('requestedQueryCost') or cost  # 重送時預扣實際需要的點數
+                self._backoff(attempt); continue
+            return data
+        with self._lock: self.failures += 1
+        raise Exception(f'GraphQL 失敗（{attempt + 1} 次）: {error}')
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'cost': round(self.cost), 'retries': self.retries, 'throttled': self.throttled,
+                'failures': self.failures, 'pending': round(self.pending), 'available': self.available, 'maximum': self.maximum, 'restore_rate': self.restore_rate}
+
+
+shopify_gql = ShopifyGraphQL()
+
+
+def graphql_request(query, variables=None, cost=None):
+    return shopify_gql.request(query, variables, cost)
+
+
+QUERY_COST_LIMIT = 1000  # Shopify 單一 query 的 requestedQueryCost 上限
+
+
+def paginate_graphql(query, path, variables=None, page_size=50, max_page_size=250):
+    """
+    依 extensions.cost 自動調整每頁筆數的分頁讀取，逐筆 yield node
+    query 需接受 $first: Int! 與 $cursor: String，path 為 data 到 connection 的 key（例如 ('products',)）
+    - 下一頁筆數 = 單筆成本推算，讓每頁 requestedQueryCost 接近 QUERY_COST_LIMIT / 點數上限的一半
+    - 送出前點數不足則等回復（不再固定 sleep）
+    - MAX_COST_EXCEEDED → 依回報的 cost 縮小筆數重送
+    """
+    size = page_size; cursor = None; estimate = None
+    while True:
+        result = graphql_request(query, {**(variables or {}), 'first': size, 'cursor': cursor}, cost=estimate)
+        exceeded = next((e.get('extensions') for e in result.get('errors') or [] if isinstance(e, dict) and (e.get('extensions') or {}).get('code') == 'MAX_COST_EXCEEDED'), None)
+        if exceeded and size > 1:
+            size = max(1, int(size * exceeded.get('maxCost', QUERY_COST_LIMIT) / max(exceeded.get('cost', 0), 1)) - 1); continue
+        if result.get('errors') and not result.get('data'): raise Exception(f"GraphQL 錯誤: {result['errors']}")
+        connection = result.get('data') or {}
+        for key in path: connection = (connection or {}).get(key) or {}
+        for edge in connection.get('edges', []): yield edge['node']
+        page_info = connection.get('pageInfo', {})
+        if not page_info.get('hasNextPage'): return
+        cursor = page_info.get('endCursor')
+        requested = ((result.get('extensions') or {}).get('cost') or {}).get('requestedQueryCost')
+        if requested:
+            per_item = requested / size
+            size = max(1, min(max_page_size, int(min(QUERY_COST_LIMIT, shopify_gql.maximum / 2) / per_item)))
+            estimate = per_item * size  # 下一頁送出前預扣
 
 
 _collection_id_cache = {}
 
 
-def get_or_create_collection(collection_name):
+def get_or_create_collection(collection_name, create=True):
+    """依標題找 collection；找不到時 create=True 才建立並發佈（dry run 用 create=False，不寫入商店）"""
     global _collection_id_cache
     if collection_name in _collection_id_cache: return _collection_id_cache[collection_name]
     query = """query findCollection($title: String!) { collections(first: 1, query: $title) { edges { node { id title } } } }"""
@@ -82,6 +352,7 @@ def get_or_create_collection(collection_name):
         if edge['node']['title'] == collection_name:
             _collection_id_cache[collection_name] = edge['node']['id']
             return edge['node']['id']
+    if not create: return None
     mutation = """mutation createCollection($input: CollectionInput!) { collectionCreate(input: $input) { collection { id title } userErrors { field message } } }"""
     result = graphql_request(mutation, {"input": {"title": collection_name, "descriptionHtml": f"<p>{collection_name} - 日本 A BATHING APE 官方正品代購</p>"}})
     collection = result.get('data', {}).get('collectionCreate', {}).get('collection')
@@ -195,14 +466,37 @@ def clean_description(description):
 
 # ========== 爬取函數 ==========
 
-def fetch_products_json(page=1):
-    url = f"{SOURCE_URL}/collections/all/products.json?page={page}&limit=50"
-    try:
-        response = requests.get(url, headers=HEADERS, timeout=30)
-        if response.status_code != 200: return []
-        return response.json().get('products', [])
-    except Exception as e:
-        print(f"[錯誤] {e}"); return []
+_source_session = None
+_source_session_lock = threading.Lock()
+
+def source_session():
+    """jp.bape.com 共用連線池（keep-alive + 429/5xx 自動重試）"""
+    global _source_session
+    with _source_session_lock:
+        if _source_session is None:
+            session = requests.Session()
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+            session.headers.update(HEADERS)
+            _source_session = session
+        return _source_session
+
+
+SOURCE_PAGE_RETRIES = 2  # session 自動重試之外，整頁再重抓的次數
+
+
+def fetch_products_json(page=1, limit=PRODUCTS_PAGE_SIZE):
+    """回傳該頁商品；空頁回傳 []，請求失敗（重試用盡）回傳 None（不可當成最後一頁）"""
+    url = f"{SOURCE_URL}/collections/all/products.json?page={page}&limit={limit}"
+    for attempt in range(SOURCE_PAGE_RETRIES + 1):
+        try:
+            response = source_session().get(url, timeout=30)
+            if response.status_code == 200: return response.json().get('products', [])
+            error = f'HTTP {response.status_code}'
+        except Exception as e: error = str(e)
+        print(f"[錯誤] 第 {page} 頁第 {attempt + 1} 次失敗: {error}")
+        if attempt < SOURCE_PAGE_RETRIES: time.sleep(2 * (attempt + 1))
+    return None
 
 
 def get_product_category(product):
@@ -215,38 +509,90 @@ def get_product_category(product):
 
 
 def fetch_all_products_by_category():
+    """
+    一次並行抓 PAGE_WINDOW 頁，依頁碼順序處理；遇到空頁或不足一頁就停止
+    抓取失敗的頁不當成結尾，記錄頁碼後繼續；整個 window 都失敗則停止
+    回傳 (分類商品, 失敗的頁碼)；有失敗頁時列表不完整，呼叫端不可據此刪除商品
+    """
     all_products = {'mens': [], 'womens': [], 'kids': []}
-    page = 1; seen_handles = set()
-    while True:
-        products = fetch_products_json(page)
-        if not products: break
-        for p in products:
-            handle = p.get('handle', '')
-            if handle in seen_handles: continue
-            seen_handles.add(handle)
-            if not any(v.get('available', False) for v in p.get('variants', [])): continue
-            all_products[get_product_category(p)].append(p)
-        if len(products) < 50: break
-        page += 1; time.sleep(0.5)
+    page = 1; seen_handles = set(); page_size = 0; done = False; failed_pages = []
+    with ThreadPoolExecutor(max_workers=PAGE_WINDOW) as pool:
+        while not done:
+            window = list(pool.map(fetch_products_json, range(page, page + PAGE_WINDOW)))
+            if all(products is None for products in window):
+                failed_pages += range(page, page + PAGE_WINDOW); break
+            # 以實際回傳的最大筆數當頁大小（商店若不接受 limit=250 也能正確判斷最後一頁）
+            page_size = max([page_size] + [len(products) for products in window if products is not None])
+            for offset, products in enumerate(window):
+                if products is None: failed_pages.append(page + offset); continue
+                if not products: done = True; break
+                for p in products:
+                    handle = p.get('handle', '')
+                    if handle in seen_handles: continue
+                    seen_handles.add(handle)
+                    if not any(v.get('available', False) for v in p.get('variants', [])): continue
+                    all_products[get_product_category(p)].append(p)
+                if len(products) < page_size: done = True; break
+            page += PAGE_WINDOW
     print(f"[爬取] 分類結果: 男裝 {len(all_products['mens'])}, 女裝 {len(all_products['womens'])}, 童裝 {len(all_products['kids'])}")
-    return all_products
+    if failed_pages: print(f"[⚠️ 爬取] 第 {failed_pages} 頁抓取失敗，列表不完整")
+    return all_products, failed_pages
+
+
+# 尺寸表快取：handle → {'table', 'etag', 'last_modified', 'checked_at'}
+# SIZE_TABLE_FRESH 秒內直接用快取；之後帶 If-None-Match / If-Modified-Since 重新驗證（304 不需重新解析）
+SIZE_TABLE_FRESH = int(os.environ.get('BAPE_SIZE_TABLE_FRESH', str(6 * 3600)))
+SIZE_TABLE_WORKERS = int(os.environ.get('BAPE_SIZE_TABLE_WORKERS', '8'))
+_size_table_cache = {}
+_size_table_lock = threading.Lock()
+# 只解析尺寸所在的 <dl>，不建整頁的 DOM
+_SIZE_DL_RE = re.compile(r'<dl[^>]*class="[^"]*s-product-detail__def-list-description[^"]*"[^>]*>.*?</dl>', re.S)
+_SIZE_DL_STRAINER = SoupStrainer('dl', attrs={'class': lambda c: bool(c) and 's-product-detail__def-list-description' in c})
+
+
+def parse_size_table(html):
+    m = _SIZE_DL_RE.search(html)
+    soup = BeautifulSoup(m.group(0) if m else html, 'html.parser', parse_only=_SIZE_DL_STRAINER)
+    def_list = soup.find('dl', class_='s-product-detail__def-list-description')
+    if not def_list: return None
+    size_dt = def_list.find('dt', string=re.compile(r'サイズ'))
+    if not size_dt: return None
+    size_dd = size_dt.find_next_sibling('dd')
+    if not size_dd: return None
+    table = size_dd.find('table')
+    if not table: return None
+    return '\n'.join([' | '.join([cell.get_text(strip=True) for cell in row.find_all(['th', 'td'])]) for row in table.find_all('tr')])
 
 
 def fetch_size_table(handle):
+    with _size_table_lock: cached = _size_table_cache.get(handle)
+    if cached and time.time() - cached['checked_at'] < SIZE_TABLE_FRESH: return cached['table']
+    headers = {'Accept': 'text/html'}
+    if cached and cached.get('etag'): headers['If-None-Match'] = cached['etag']
+    if cached and cached.get('last_modified'): headers['If-Modified-Since'] = cached['last_modified']
     try:
-        response = requests.get(f"{SOURCE_URL}/products/{handle}", headers={'User-Agent': HEADERS['User-Agent'], 'Accept': 'text/html'}, timeout=30)
-        if response.status_code != 200: return None
-        soup = BeautifulSoup(response.text, 'html.parser')
-        def_list = soup.find('dl', class_='s-product-detail__def-list-description')
-        if not def_list: return None
-        size_dt = def_list.find('dt', string=re.compile(r'サイズ'))
-        if not size_dt: return None
-        size_dd = size_dt.find_next_sibling('dd')
-        if not size_dd: return None
-        table = size_dd.find('table')
-        if not table: return None
-        return '\n'.join([' | '.join([cell.get_text(strip=True) for cell in row.find_all(['th', 'td'])]) for row in table.find_all('tr')])
-    except: return None
+        response = source_session().get(f"{SOURCE_URL}/products/{handle}", headers=headers, timeout=30)
+        if response.status_code == 304 and cached:
+            with _size_table_lock: cached['checked_at'] = time.time()
+            return cached['table']
+        if response.status_code != 200: return cached['table'] if cached else None
+        table = parse_size_table(response.text)
+        with _size_table_lock:
+            _size_table_cache[handle] = {'table': table, 'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'), 'checked_at': time.time()}
+        return table
+    except Exception:
+        return cached['table'] if cached else None
+
+
+def prefetch_size_tables(handles):
+    """並行抓取多個商品的尺寸表（結果進快取，之後 product_to_jsonl_entry 直接取用）"""
+    handles = list(dict.fromkeys(handles))
+    if not handles: return
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=SIZE_TABLE_WORKERS) as pool:
+        found = sum(1 for table in pool.map(fetch_size_table, handles) if table)
+    print(f"[尺寸表] {len(handles)} 個商品，{found} 個有尺寸表，耗時 {time.time() - start:.1f}s")
 
 
 # ========== JSONL 生成 ==========
@@ -295,7 +641,7 @@ def product_to_jsonl_entry(product, category_key, collection_id, existing_produc
     product_input = {
         "title": trans_title, "descriptionHtml": trans_desc, "vendor": "BAPE",
         "productType": cat_info['product_type'], "status": "ACTIVE", "handle": f"bape-{handle}",
-        "tags": cat_info['tags'],
+        "tags": cat_info['tags'], "category": PRODUCT_CATEGORY_ID,
         "seo": {"title": f"{trans_title} | BAPE 日本代購", "description": f"日本 A BATHING APE 官方正品代購。{trans_title}，台灣現貨或日本直送。GOYOUTATI 御用達日本伴手禮專門店。"},
         "metafields": [{"namespace": "custom", "key": "link", "value": source_url, "type": "url"}]}
     if existing_product_id: product_input["id"] = existing_product_id
@@ -306,6 +652,27 @@ def product_to_jsonl_entry(product, category_key, collection_id, existing_produc
     return {"productSet": product_input, "synchronous": True}
 
 
+JSONL_BUILD_WORKERS = int(os.environ.get('BAPE_JSONL_WORKERS', '6'))  # 同時建立的商品數（尺寸表 + ChatGPT 翻譯）
+
+
+def build_jsonl_file(items, submitter):
+    """items = [(product, category_key, collection_id)]；並行轉換，完成一筆就交給 submitter 寫入 JSONL chunk，回傳寫入筆數"""
+    written = 0; done = 0
+    with ThreadPoolExecutor(max_workers=JSONL_BUILD_WORKERS) as pool:
+        futures = {pool.submit(product_to_jsonl_entry, product, cat_key, collection_id): product for product, cat_key, collection_id in items}
+        for future in as_completed(futures):
+            title = futures[future].get('title', '')[:30]; done += 1
+            scrape_status['current_product'] = f"建立 JSONL [{done}/{len(items)}] {title}"
+            try: entry = future.result()
+            except Exception as e:
+                scrape_status['errors'].append({'error': f'轉換失敗 {title}: {str(e)}'}); continue
+            if not entry: continue  # 全部缺貨 / 低於 MIN_PRICE
+            submitter.add(entry, entry['productSet']['handle']); written += 1
+            scrape_status['products'].append({'title': entry['productSet']['title'], 'handle': entry['productSet']['handle'], 'variants': len(entry['productSet'].get('variants', []))})
+    print(f"[JSONL] {written}/{len(items)} 個新商品寫入 {submitter.chunks} 個 chunk")
+    return written
+
+
 # ========== Bulk Operations ==========
 
 def create_staged_upload():
@@ -322,38 +689,222 @@ def upload_jsonl_to_staged(staged_target, jsonl_path):
     return response.status_code in [200, 201, 204]
 
 
-def run_bulk_mutation(staged_upload_path):
+PRODUCT_SET_BULK_MUTATION = """mutation call($productSet: ProductSetInput!, $synchronous: Boolean!) { productSet(synchronous: $synchronous, input: $productSet) { product { id title } userErrors { field message } } }"""
+PRICE_BULK_MUTATION = """mutation call($productId: ID!, $variants: [ProductVariantsBulkInput!]!) { productVariantsBulkUpdate(productId: $productId, variants: $variants) { productVariants { id price } userErrors { field message } } }"""
+
+
+def run_bulk_mutation(staged_upload_path, mutation=PRODUCT_SET_BULK_MUTATION):
     query = """mutation bulkOperationRunMutation($mutation: String!, $stagedUploadPath: String!) { bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) { bulkOperation { id status } userErrors { field message } } }"""
-    mutation = """mutation call($productSet: ProductSetInput!, $synchronous: Boolean!) { productSet(synchronous: $synchronous, input: $productSet) { product { id title } userErrors { field message } } }"""
     return graphql_request(query, {"mutation": mutation, "stagedUploadPath": staged_upload_path})
 
 
+def run_bulk_jsonl_mutation(mutation, jsonl_path):
+    """上傳 JSONL → bulkOperationRunMutation，回傳 bulk operation id"""
+    staged = create_staged_upload()
+    if not staged: raise Exception('建立 Staged Upload 失敗')
+    if not upload_jsonl_to_staged(staged, jsonl_path): raise Exception('上傳 JSONL 失敗')
+    staged_path = next((p['value'] for p in staged['parameters'] if p['name'] == 'key'), '')
+    result = run_bulk_mutation(staged_path, mutation)
+    user_errors = result.get('data', {}).get('bulkOperationRunMutation', {}).get('userErrors', [])
+    if user_errors: raise Exception(f'Bulk Mutation 錯誤: {user_errors}')
+    operation_id = result.get('data', {}).get('bulkOperationRunMutation', {}).get('bulkOperation', {}).get('id', '')
+    scrape_status['bulk_operation_id'] = operation_id
+    return operation_id
+
+
+BULK_WAIT_TIMEOUT = int(os.environ.get('BAPE_BULK_WAIT_TIMEOUT', '1800'))  # 秒
+BULK_POLL_MAX_INTERVAL = 30
+
+
+def wait_for_bulk_operation(operation_id, timeout=BULK_WAIT_TIMEOUT, interval=1):
+    """
+    輪詢到 COMPLETED（FAILED / CANCELED 丟例外），回傳最後的狀態；逾時則回傳當下狀態
+    間隔自適應：objectCount 有進展時維持，沒進展就 ×1.5 退避（上限 BULK_POLL_MAX_INTERVAL）
+    """
+    status = {}; deadline = time.time() + timeout; last_count = -1; wait = interval
+    while True:
+        status = check_bulk_operation_status(operation_id or None)
+        scrape_status['bulk_status'] = status.get('status', '')
+        if status.get('status') == 'COMPLETED': break
+        elif status.get('status') in ['FAILED', 'CANCELED']: raise Exception(f'Bulk 失敗: {status.get("status")} {status.get("errorCode") or ""}')
+        count = int(status.get('objectCount') or 0)
+        scrape_status['bulk_object_count'] = count
+        wait = wait if count > last_count else min(wait * 1.5, BULK_POLL_MAX_INTERVAL); last_count = count
+        if time.time() + wait > deadline: break
+        time.sleep(wait)
+    return status
+
+
 def check_bulk_operation_status(operation_id=None):
     if operation_id:
-        query = """query($id: ID!) { node(id: $id) { ... on BulkOperation { id status errorCode objectCount url } } }"""
+        query = """query($id: ID!) { node(id: $id) { ... on BulkOperation { id status errorCode objectCount url partialDataUrl } } }"""
         return graphql_request(query, {"id": operation_id}).get('data', {}).get('node', {})
     else:
-        return graphql_request("""{ currentBulkOperation(type: MUTATION) { id status errorCode objectCount url } }""").get('data', {}).get('currentBulkOperation', {})
+        return graphql_request("""{ currentBulkOperation(type: MUTATION) { id status errorCode objectCount url partialDataUrl } }""").get('data', {}).get('currentBulkOperation', {})
+
+
+# Shopify 同一時間只能跑一個 bulk mutation → JSONL 切成多個 chunk，依序送出
+BULK_CHUNK_SIZE = int(os.environ.get('BAPE_BULK_CHUNK_SIZE', '200'))  # 每個 chunk 的行數
+BULK_CHUNK_RETRIES = 2
+
+
+class ChunkedBulkSubmitter:
+    """
+    add() 邊建立邊寫入輪替的 JSONL chunk（滿 BULK_CHUNK_SIZE 行就換檔）
+    背景執行緒在前一個 bulk operation 完成後立刻送出下一個 chunk，建立與上傳同時進行
+    每個 chunk 各自重試，只重送確定沒被處理到的行（productSet 沒帶 id，重送已成功的行會重複建立商品）；
+    operation 逾時仍在執行就不重送。close() 等全部送完，回傳 ({key: 結果}, [失敗的 key])
+    """
+
+    def __init__(self, mutation, field, prefix, chunk_size=BULK_CHUNK_SIZE):
+        self.mutation = mutation; self.field = field; self.prefix = prefix; self.chunk_size = chunk_size
+        self.succeeded = {}; self.failed = []; self.chunks = 0
+        self._file = None; self._keys = []; self._lines = []; self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True); self._thread.start()
+
+    def add(self, entry, key):
+        if self._file is None:
+            self.chunks += 1
+            self._path = f"{self.prefix}_part{self.chunks:03d}.jsonl"
+            self._file = open(self._path, 'w', encoding='utf-8')
+        line = json.dumps(entry, ensure_ascii=False)  # 保留序列化結果供重送（內容可能含 U+2028 等，不可用 splitlines 讀回）
+        self._file.write(line + '\n'); self._keys.append(key); self._lines.append(line)
+        if len(self._keys) >= self.chunk_size: self._rotate()
+
+    def _rotate(self):
+        if self._file is None: return
+        self._file.close(); self._queue.put((self._path, self._keys, self._lines))
+        self._file = None; self._keys = []; self._lines = []
+
+    def _wait(self, operation_id):
+        """等 operation 結束（FAILED / CANCELED 也回傳狀態）；逾時後再多等 300 秒，仍在執行回傳 None"""
+        for timeout in (BULK_WAIT_TIMEOUT, 300):
+            try: status = wait_for_bulk_operation(operation_id, timeout=timeout)
+            except Exception: status = check_bulk_operation_status(operation_id)
+            if status.get('status') in ('COMPLETED', 'FAILED', 'CANCELED'): return status
+        return None
+
+    def _read(self, status, keys):
+        """
+        依結果檔（FAILED / CANCELED 時讀 partialDataUrl）拆成 (成功, 失敗, 沒被處理到可重送的 key)
+        沒有結果檔又已寫入物件時無法判斷哪些行成功 → 全部視為失敗，不重送
+        """
+        url = status.get('url') or status.get('partialDataUrl')
+        if url:
+            succeeded, failed = read_bulk_mutation_results(url, self.field, keys)
+            done = set(succeeded) | set(failed)
+            return succeeded, failed, [k for k in keys if k not in done]
+        if status.get('status') == 'COMPLETED' or int(status.get('objectCount') or 0) > 0: return {}, list(keys), []
+        return {}, [], list(keys)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None: return
+            path, keys, lines = item; name = os.path.basename(path); lines = dict(zip(keys, lines))
+            pending = list(keys); error = None
+            for attempt in range(BULK_CHUNK_RETRIES + 1):
+                if attempt:
+                    time.sleep(5 * attempt)
+                    with open(path, 'w', encoding='utf-8') as f: f.writelines(lines[k] + '\n' for k in pending)  # 只重送沒被處理到的行
+                scrape_status['current_product'] = f"Bulk 上傳 {name}（{len(pending)} 筆）..."
+                try: operation_id = run_bulk_jsonl_mutation(self.mutation, path)
+                except Exception as e:
+                    # 還沒開始執行 → 可安全重送；可能是前一個 operation 還在跑，等它結束
+                    error = e; print(f"[Bulk] {name} 第 {attempt + 1} 次送出失敗: {e}")
+                    try: wait_for_bulk_operation(None, timeout=300)
+                    except Exception: pass
+                    continue
+                try:
+                    status = self._wait(operation_id)
+                    if status is None: raise Exception(f'{operation_id} 逾時仍在執行')
+                    succeeded, failed, pending = self._read(status, pending)
+                except Exception as e:
+                    # 已送出但無法確認結果 → 不重送以免重複建立
+                    error = e; break
+                self.succeeded.update(succeeded); self.failed += failed
+                print(f"[Bulk] {name}: {status.get('status')} 成功 {len(succeeded)}，失敗 {len(failed)}，待重送 {len(pending)}")
+                if not pending: break
+                error = Exception(f"Bulk {status.get('status')} {status.get('errorCode') or ''}")
+            if pending:
+                self.failed += pending; scrape_status['errors'].append({'error': f'{name} 上傳失敗（{len(pending)} 筆）: {error}'})
+
+    def close(self):
+        self._rotate(); self._queue.put(None); self._thread.join()
+        return self.succeeded, self.failed
+
+
+# ========== Shopify 現況快照（bulkOperationRunQuery）==========
+
+SNAPSHOT_QUERY = """{ products(query: "vendor:BAPE") { edges { node { id title handle status category { id } resourcePublicationsCount { count } variants { edges { node { id title sku price selectedOptions { name value } } } } } } } }"""
+
+
+def run_bulk_query(query):
+    mutation = """mutation bulkOperationRunQuery($query: String!) { bulkOperationRunQuery(query: $query) { bulkOperation { id status } userErrors { field message } } }"""
+    result = graphql_request(mutation, {"query": query})
+    user_errors = result.get('data', {}).get('bulkOperationRunQuery', {}).get('userErrors', [])
+    if user_errors: raise Exception(f'Bulk Query 錯誤: {user_errors}')
+    return result.get('data', {}).get('bulkOperationRunQuery', {}).get('bulkOperation', {}).get('id', '')
+
+
+def iter_bulk_results(url):
+    """逐行讀取 bulk operation 結果 JSONL（不整份載入記憶體）"""
+    with requests.get(url, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line: yield json.loads(line)
+
+
+def read_bulk_mutation_results(url, field, keys):
+    """
+    逐行讀 bulk mutation 結果，依 __lineNumber 對回輸入的 keys（例如 handle）
+    field: mutation 名稱（productSet / productDelete ...）
+    回傳 ({key: 該行 mutation 結果}, [失敗的 key])；失敗原因寫入 scrape_status['errors']
+    """
+    succeeded = {}; failed = []
+    for row in iter_bulk_results(url):
+        line = row.get('__lineNumber')
+        key = keys[line] if isinstance(line, int) and line < len(keys) else line
+        payload = (row.get('data') or {}).get(field) or {}
+        errors = payload.get('userErrors') or row.get('errors')
+        if errors or not payload:
+            failed.append(key)
+            scrape_status['errors'].append({'handle': key, 'error': '; '.join(e.get('message', str(e)) for e in errors) if errors else '沒有結果'})
+        else:
+            succeeded[key] = payload
+    return succeeded, failed
+
+
+def load_bape_snapshot():
+    """
+    一個 bulk query 取得所有 BAPE 商品 + variants（價格、選項）+ 狀態
+    回傳 {handle: {'id', 'title', 'handle', 'status', 'variants': [get_product_variants_graphql 格式]}}
+    """
+    operation_id = run_bulk_query(SNAPSHOT_QUERY)
+    status = wait_for_bulk_operation(operation_id, timeout=600)
+    if status.get('status') != 'COMPLETED': raise Exception(f"快照逾時: {status.get('status')}")
+    snapshot = {}; by_id = {}
+    if not status.get('url'): return snapshot  # 沒有任何商品時不會有結果檔
+    for row in iter_bulk_results(status['url']):
+        if '__parentId' in row:
+            parent = by_id.get(row['__parentId'])
+            if parent is not None:
+                parent['variants'].append({'id': row['id'], 'title': row.get('title', ''), 'sku': row.get('sku', ''), 'price': row.get('price'),
+                    'options': {opt['name']: opt['value'] for opt in row.get('selectedOptions', [])}})
+        else:
+            product = {'id': row['id'], 'title': row.get('title', ''), 'handle': row.get('handle', ''), 'status': row.get('status', ''), 'variants': [],
+                'category': (row.get('category') or {}).get('id'), 'publications': (row.get('resourcePublicationsCount') or {}).get('count', 0)}
+            by_id[row['id']] = product; snapshot[product['handle']] = product
+    print(f"[快照] {len(snapshot)} 個商品，{sum(len(p['variants']) for p in snapshot.values())} 個 variants")
+    return snapshot
 
 
 # ========== 商品管理 ==========
 
 def fetch_bape_product_ids():
-    all_products = []; cursor = None
-    while True:
-        if cursor:
-            query = """query($cursor: String) { products(first: 250, after: $cursor, query: "vendor:BAPE") { edges { node { id title handle status } cursor } pageInfo { hasNextPage } } }"""
-            result = graphql_request(query, {"cursor": cursor})
-        else:
-            result = graphql_request("""{ products(first: 250, query: "vendor:BAPE") { edges { node { id title handle status } cursor } pageInfo { hasNextPage } } }""")
-        products = result.get('data', {}).get('products', {})
-        for edge in products.get('edges', []):
-            node = edge['node']
-            all_products.append({'id': node['id'], 'title': node['title'], 'handle': node['handle'], 'status': node.get('status', '')})
-            cursor = edge['cursor']
-        if not products.get('pageInfo', {}).get('hasNextPage', False): break
-        time.sleep(0.5)
-    return all_products
+    query = """query($first: Int!, $cursor: String) { products(first: $first, after: $cursor, query: "vendor:BAPE") { edges { node { id title handle status } } pageInfo { hasNextPage endCursor } } }"""
+    return [{'id': node['id'], 'title': node['title'], 'handle': node['handle'], 'status': node.get('status', '')}
+        for node in paginate_graphql(query, ('products',), page_size=250)]
 
 
 def set_product_active(product_id):
@@ -362,22 +913,60 @@ def set_product_active(product_id):
     return not result.get('data', {}).get('productUpdate', {}).get('userErrors', [])
 
 
-def update_existing_product_price(product_id, source_variants):
-    query = f"""{{ product(id: "{product_id}") {{ variants(first: 100) {{ edges {{ node {{ id sku }} }} }} }} }}"""
-    result = graphql_request(query)
-    shopify_variants = result.get('data', {}).get('product', {}).get('variants', {}).get('edges', [])
-    if not shopify_variants: return 0
+# 需改價的商品數達到此門檻 → 改用一個 bulk operation 處理
+PRICE_BULK_THRESHOLD = int(os.environ.get('BAPE_PRICE_BULK_THRESHOLD', '50'))
+
+
+def plan_price_update(shopify_variants, source_variants):
+    """以有貨 variant 的最低成本計算售價，回傳價格不一致的 [{'id', 'price'}]（已一致則為空）"""
     costs = [float(sv.get('price', 0)) for sv in source_variants if sv.get('available', False) and float(sv.get('price', 0)) >= MIN_PRICE]
-    if not costs: return 0
-    min_cost = min(costs)
+    if not costs or not shopify_variants: return []
     weight = float(source_variants[0].get('grams', 0)) / 1000 if source_variants[0].get('grams') else DEFAULT_WEIGHT
-    selling_price = calculate_selling_price(min_cost, weight)
-    updated = 0
-    for v_edge in shopify_variants:
-        mutation = """mutation productVariantUpdate($input: ProductVariantInput!) { productVariantUpdate(input: $input) { productVariant { id } userErrors { field message } } }"""
-        graphql_request(mutation, {"input": {"id": v_edge['node']['id'], "price": str(selling_price)}})
-        updated += 1; time.sleep(0.1)
-    return updated
+    selling_price = calculate_selling_price(min(costs), weight)
+    def differs(price):
+        try: return float(price) != float(selling_price)
+        except (TypeError, ValueError): return True
+    return [{'id': v['id'], 'price': str(selling_price)} for v in shopify_variants if differs(v.get('price'))]
+
+
+def update_variant_prices(product_id, variants):
+    """一個 productVariantsBulkUpdate 改完同商品所有 variant 的價格"""
+    mutation = """mutation productVariantsBulkUpdate($productId: ID!, $variants: [ProductVariantsBulkInput!]!) { productVariantsBulkUpdate(productId: $productId, variants: $variants) { productVariants { id price } userErrors { field message } } }"""
+    result = graphql_request(mutation, {"productId": product_id, "variants": variants})
+    errors = result.get('data', {}).get('productVariantsBulkUpdate', {}).get('userErrors', [])
+    if errors:
+        print(f"[改價] {product_id} 失敗: {errors}"); return 0
+    return len(variants)
+
+
+def bulk_update_prices(price_updates):
+    """price_updates = {product_id: [{'id', 'price'}]}；寫成 JSONL 由一個 bulk operation 改價，回傳成功商品數"""
+    jsonl_path = os.path.join(JSONL_DIR, f"bape_prices_{int(time.time())}.jsonl")
+    product_ids = list(price_updates)
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        for product_id in product_ids:
+            f.write(json.dumps({"productId": product_id, "variants": price_updates[product_id]}) + '\n')
+    status = wait_for_bulk_operation(run_bulk_jsonl_mutation(PRICE_BULK_MUTATION, jsonl_path))
+    if status.get('status') != 'COMPLETED': raise Exception(f"Bulk 改價逾時: {status.get('status')}")
+    if not status.get('url'): return 0
+    succeeded, _ = read_bulk_mutation_results(status['url'], 'productVariantsBulkUpdate', product_ids)
+    return len(succeeded)
+
+
+def apply_price_updates(price_updates):
+    """少量直接逐商品更新；達 PRICE_BULK_THRESHOLD 用 bulk operation（失敗則退回逐商品）"""
+    if len(price_updates) >= PRICE_BULK_THRESHOLD:
+        try:
+            return bulk_update_prices(price_updates)
+        except Exception as e:
+            print(f"[改價] Bulk 失敗，改為逐商品更新: {e}")
+    return sum(1 for product_id, variants in price_updates.items() if update_variant_prices(product_id, variants))
+
+
+def update_existing_product_price(product_id, source_variants, shopify_variants=None):
+    if shopify_variants is None: shopify_variants = get_product_variants_graphql(product_id)
+    changes = plan_price_update(shopify_variants, source_variants)
+    return update_variant_prices(product_id, changes) if changes else 0
 
 
 def delete_product(product_id):
@@ -386,66 +975,177 @@ def delete_product(product_id):
     return not result.get('data', {}).get('productDelete', {}).get('userErrors', [])
 
 
+DELETE_BATCH_SIZE = 10  # 每個 request 合併的 productDelete 數（alias）
+DELETE_WORKERS = int(os.environ.get('BAPE_DELETE_WORKERS', '3'))  # 同時送出的 alias 批次數
+# 要刪的商品數達到此門檻 → 改用一個 bulk operation 處理
+DELETE_BULK_THRESHOLD = int(os.environ.get('BAPE_DELETE_BULK_THRESHOLD', '50'))
+DELETE_BULK_MUTATION = """mutation call($input: ProductDeleteInput!) { productDelete(input: $input) { deletedProductId userErrors { field message } } }"""
+
+
+def aliased_mutation(field, arg_types, items, selection):
+    """
+    同一個 mutation 對多筆資料以 alias 合併成一個 request
+    arg_types: {'id': 'ID!', ...}；items: [{'id': ..., ...}]；回傳與 items 對應的結果 list（失敗為 {'userErrors': ...}）
+    """
+    params = ', '.join(f"${name}{j}: {t}" for j in range(len(items)) for name, t in arg_types.items())
+    fields = ' '.join(f"m{j}: {field}({', '.join(f'{name}: ${name}{j}' for name in arg_types)}) {{ {selection} userErrors {{ field message }} }}" for j in range(len(items)))
+    result = graphql_request(f"mutation({params}) {{ {fields} }}", {f"{name}{j}": item[name] for j, item in enumerate(items) for name in arg_types})
+    data = result.get('data') or {}
+    return [data.get(f"m{j}") or {'userErrors': result.get('errors') or ['沒有結果']} for j in range(len(items))]
+
+
+def _delete_batch(batch):
+    """一批 productDelete 以 alias 合併成一個 request，回傳成功刪除的 id list"""
+    deleted = []
+    for pid, r in zip(batch, aliased_mutation('productDelete', {'input': 'ProductDeleteInput!'}, [{'input': {'id': pid}} for pid in batch], 'deletedProductId')):
+        if r.get('deletedProductId'): deleted.append(pid)
+        else: scrape_status['errors'].append({'error': f"刪除 {pid} 失敗: {r.get('userErrors')}"})
+    return deleted
+
+
+def delete_products(product_ids, batch_size=DELETE_BATCH_SIZE):
+    """alias 批次並行送出（DELETE_WORKERS 個同時），進度寫入 scrape_status，回傳成功刪除的 id list"""
+    batches = [product_ids[i:i + batch_size] for i in range(0, len(product_ids), batch_size)]
+    deleted = []
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as pool:
+        futures = {pool.submit(_delete_batch, batch): len(batch) for batch in batches}
+        for future in as_completed(futures):
+            try: deleted += future.result()
+            except Exception as e: scrape_status['errors'].append({'error': f'刪除失敗: {e}'})
+            scrape_status['progress'] = scrape_status.get('progress', 0) + futures[future]
+            scrape_status['current_product'] = f"刪除中 [{scrape_status['progress']}/{scrape_status.get('total') or len(product_ids)}]"
+    return deleted
+
+
+def bulk_delete_products(product_ids):
+    """productDelete 寫成 JSONL 由一個 bulk operation 刪除，從結果檔回傳成功刪除的 id list"""
+    jsonl_path = os.path.join(JSONL_DIR, f"bape_delete_{int(time.time())}.jsonl")
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        for pid in product_ids: f.write(json.dumps({"input": {"id": pid}}) + '\n')
+    status = wait_for_bulk_operation(run_bulk_jsonl_mutation(DELETE_BULK_MUTATION, jsonl_path))
+    if status.get('status') != 'COMPLETED': raise Exception(f"Bulk 刪除逾時: {status.get('status')}")
+    if not status.get('url'): return []
+    succeeded, _ = read_bulk_mutation_results(status['url'], 'productDelete', product_ids)
+    return [pid for pid, r in succeeded.items() if r.get('deletedProductId')]
+
+
+def run_deletions(product_ids):
+    """
+    刪除引擎：少量 → 並行 alias 批次；達 DELETE_BULK_THRESHOLD → bulk operation（失敗則退回 alias 批次）
+    scrape_status progress/total 為刪除進度，回傳成功刪除數
+    """
+    product_ids = list(product_ids)
+    scrape_status['progress'] = 0; scrape_status['total'] = len(product_ids)
+    if not product_ids: return 0
+    if len(product_ids) >= DELETE_BULK_THRESHOLD:
+        try:
+            scrape_status['current_product'] = f"Bulk 刪除 {len(product_ids)} 個商品..."
+            deleted = bulk_delete_products(product_ids)
+            scrape_status['progress'] = len(product_ids)
+            done = set(deleted); remaining = [pid for pid in product_ids if pid not in done]
+            if not remaining: return len(deleted)
+            print(f"[刪除] Bulk 完成 {len(deleted)} 個，剩 {len(remaining)} 個改用 alias 批次")
+            scrape_status['progress'] = len(deleted)
+            return len(deleted) + len(delete_products(remaining))
+        except Exception as e:
+            print(f"[刪除] Bulk 失敗，改為 alias 批次: {e}")
+            scrape_status['progress'] = 0
+    return len(delete_products(product_ids))
+
+
 def delete_all_bape_products():
-    global scrape_status
     products = fetch_bape_product_ids()
     total = len(products)
     if total == 0: return {'success': True, 'deleted': 0, 'message': '沒有 BAPE 商品'}
-    deleted = 0; failed = 0
-    for i, product in enumerate(products):
-        scrape_status['current_product'] = f"刪除中 [{i+1}/{total}] {product.get('title', '')[:30]}"
-        scrape_status['progress'] = i + 1
-        if delete_product(product['id']): deleted += 1
-        else: failed += 1
-        time.sleep(0.2)
-    return {'success': True, 'deleted': deleted, 'failed': failed, 'total': total}
-
-
-def batch_publish_bape_products():
-    products = fetch_bape_product_ids()
-    if not products: return {'success': 0, 'failed': 0}
-    publications = get_all_publications()
-    if not publications: return {'success': 0, 'failed': 0}
-    publication_inputs = [{"publicationId": pub['id']} for pub in publications]
-    results = {'total': len(products), 'success': 0, 'failed': 0}
-    pub_mutation = """mutation publishablePublish($id: ID!, $input: [PublicationInput!]!) { publishablePublish(id: $id, input: $input) { userErrors { field message } } }"""
-    cat_mutation = """mutation productUpdate($input: ProductInput!) { productUpdate(input: $input) { product { id } userErrors { field message } } }"""
-    for product in products:
-        result = graphql_request(pub_mutation, {"id": product['id'], "input": publication_inputs})
-        if result.get('data', {}).get('publishablePublish', {}).get('userErrors', []): results['failed'] += 1
-        else: results['success'] += 1
-        graphql_request(cat_mutation, {"input": {"id": product['id'], "productCategory": {"productTaxonomyNodeId": "gid://shopify/ProductTaxonomyNode/1"}}})
-        time.sleep(0.1)
-    return results
+    deleted = run_deletions(p['id'] for p in products)
+    return {'success': True, 'deleted': deleted, 'failed': total - deleted, 'total': total}
+
+
+PUBLISH_BATCH_SIZE = 10  # 每個 request 合併的 publishablePublish / productUpdate 數（alias）
+
+
+class PublishQueue:
+    """記錄真正需要發布 / 設分類的商品，flush() 時以 alias 批次送出"""
+
+    def __init__(self):
+        self.to_publish = []; self.to_categorize = []
+
+    def add(self, product_id, publish=True, categorize=False):
+        if publish and product_id not in self.to_publish: self.to_publish.append(product_id)
+        if categorize and product_id not in self.to_categorize: self.to_categorize.append(product_id)
+
+    def add_from_snapshot(self, product, publication_count):
+        """依快照判斷：發布頻道數不足 → 發布；沒有分類 → 設分類"""
+        self.add(product['id'], publish=product.get('publications', 0) < publication_count, categorize=not product.get('category'))
+
+    def __len__(self):
+        return len(set(self.to_publish) | set(self.to_categorize))
+
+    def flush(self):
+        results = {'total': len(self), 'success': 0, 'failed': 0, 'categorized': 0}
+        if self.to_publish:
+            publication_inputs = [{"publicationId": pid} for pid in get_all_publication_ids()]
+            if not publication_inputs:
+                # 取不到銷售頻道 → 只跳過發布，分類照常處理
+                results['failed'] += len(self.to_publish); scrape_status['errors'].append({'error': f'取不到銷售頻道，{len(self.to_publish)} 個商品未發布'})
+                self.to_publish = []
+            for i in range(0, len(self.to_publish), PUBLISH_BATCH_SIZE):
+                batch = self.to_publish[i:i + PUBLISH_BATCH_SIZE]
+                scrape_status['current_product'] = f"發布中 [{i + len(batch)}/{len(self.to_publish)}]"
+                for pid, r in zip(batch, aliased_mutation('publishablePublish', {'id': 'ID!', 'input': '[PublicationInput!]!'},
+                        [{'id': pid, 'input': publication_inputs} for pid in batch], '')):
+                    if r.get('userErrors'): results['failed'] += 1; scrape_status['errors'].append({'error': f"發布 {pid} 失敗: {r['userErrors']}"})
+                    else: results['success'] += 1
+        for i in range(0, len(self.to_categorize), PUBLISH_BATCH_SIZE):
+            batch = self.to_categorize[i:i + PUBLISH_BATCH_SIZE]
+            for r in aliased_mutation('productUpdate', {'input': 'ProductInput!'}, [{'input': {'id': pid, 'category': PRODUCT_CATEGORY_ID}} for pid in batch], 'product { id }'):
+                if not r.get('userErrors'): results['categorized'] += 1
+        self.to_publish = []; self.to_categorize = []
+        return results
+
+
+def batch_publish_bape_products(product_ids=None):
+    """
+    product_ids 指定 → 只發布這些（新建商品，分類已在 productSet 設好）
+    None → 依快照只處理尚未發布到所有頻道 / 沒有分類的 BAPE 商品
+    """
+    publish_queue = PublishQueue()
+    if product_ids is not None:
+        for pid in product_ids: publish_queue.add(pid)
+    else:
+        publication_count = len(get_all_publication_ids())
+        for product in load_bape_snapshot().values(): publish_queue.add_from_snapshot(product, publication_count)
+    if not len(publish_queue): return {'total': 0, 'success': 0, 'failed': 0, 'categorized': 0}
+    print(f"[發布] 發布 {len(publish_queue.to_publish)} 個，設分類 {len(publish_queue.to_categorize)} 個")
+    return publish_queue.flush()
 
 
 # ========== v2.3: Variant 級別庫存同步 ==========
 
 def get_product_variants_graphql(product_id):
     """取得商品所有 variants（GraphQL）"""
-    query = f"""{{ product(id: "{product_id}") {{ variants(first: 100) {{ edges {{ node {{ id title sku selectedOptions {{ name value }} }} }} }} }} }}"""
-    result = graphql_request(query)
+    query = """query($id: ID!, $first: Int!, $cursor: String) { product(id: $id) { variants(first: $first, after: $cursor) { edges { node { id title sku price selectedOptions { name value } } } pageInfo { hasNextPage endCursor } } } }"""
     variants = []
-    for edge in result.get('data', {}).get('product', {}).get('variants', {}).get('edges', []):
-        node = edge['node']
+    for node in paginate_graphql(query, ('product', 'variants'), {'id': product_id}, page_size=100):
         variants.append({
             'id': node['id'],
             'title': node.get('title', ''),
             'sku': node.get('sku', ''),
+            'price': node.get('price'),
             'options': {opt['name']: opt['value'] for opt in node.get('selectedOptions', [])}
         })
     return variants
 
 
-def delete_variant_graphql(product_id, variant_id):
-    """刪除單一 variant"""
+def delete_variants_graphql(product_id, variant_ids):
+    """一個 productVariantsBulkDelete 刪除同商品的多個 variant"""
     mutation = """mutation productVariantsBulkDelete($productId: ID!, $variantsIds: [ID!]!) {
         productVariantsBulkDelete(productId: $productId, variantsIds: $variantsIds) {
             product { id title }
             userErrors { field message }
         }
     }"""
-    result = graphql_request(mutation, {"productId": product_id, "variantsIds": [variant_id]})
+    result = graphql_request(mutation, {"productId": product_id, "variantsIds": variant_ids})
     errors = result.get('data', {}).get('productVariantsBulkDelete', {}).get('userErrors', [])
     if errors:
         print(f"[v2.3] 刪除 variant 失敗: {errors}")
@@ -453,16 +1153,20 @@ def delete_variant_graphql(product_id, variant_id):
     return True
 
 
-def sync_bape_variants(product_id, product_title, source_variants, options):
+def sync_bape_variants(product_id, product_title, source_variants, options, shopify_variants=None, dry_run=False):
     """
     v2.3: 比對 Shopify variants vs BAPE source variants，刪除缺貨的
     source_variants: BAPE API 回傳的 variants list（含 available 欄位）
     options: BAPE API 回傳的 options list
-    回傳: {'kept': N, 'deleted': N, 'product_deleted': bool}
+    shopify_variants: 已查好的 get_product_variants_graphql 結果（None 則自行查詢）
+    dry_run: 只回報，不刪除
+    回傳: {'kept': N, 'deleted': N, 'deleted_ids': [...], 'deleted_titles': [...], 'delete_product': bool}
+    全部缺貨時不在這裡刪商品，回傳 delete_product=True，由呼叫端交給 delete_products 批次刪除
     """
-    shopify_variants = get_product_variants_graphql(product_id)
+    if shopify_variants is None: shopify_variants = get_product_variants_graphql(product_id)
+    result = {'kept': len(shopify_variants), 'deleted': 0, 'deleted_ids': [], 'deleted_titles': [], 'delete_product': False}
     if not shopify_variants:
-        return {'kept': 0, 'deleted': 0, 'product_deleted': False}
+        return result
 
     # 建立 source 有貨 variant 的 key set
     # BAPE variant title 格式: "option1 / option2" 或 "Default Title"
@@ -480,25 +1184,25 @@ def sync_bape_variants(product_id, product_title, source_variants, options):
         key = ' / '.join(parts) if parts else 'Default Title'
         available_keys.add(key)
 
-    kept = 0; deleted = 0
-    for sv in shopify_variants:
-        variant_key = sv['title']
-        if variant_key in available_keys:
-            kept += 1
-        else:
-            # 只剩最後一個 variant → 刪整個商品
-            if len(shopify_variants) - deleted <= 1:
-                print(f"[v2.3] 🗑 商品所有 variant 都缺貨，刪除整個商品: {product_title[:30]}")
-                delete_product(product_id)
-                return {'kept': 0, 'deleted': deleted + 1, 'product_deleted': True}
-            print(f"[v2.3] 🗑 刪除缺貨 variant: {product_title[:25]} - {variant_key}")
-            if delete_variant_graphql(product_id, sv['id']):
-                deleted += 1
-            time.sleep(0.2)
-
-    if deleted > 0:
-        print(f"[v2.3] {product_title[:25]}: 保留 {kept}, 刪除 {deleted}")
-    return {'kept': kept, 'deleted': deleted, 'product_deleted': False}
+    to_delete = [sv for sv in shopify_variants if sv['title'] not in available_keys]
+    if not to_delete:
+        return result
+    titles = [sv['title'] for sv in to_delete]
+    result['kept'] = len(shopify_variants) - len(to_delete)
+
+    # 全部缺貨 → 整個商品交給批次刪除
+    if result['kept'] == 0:
+        print(f"[v2.3] 🗑 商品所有 variant 都缺貨，排入刪除: {product_title[:30]}")
+        result.update(deleted=len(to_delete), deleted_titles=titles, delete_product=True)
+        return result
+
+    print(f"[v2.3] 🗑 {'(dry run) ' if dry_run else ''}刪除缺貨 variant: {product_title[:25]} - {', '.join(titles)}")
+    if dry_run or delete_variants_graphql(product_id, [sv['id'] for sv in to_delete]):
+        result.update(deleted=len(to_delete), deleted_ids=[sv['id'] for sv in to_delete], deleted_titles=titles)
+        print(f"[v2.3] {product_title[:25]}: 保留 {result['kept']}, 刪除 {len(to_delete)}")
+    else:
+        result['kept'] = len(shopify_variants)
+    return result
 
 
 # ========== 主流程 ==========
@@ -506,13 +1210,13 @@ def sync_bape_variants(product_id, product_title, source_variants, options):
 def run_test_single(category='mens'):
     global scrape_status
     scrape_status = {"running": True, "phase": "testing", "progress": 0, "total": 1, "current_product": "測試單品...",
-        "products": [], "errors": [], "jsonl_file": "", "bulk_operation_id": "", "bulk_status": "", "deleted": 0, "variants_deleted": 0}
+        "products": RingLog(), "errors": RingLog(), "jsonl_file": "", "bulk_operation_id": "", "bulk_status": "", "deleted": 0, "variants_deleted": 0}
     try:
         cat_info = CATEGORIES[category]
         collection_id = get_or_create_collection(cat_info['collection'])
         if not collection_id:
             scrape_status['errors'].append({'error': '無法建立 Collection'}); return
-        all_by_category = fetch_all_products_by_category()
+        all_by_category, _ = fetch_all_products_by_category()
         products = all_by_category.get(category, [])
         if not products:
             scrape_status['errors'].append({'error': f'沒有找到 {cat_info["name"]} 的商品'}); return
@@ -537,10 +1241,7 @@ def run_test_single(category='mens'):
             scrape_status['errors'].append({'error': '; '.join([e.get('message', str(e)) for e in user_errors])})
         else:
             product = product_set.get('product', {})
-            publications = get_all_publications()
-            if publications:
-                pub_mutation = """mutation publishablePublish($id: ID!, $input: [PublicationInput!]!) { publishablePublish(id: $id, input: $input) { userErrors { field message } } }"""
-                graphql_request(pub_mutation, {"id": product['id'], "input": [{"publicationId": pub['id']} for pub in publications]})
+            batch_publish_bape_products([product['id']])
             scrape_status['current_product'] = f"✅ 成功！{product.get('title', '')}"
         scrape_status['progress'] = 1
     except Exception as e:
@@ -549,36 +1250,54 @@ def run_test_single(category='mens'):
         scrape_status['running'] = False
 
 
-def run_full_sync(category='all'):
-    """v2.3 智慧同步：新商品→Bulk Upload / 已存在→更新價格+同步variant / 下架/缺貨→刪除"""
+def run_full_sync(category='all', dry_run=False):
+    """
+    v2.3 智慧同步：新商品→Bulk Upload / 已存在→更新價格+同步variant / 下架/缺貨→刪除
+    dry_run: 不做任何 Shopify 寫入，預計的變更逐筆記在 scrape_status['products']（action 欄位）
+    """
     global scrape_status
-    print(f"[SYNC] ========== 開始智慧同步 v2.3 ==========")
+    print(f"[SYNC] ========== 開始智慧同步 v2.3{' (dry run)' if dry_run else ''} ==========")
     scrape_status = {"running": True, "phase": "cron_sync", "progress": 0, "total": 0,
-        "current_product": "開始智慧同步...", "products": [], "errors": [],
-        "jsonl_file": "", "bulk_operation_id": "", "bulk_status": "", "deleted": 0, "variants_deleted": 0}
+        "current_product": "開始智慧同步...", "products": RingLog(), "errors": RingLog(),
+        "jsonl_file": "", "bulk_operation_id": "", "bulk_status": "", "deleted": 0, "variants_deleted": 0, "dry_run": dry_run}
+    def plan(action, handle, **extra): scrape_status['products'].append({'action': action, 'handle': handle, **extra})
     try:
         categories_to_scrape = ['mens', 'womens', 'kids'] if category == 'all' else [category] if category in CATEGORIES else []
         if not categories_to_scrape: raise Exception(f'未知分類: {category}')
 
         # 1. 取得 Shopify 現有商品
         scrape_status['current_product'] = '取得 Shopify 現有商品...'
-        existing_products = fetch_bape_product_ids()
-        existing_handles = {p['handle']: p for p in existing_products}
+        try:
+            existing_handles = load_bape_snapshot()
+        except Exception as e:
+            # 快照失敗 → 舊方式（逐頁列商品，variants 之後逐商品查）
+            print(f"[SYNC] ⚠️ 快照失敗，改用逐頁查詢: {e}")
+            existing_handles = {p['handle']: p for p in fetch_bape_product_ids()}
         print(f"[SYNC] Shopify 現有 {len(existing_handles)} 個 BAPE 商品")
 
         # 2. 爬取 BAPE 所有商品
         scrape_status['current_product'] = '爬取 BAPE 商品...'
-        all_by_category = fetch_all_products_by_category()
-
-        # 3. 比對 + 處理
-        new_entries = []; scraped_handles = set()
+        all_by_category, failed_pages = fetch_all_products_by_category()
+
+        # 3. 比對 + 處理（新商品的尺寸表先並行抓好）
+        if not dry_run:
+            scrape_status['current_product'] = '抓取新商品尺寸表...'
+            prefetch_size_tables(p.get('handle', '') for cat_key in categories_to_scrape for p in all_by_category.get(cat_key, [])
+                if f"bape-{p.get('handle', '')}" not in existing_handles)
+        new_items = []; scraped_handles = set(); price_updates = {}; products_to_delete = {}
+        publish_queue = PublishQueue(); publication_count = 0 if dry_run else len(get_all_publication_ids())
         updated_count = 0; price_updated_count = 0; total_variants_deleted = 0
 
         for cat_key in categories_to_scrape:
             cat_info = CATEGORIES[cat_key]
-            collection_id = get_or_create_collection(cat_info['collection'])
-            if not collection_id: continue
+            collection_id = get_or_create_collection(cat_info['collection'], create=not dry_run)
             products = all_by_category.get(cat_key, [])
+            if not collection_id:
+                if dry_run:
+                    # collection 還不存在 → 只記錄會建立，跳過此分類（來源商品仍算在內，避免誤列刪除）
+                    plan('create_collection', cat_info['collection'], products=len(products))
+                    scraped_handles.update(f"bape-{p.get('handle', '')}" for p in products)
+                continue
             print(f"[SYNC] {cat_info['collection']} 共 {len(products)} 個有庫存商品")
             scrape_status['total'] += len(products)
 
@@ -591,86 +1310,103 @@ def run_full_sync(category='all'):
 
                 if existing_info:
                     try:
-                        # 更新價格
-                        cnt = update_existing_product_price(existing_info['id'], product.get('variants', []))
-                        if cnt > 0: price_updated_count += 1
-
+                        shopify_variants = existing_info.get('variants')
+                        if shopify_variants is None: shopify_variants = get_product_variants_graphql(existing_info['id'])
                         # v2.3: 同步 variant（刪除缺貨選項）
                         sync_result = sync_bape_variants(
                             existing_info['id'],
                             existing_info.get('title', title),
                             product.get('variants', []),
-                            product.get('options', [])
+                            product.get('options', []),
+                            shopify_variants=shopify_variants,
+                            dry_run=dry_run,
                         )
                         total_variants_deleted += sync_result.get('deleted', 0)
-                        if sync_result.get('product_deleted'):
-                            scrape_status['deleted'] = scrape_status.get('deleted', 0) + 1
-
-                        if existing_info.get('status') == 'DRAFT':
-                            set_product_active(existing_info['id'])
-                            pub_ids = get_all_publication_ids()
-                            if pub_ids:
-                                graphql_request("""mutation publishablePublish($id: ID!, $input: [PublicationInput!]!) { publishablePublish(id: $id, input: $input) { userErrors { field message } } }""",
-                                    {"id": existing_info['id'], "input": [{"publicationId": pid} for pid in pub_ids]})
+                        if sync_result.get('delete_product'):
+                            products_to_delete[my_handle] = existing_info
+                            continue
+                        if dry_run and sync_result.get('deleted_titles'):
+                            plan('delete_variants', my_handle, variants=sync_result['deleted_titles'])
+                        # 價格：只記錄需要改的（剩下的 variant 中價格不一致者），迴圈後一次送出
+                        remaining = [v for v in shopify_variants if v['id'] not in sync_result.get('deleted_ids', [])]
+                        changes = plan_price_update(remaining, product.get('variants', []))
+                        if changes:
+                            price_updates[existing_info['id']] = changes
+                            if dry_run: plan('reprice', my_handle, price=changes[0]['price'], variants=len(changes))
+
+                        if existing_info.get('status') == 'DRAFT' and dry_run:
+                            plan('activate', my_handle)
+                        elif existing_info.get('status') == 'DRAFT':
+                            set_product_active(existing_info['id']); publish_queue.add(existing_info['id'])
+                        if not dry_run and 'publications' in existing_info:
+                            publish_queue.add_from_snapshot(existing_info, publication_count)
                         updated_count += 1
                     except Exception as e:
                         scrape_status['errors'].append({'error': f'更新失敗 {title}: {str(e)}'})
-                    time.sleep(0.2)
                 else:
-                    try:
-                        entry = product_to_jsonl_entry(product, cat_key, collection_id)
-                        if entry:
-                            new_entries.append(entry)
-                            scrape_status['products'].append({'title': entry['productSet']['title'], 'handle': entry['productSet']['handle'], 'variants': len(entry['productSet'].get('variants', []))})
-                    except Exception as e:
-                        scrape_status['errors'].append({'error': f'轉換失敗 {title}: {str(e)}'})
-                    time.sleep(0.3)
-
-        # 4. 新商品批量上傳
-        if new_entries:
-            jsonl_path = os.path.join(JSONL_DIR, f"bape_{category}_{int(time.time())}.jsonl")
-            with open(jsonl_path, 'w', encoding='utf-8') as f:
-                for entry in new_entries: f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-            scrape_status['jsonl_file'] = jsonl_path
-            scrape_status['phase'] = 'uploading'
-            scrape_status['current_product'] = f'批量上傳 {len(new_entries)} 個新商品...'
-            staged = create_staged_upload()
-            if not staged: raise Exception('建立 Staged Upload 失敗')
-            if not upload_jsonl_to_staged(staged, jsonl_path): raise Exception('上傳 JSONL 失敗')
-            staged_path = next((p['value'] for p in staged['parameters'] if p['name'] == 'key'), '')
-            result = run_bulk_mutation(staged_path)
-            user_errors = result.get('data', {}).get('bulkOperationRunMutation', {}).get('userErrors', [])
-            if user_errors: raise Exception(f'Bulk Mutation 錯誤: {user_errors}')
-            scrape_status['bulk_operation_id'] = result.get('data', {}).get('bulkOperationRunMutation', {}).get('bulkOperation', {}).get('id', '')
-            scrape_status['current_product'] = '等待上傳完成...'
-            for _ in range(120):
-                status = check_bulk_operation_status()
-                scrape_status['bulk_status'] = status.get('status', '')
-                if status.get('status') == 'COMPLETED': break
-                elif status.get('status') in ['FAILED', 'CANCELED']: raise Exception(f'Bulk 失敗: {status.get("status")}')
-                time.sleep(5)
+                    new_items.append((product, cat_key, collection_id))
+                    if dry_run: plan('create', my_handle, title=product.get('title', ''))
+
+        # 下架商品（來源已沒有）也排入刪除；有頁面抓取失敗或來源商品太少（抓取異常）則跳過，避免誤刪
+        if failed_pages:
+            print(f"[⚠️ 安全機制] 第 {failed_pages} 頁抓取失敗，來源列表不完整，跳過下架商品刪除")
+            scrape_status['errors'].append({'error': f'來源第 {failed_pages} 頁抓取失敗，已跳過下架商品刪除'})
+        elif len(scraped_handles) < MIN_PRODUCTS_FOR_CLEANUP:
+            print(f"[⚠️ 安全機制] 來源僅 {len(scraped_handles)} 個商品（門檻 {MIN_PRODUCTS_FOR_CLEANUP}），跳過下架商品刪除")
+            scrape_status['errors'].append({'error': f'來源商品過少（{len(scraped_handles)}），已跳過下架商品刪除'})
+        else:
+            for handle, product_info in existing_handles.items():
+                if handle not in scraped_handles: products_to_delete[handle] = product_info
+
+        if dry_run:
+            for handle in products_to_delete: plan('delete', handle)
+            summary = {'create': len(new_items), 'reprice': len(price_updates), 'delete': len(products_to_delete), 'variants_deleted': total_variants_deleted}
+            scrape_status['current_product'] = f"🔍 Dry run：新商品 {summary['create']} 個，改價 {summary['reprice']} 個，刪除商品 {summary['delete']} 個，刪除選項 {summary['variants_deleted']} 個"
+            scrape_status['phase'] = 'completed'
+            print(f"[SYNC] 🔍 Dry run: {summary}")
+            return {'success': True, 'dry_run': True, **summary}
+
+        # 3a. 已存在商品改價（productVariantsBulkUpdate / 大量時 bulk operation）
+        if price_updates:
+            scrape_status['phase'] = 'repricing'
+            scrape_status['current_product'] = f'更新 {len(price_updates)} 個商品價格...'
+            price_updated_count = apply_price_updates(price_updates)
+
+        # 3b + 4. 新商品並行轉換，邊完成邊寫入 JSONL chunk；前一個 bulk 完成就上傳下一個 chunk
+        new_count = 0
+        if new_items:
+            scrape_status['phase'] = 'building'
+            jsonl_prefix = os.path.join(JSONL_DIR, f"bape_{category}_{int(time.time())}")
+            scrape_status['jsonl_file'] = f"{jsonl_prefix}_part*.jsonl"
+            submitter = ChunkedBulkSubmitter(PRODUCT_SET_BULK_MUTATION, 'productSet', jsonl_prefix)
+            try: build_jsonl_file(new_items, submitter)
+            finally:
+                scrape_status['phase'] = 'uploading'
+                created, failed = submitter.close()
+            new_count = len(created)
+            if failed: print(f"[SYNC] ⚠️ {len(failed)} 個新商品上傳失敗: {', '.join(map(str, failed[:10]))}")
+            for r in created.values():
+                if r.get('product'): publish_queue.add(r['product']['id'])
+
+        # 4a. 只發布需要的商品（新建 / 重新上架 / 快照顯示未發布或沒分類）
+        if len(publish_queue):
             scrape_status['phase'] = 'publishing'
-            scrape_status['current_product'] = '發布新商品...'
-            batch_publish_bape_products()
+            scrape_status['current_product'] = f'發布 {len(publish_queue)} 個商品...'
+            publish_queue.flush()
 
         # === v2.2: 下架/缺貨商品直接刪除（不設草稿）===
         scrape_status['phase'] = 'deleting'
-        scrape_status['current_product'] = '清理下架/缺貨商品...'
-        delete_count = 0
-        for handle, product_info in existing_handles.items():
-            if handle not in scraped_handles:
-                print(f"[SYNC] 🗑 刪除: {handle} - {product_info.get('title', '')[:30]}")
-                scrape_status['current_product'] = f"刪除: {product_info.get('title', '')[:30]}"
-                if delete_product(product_info['id']):
-                    delete_count += 1
-                time.sleep(0.2)
+        scrape_status['current_product'] = f'清理下架/缺貨商品 {len(products_to_delete)} 個...'
+        for handle, product_info in products_to_delete.items():
+            print(f"[SYNC] 🗑 刪除: {handle} - {product_info.get('title', '')[:30]}")
+        delete_count = run_deletions(p['id'] for p in products_to_delete.values())
 
         scrape_status['deleted'] = scrape_status.get('deleted', 0) + delete_count
         scrape_status['variants_deleted'] = total_variants_deleted
-        scrape_status['current_product'] = f"✅ 完成！新商品 {len(new_entries)} 個，更新 {updated_count} 個，刪除商品 {scrape_status['deleted']} 個，刪除選項 {total_variants_deleted} 個"
+        scrape_status['current_product'] = f"✅ 完成！新商品 {new_count} 個，更新 {updated_count} 個，刪除商品 {scrape_status['deleted']} 個，刪除選項 {total_variants_deleted} 個"
         scrape_status['phase'] = 'completed'
-        print(f"[SYNC] ✅ 新商品: {len(new_entries)}, 更新價格: {price_updated_count}, 刪除商品: {scrape_status['deleted']}, 刪除選項: {total_variants_deleted}")
-        return {'success': True, 'new_products': len(new_entries), 'updated': updated_count, 'deleted': scrape_status['deleted'], 'variants_deleted': total_variants_deleted}
+        print(f"[SYNC] ✅ 新商品: {new_count}, 更新價格: {price_updated_count}, 刪除商品: {scrape_status['deleted']}, 刪除選項: {total_variants_deleted}")
+        return {'success': True, 'new_products': new_count, 'updated': updated_count, 'deleted': scrape_status['deleted'], 'variants_deleted': total_variants_deleted}
 
     except Exception as e:
         scrape_status['errors'].append({'error': str(e)})
@@ -720,21 +1456,114 @@ def index():
 <script>
 let pollInterval;
 function log(msg,type='info'){const d=document.getElementById('log');const t=new Date().toLocaleTimeString();const c=type==='success'?'#4ec9b0':type==='error'?'#f14c4c':'#d4d4d4';d.innerHTML+=`<div style="color:${c}">[${t}] ${msg}</div>`;d.scrollTop=d.scrollHeight}
-function updateStatus(d){document.getElementById('phase').textContent=d.phase||'-';document.getElementById('progress').textContent=`${d.progress||0}/${d.total||0}`;document.getElementById('current').textContent=d.current_product||'-';document.getElementById('productCount').textContent=d.products?.length||0;document.getElementById('deletedCount').textContent=d.deleted||0;document.getElementById('variantsDeletedCount').textContent=d.variants_deleted||0;document.getElementById('errorCount').textContent=d.errors?.length||0;document.getElementById('progressFill').style.width=d.total>0?(d.progress/d.total*100)+'%':'0%'}
-async function pollStatus(){try{const r=await fetch('/api/status');const d=await r.json();updateStatus(d);if(!d.running){clearInterval(pollInterval);if(d.phase==='completed')log('✅ 完成！','success');if(d.errors?.length>0)d.errors.forEach(e=>log('❌ '+(e.error||JSON.stringify(e)),'error'))}}catch(e){}}
-async function startTest(){log('🧪 開始測試單品...');const r=await fetch('/api/test_single?category='+document.getElementById('testCat').value);const d=await r.json();if(d.success){log('測試已啟動','success');pollInterval=setInterval(pollStatus,1000)}else log('❌ '+(d.error||'啟動失敗'),'error')}
-async function startSync(){log('🔄 開始智慧同步...');const r=await fetch('/api/auto_sync?category='+document.getElementById('syncCat').value);const d=await r.json();if(d.success){log('同步已啟動','success');pollInterval=setInterval(pollStatus,1000)}else log('❌ '+(d.error||'啟動失敗'),'error')}
-async function deleteAll(){if(!confirm('確定要刪除所有 BAPE 商品嗎？'))return;if(!confirm('真的確定嗎？'))return;log('🗑️ 開始刪除...','error');const r=await fetch('/api/delete_all');const d=await r.json();if(d.success){log('刪除已啟動','success');pollInterval=setInterval(pollStatus,1000)}else log('❌ '+(d.error||'啟動失敗'),'error')}
+function updateStatus(d){document.getElementById('phase').textContent=d.phase||'-';document.getElementById('progress').textContent=`${d.progress||0}/${d.total||0}`;document.getElementById('current').textContent=d.current_product||'-';document.getElementById('productCount').textContent=d.products_total||0;document.getElementById('deletedCount').textContent=d.deleted||0;document.getElementById('variantsDeletedCount').textContent=d.variants_deleted||0;document.getElementById('errorCount').textContent=d.errors_total||0;document.getElementById('progressFill').style.width=d.total>0?(d.progress/d.total*100)+'%':'0%'}
+async function pollStatus(){try{const r=await fetch('/api/status');const d=await r.json();updateStatus(d);if(!d.running){clearInterval(pollInterval);if(d.phase==='completed')log('✅ 完成！','success');if(d.recent_errors?.length>0)d.recent_errors.forEach(e=>log('❌ '+(e.error||JSON.stringify(e)),'error'))}}catch(e){}}
+function watchStatus(){if(!window.EventSource){pollInterval=setInterval(pollStatus,1000);return}const s={};let opened=false;const es=new EventSource('/api/events');es.onopen=()=>{opened=true};es.addEventListener('progress',ev=>{const d=JSON.parse(ev.data);Object.assign(s,d.status);s.products_total=d.products_total;s.errors_total=d.errors_total;updateStatus(s);d.errors.forEach(e=>log('❌ '+(e.error||JSON.stringify(e)),'error'))});es.addEventListener('done',()=>{es.close();if(s.phase==='completed')log('✅ 完成！','success')});es.onerror=()=>{if(!opened||es.readyState===EventSource.CLOSED){es.close();pollInterval=setInterval(pollStatus,1000)}}}
+async function startTest(){log('🧪 開始測試單品...');const r=await fetch('/api/test_single?category='+document.getElementById('testCat').value);const d=await r.json();if(d.success){log('測試已啟動','success');watchStatus()}else log('❌ '+(d.error||'啟動失敗'),'error')}
+async function startSync(){log('🔄 開始智慧同步...');const r=await fetch('/api/auto_sync?category='+document.getElementById('syncCat').value);const d=await r.json();if(d.success){log('同步已啟動','success');watchStatus()}else log('❌ '+(d.error||'啟動失敗'),'error')}
+async function deleteAll(){if(!confirm('確定要刪除所有 BAPE 商品嗎？'))return;if(!confirm('真的確定嗎？'))return;log('🗑️ 開始刪除...','error');const r=await fetch('/api/delete_all');const d=await r.json();if(d.success){log('刪除已啟動','success');watchStatus()}else log('❌ '+(d.error||'啟動失敗'),'error')}
 async function testShopify(){log('測試 Shopify...');const r=await fetch('/api/test');const d=await r.json();if(d.data?.shop)log('✅ '+d.data.shop.name,'success');else log('❌ 連線失敗','error')}
 async function testBape(){log('測試 BAPE...');const r=await fetch('/api/test_bape');const d=await r.json();log('總商品: '+(d.total_products||0),d.total_products?'success':'error')}
 async function countProducts(){const r=await fetch('/api/count');const d=await r.json();log('Shopify 商品數量: '+d.count,'success')}
-async function publishAll(){log('📢 發布所有商品...');const r=await fetch('/api/publish_all');const d=await r.json();if(d.success){log('發布已啟動','success');pollInterval=setInterval(pollStatus,1000)}else log('❌ '+(d.error||'啟動失敗'),'error')}
+async function publishAll(){log('📢 發布所有商品...');const r=await fetch('/api/publish_all');const d=await r.json();if(d.success){log('發布已啟動','success');watchStatus()}else log('❌ '+(d.error||'啟動失敗'),'error')}
 </script></body></html>'''
 
 
+def status_snapshot():
+    """純量欄位 + 紀錄筆數 + 最近幾筆（回應大小與商品數無關）"""
+    data = {k: v for k, v in scrape_status.items() if not isinstance(v, RingLog)}
+    products, errors = scrape_status['products'], scrape_status['errors']
+    data.update(products_total=products.total, errors_total=errors.total,
+                recent_products=products.tail(STATUS_RECENT), recent_errors=errors.tail(STATUS_RECENT), graphql=shopify_gql.stats())
+    return data
+
+def _log_page(key):
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    return jsonify(scrape_status[key].page(offset, limit))
+
+def lease_status():
+    """本 process 沒有在執行時，回傳租約裡的狀態快照（其他 worker 的進度 / 重啟前最後結果）；沒有則 None"""
+    lease = run_lease.current()
+    if _run_owner or not lease or lease['status'] is None: return None
+    data = lease['status']
+    if lease['expired']: data['running'] = False; data['lease_expired'] = True  # 執行中的 worker 已消失
+    return data
+
+def shared_status():
+    return lease_status() or status_snapshot()
+
 @app.route('/api/status')
 def api_status():
-    return jsonify(scrape_status)
+    return jsonify(shared_status())
+
+@app.route('/api/status/products')
+def api_status_products():
+    return _log_page('products')
+
+@app.route('/api/status/errors')
+def api_status_errors():
+    return _log_page('errors')
+
+def _sse(event, data, event_id=''):
+    return (f"id: {event_id}\n" if event_id else '') + f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+SNAPSHOT_RECORD_KEYS = ('products_total', 'errors_total', 'recent_products', 'recent_errors')
+
+def _lease_records(recent, total, cursor):
+    """從租約快照的最近幾筆取出 cursor 之後的新紀錄（總數比 cursor 小代表新的一輪執行 → 從頭）"""
+    if total < cursor: cursor = 0
+    n = min(total - cursor, len(recent))
+    return (recent[-n:] if n > 0 else []), total
+
+def _event_stream(p_cur, e_cur):
+    """
+    每 SSE_INTERVAL 秒比對狀態，只送變動欄位 + 新增紀錄；event id 為「商品cursor-錯誤cursor」
+    本 process 沒在執行時改讀租約裡的快照（與 /api/status 相同），其他 worker 執行中不會誤送 done
+    """
+    products, errors = scrape_status['products'], scrape_status['errors']
+    prev, seen_running = {}, False
+    started = last_sent = time.time()
+    while True:
+        now = time.time()
+        shared = lease_status()
+        if shared is not None:
+            snap = {k: v for k, v in shared.items() if k not in SNAPSHOT_RECORD_KEYS}
+            new_products, p_cur = _lease_records(shared.get('recent_products', []), shared.get('products_total', 0), p_cur)
+            new_errors, e_cur = _lease_records(shared.get('recent_errors', []), shared.get('errors_total', 0), e_cur)
+        else:
+            if scrape_status['products'] is not products or scrape_status['errors'] is not errors:
+                # 新的一輪執行（或 delete_all 重設 errors）→ 從頭送
+                if scrape_status['products'] is not products: p_cur = 0
+                if scrape_status['errors'] is not errors: e_cur = 0
+                products, errors, prev = scrape_status['products'], scrape_status['errors'], {}
+            snap = {k: v for k, v in scrape_status.items() if not isinstance(v, RingLog)}
+            new_products, p_cur = products.since(p_cur)
+            new_errors, e_cur = errors.since(e_cur)
+        delta = {k: v for k, v in snap.items() if k not in prev or prev[k] != v}
+        if delta or new_products or new_errors:
+            yield _sse('progress', {'status': delta, 'products': new_products, 'errors': new_errors,
+                'products_total': p_cur, 'errors_total': e_cur}, f"{p_cur}-{e_cur}")
+            prev, last_sent = snap, now
+        elif now - last_sent >= SSE_KEEPALIVE:
+            yield ": keep-alive\n\n"; last_sent = now
+        seen_running = seen_running or snap.get('running')
+        if not snap.get('running') and (seen_running or now - started >= SSE_START_GRACE):
+            yield _sse('done', {'phase': snap.get('phase'), 'products_total': p_cur, 'errors_total': e_cur}); return
+        if now - started >= SSE_MAX_SECONDS: return
+        time.sleep(SSE_INTERVAL)
+
+@app.route('/api/events')
+def api_events():
+    """SSE 進度推送（取代 /api/status 輪詢）；連線已滿回 503，前端改回輪詢"""
+    if not _sse_slots.acquire(blocking=False): return jsonify({'error': 'SSE 連線已滿，請改用 /api/status'}), 503
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor', '')
+    try: p_cur, e_cur = (int(x) for x in cursor.split('-', 1))
+    except ValueError: p_cur = e_cur = 0
+    resp = Response(_event_stream(p_cur, e_cur), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    resp.call_on_close(_sse_slots.release)
+    return resp
 
 @app.route('/api/test')
 def api_test():
@@ -744,23 +1573,20 @@ def api_test():
 @app.route('/api/test_single')
 def api_test_single():
     category = request.args.get('category', 'mens')
-    if scrape_status.get('running'): return jsonify({'success': False, 'error': '正在執行中'})
     if category not in CATEGORIES: return jsonify({'success': False, 'error': '無效分類'})
-    threading.Thread(target=run_test_single, args=(category,)).start()
+    if not start_run('test_single', run_test_single, category): return jsonify({'success': False, 'error': '正在執行中'})
     return jsonify({'success': True})
 
 @app.route('/api/auto_sync')
 def api_auto_sync():
-    category = request.args.get('category', 'all')
-    if scrape_status.get('running'): return jsonify({'success': False, 'error': '正在執行中'})
-    threading.Thread(target=run_full_sync, args=(category,)).start()
+    category = request.args.get('category', 'all'); dry_run = request.args.get('dry_run') in ('1', 'true')
+    if not start_run('auto_sync', run_full_sync, category, dry_run): return jsonify({'success': False, 'error': '正在執行中'})
     return jsonify({'success': True})
 
 @app.route('/api/cron')
 def api_cron():
-    category = request.args.get('category', 'all')
-    if scrape_status.get('running'): return jsonify({'success': False, 'error': '正在執行中'})
-    threading.Thread(target=run_full_sync, args=(category,)).start()
+    category = request.args.get('category', 'all'); dry_run = request.args.get('dry_run') in ('1', 'true')
+    if not start_run('cron', run_full_sync, category, dry_run): return jsonify({'success': False, 'error': '正在執行中'})
     return jsonify({'success': True, 'message': '智慧同步已啟動'})
 
 @app.route('/api/bulk_status')
@@ -769,32 +1595,29 @@ def api_bulk_status():
 
 @app.route('/api/publish_all')
 def api_publish_all():
-    if scrape_status.get('running'): return jsonify({'error': '正在執行中'})
     def run_publish():
         global scrape_status
         scrape_status['running'] = True; scrape_status['phase'] = 'publishing'
         try:
             results = batch_publish_bape_products()
-            scrape_status['current_product'] = f"完成！成功: {results.get('success', 0)}"
+            scrape_status['current_product'] = f"完成！發布: {results.get('success', 0)}，設分類: {results.get('categorized', 0)}"
         except Exception as e: scrape_status['errors'].append({'error': str(e)})
         finally: scrape_status['running'] = False; scrape_status['phase'] = 'idle'
-    threading.Thread(target=run_publish).start()
+    if not start_run('publish_all', run_publish): return jsonify({'error': '正在執行中'})
     return jsonify({'success': True})
 
 @app.route('/api/delete_all')
 def api_delete_all():
-    if scrape_status.get('running'): return jsonify({'error': '正在執行中'})
     def run_delete():
         global scrape_status
         scrape_status['running'] = True; scrape_status['phase'] = 'deleting'
-        scrape_status['progress'] = 0; scrape_status['total'] = 0; scrape_status['errors'] = []
+        scrape_status['progress'] = 0; scrape_status['total'] = 0; scrape_status['errors'] = RingLog()
         try:
-            products = fetch_bape_product_ids(); scrape_status['total'] = len(products)
             results = delete_all_bape_products()
             scrape_status['current_product'] = f"✅ 已刪除 {results.get('deleted', 0)} 個商品"
         except Exception as e: scrape_status['errors'].append({'error': str(e)})
         finally: scrape_status['running'] = False; scrape_status['phase'] = 'completed'
-    threading.Thread(target=run_delete).start()
+    if not start_run('delete_all', run_delete): return jsonify({'error': '正在執行中'})
     return jsonify({'success': True})
 
 @app.route('/api/count')
@@ -807,9 +1630,10 @@ def api_count():
 def api_test_bape():
     results = {}
     try:
-        all_by_category = fetch_all_products_by_category()
+        all_by_category, failed_pages = fetch_all_products_by_category()
         results['total_products'] = sum(len(v) for v in all_by_category.values())
         results['categories'] = {k: len(v) for k, v in all_by_category.items()}
+        results['failed_pages'] = failed_pages
     except Exception as e: results['error'] = str(e)
     return jsonify(results)
 
@@ -9,15 +9,22 @@ v3.0 重大改版：humanmade.jp 已從 Shopify 遷移到自建平台
 - 支援 GraphQL 批次查詢 + Rate Limit 保護
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import json
 import os
 import time
 import threading
 import asyncio
-from urllib.parse import urljoin
+import contextlib
+import itertools
+import sqlite3
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse
 from dotenv import load_dotenv
 
 # 載入 .env 檔案
@@ -37,6 +44,31 @@ MIN_PRICE = 1000
 DEFAULT_WEIGHT = 0.5
 # 安全機制：來源商品少於此數量時跳過刪除
 MIN_PRODUCTS_FOR_CLEANUP = 10
+# 商品詳情：同時爬取的 browser context 數、每個 worker 兩頁之間的間隔（秒）、單一 worker 連續失敗幾次就重建 context
+DETAIL_WORKERS = int(os.environ.get('HUMANMADE_DETAIL_WORKERS', '4'))
+DETAIL_DELAY = float(os.environ.get('HUMANMADE_DETAIL_DELAY', '0.5'))
+MAX_CONSECUTIVE_FAILURES = 5
+# 增量模式：已上架且列表卡片價格未變的商品不進詳情頁（/api/start?full=1 強制全量）
+INCREMENTAL_SCRAPE = os.environ.get('HUMANMADE_INCREMENTAL', '1') == '1'
+# 除錯輸出（商品頁所有 img、說明文預覽）
+HUMANMADE_DEBUG = os.environ.get('HUMANMADE_DEBUG', '') == '1'
+# 狀態紀錄（商品 / 錯誤）最多保留的筆數
+STATUS_LOG_SIZE = int(os.environ.get('STATUS_LOG_SIZE', '500'))
+STATUS_RECENT = 20
+# /api/events（SSE）：檢查間隔、單一連線最長秒數（之後瀏覽器自動重連）、keep-alive 間隔
+SSE_INTERVAL = 1.0
+SSE_MAX_SECONDS = 300
+SSE_KEEPALIVE = 15
+# 連線時尚未開始執行 → 最多等這麼久再送 done（執行緒可能還沒把 running 設為 True）
+SSE_START_GRACE = 5
+# Run lease（SQLite）：跨 gunicorn worker / 重啟只允許一個執行
+RUN_LEASE_DB = os.environ.get('RUN_LEASE_DB', '/tmp/humanmade_run.sqlite3')
+# 超過 TTL 沒有心跳 → 視為已中斷，可被下一個執行接手
+RUN_LEASE_TTL = int(os.environ.get('RUN_LEASE_TTL', '120'))
+RUN_HEARTBEAT = 10
+# 每條 SSE 連線佔用一個 gunicorn thread（--threads 4）
+SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', '2'))
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_CLIENTS)
 
 HEADERS_BROWSER = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
@@ -44,15 +76,181 @@ HEADERS_BROWSER = {
     'Accept-Language': 'ja,en;q=0.9',
 }
 
+# ========== 狀態紀錄（固定容量）==========
+
+class RingLog:
+    """只保留最近 maxlen 筆的紀錄；total 為累計筆數，offset 以累計序號計算"""
+
+    def __init__(self, maxlen=STATUS_LOG_SIZE):
+        self._items = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+            self.total += 1
+
+    def __len__(self):
+        return self.total
+
+    def page(self, offset=0, limit=50):
+        """依累計序號分頁；已被擠掉的舊紀錄從 first_available 開始"""
+        with self._lock:
+            first = self.total - len(self._items)
+            start = max(offset, first)
+            items = list(itertools.islice(self._items, start - first, start - first + limit))
+            total = self.total
+        return {'total': total, 'first_available': first, 'offset': start, 'limit': limit, 'items': items}
+
+    def tail(self, n):
+        with self._lock:
+            skip = max(len(self._items) - n, 0)
+            return list(itertools.islice(self._items, skip, None))
+
+    def since(self, cursor):
+        """序號 >= cursor 的紀錄 + 新 cursor（已被擠掉的略過）"""
+        with self._lock:
+            first = self.total - len(self._items)
+            if cursor > self.total:
+                # 新的一輪執行，舊 cursor 失效
+                cursor = 0
+            start = max(cursor, first)
+            return list(itertools.islice(self._items, start - first, None)), self.total
+
+
 scrape_status = {
     "running": False, "progress": 0, "total": 0, "current_product": "",
-    "products": [], "errors": [], "uploaded": 0, "skipped": 0,
+    "products": RingLog(), "errors": RingLog(), "uploaded": 0, "skipped": 0,
     "skipped_exists": 0, "filtered_by_price": 0, "out_of_stock": 0,
     "deleted": 0, "price_updated": 0
 }
 status_lock = threading.Lock()
 _token_loaded = False
 
+# ========== Run lease（單一執行）==========
+
+class RunLease:
+    """
+    SQLite 上的執行租約：acquire 成功才可開始執行，
+    執行中定期 heartbeat（延長期限 + 寫入狀態快照），結束時 release
+    """
+
+    def __init__(self, path, name='scrape', ttl=RUN_LEASE_TTL):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS run_lease ('
+                ' name TEXT PRIMARY KEY, owner TEXT, job TEXT,'
+                ' expires_at REAL, heartbeat_at REAL, status TEXT)'
+            )
+
+    def _connect(self):
+        # isolation_level=None → 自己控制 BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def acquire(self, job):
+        """取得租約，回傳 owner id；已有未過期的執行則回傳 None"""
+        owner = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT owner, expires_at FROM run_lease WHERE name = ?', (self.name,)).fetchone()
+            if row and row[0] and row[1] > now:
+                conn.execute('ROLLBACK')
+                return None
+            if row and row[0]:
+                print(f"[LEASE] 上一次執行的租約已過期（{row[0][:8]}），接手執行")
+            conn.execute(
+                'INSERT INTO run_lease (name, owner, job, expires_at, heartbeat_at, status)'
+                ' VALUES (?, ?, ?, ?, ?, NULL)'
+                ' ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, job = excluded.job,'
+                ' expires_at = excluded.expires_at, heartbeat_at = excluded.heartbeat_at, status = NULL',
+                (self.name, owner, job, now + self.ttl, now),
+            )
+            conn.execute('COMMIT')
+            return owner
+        finally:
+            conn.close()
+
+    def heartbeat(self, owner, status):
+        """延長期限並寫入狀態快照；租約已被接手則回傳 False"""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                'UPDATE run_lease SET expires_at = ?, heartbeat_at = ?, status = ? WHERE name = ? AND owner = ?',
+                (now + self.ttl, now, json.dumps(status, ensure_ascii=False), self.name, owner),
+            )
+            return cur.rowcount == 1
+
+    def release(self, owner, status):
+        """結束執行：清除 owner，保留最後的狀態快照"""
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE run_lease SET owner = NULL, expires_at = 0, heartbeat_at = ?, status = ? WHERE name = ? AND owner = ?',
+                (time.time(), json.dumps(status, ensure_ascii=False), self.name, owner),
+            )
+
+    def current(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT owner, job, expires_at, heartbeat_at, status FROM run_lease WHERE name = ?', (self.name,)
+            ).fetchone()
+        if not row:
+            return None
+        owner, job, expires_at, heartbeat_at, status = row
+        return {
+            'owner': owner, 'job': job,
+            'active': bool(owner) and expires_at > time.time(),
+            'expired': bool(owner) and expires_at <= time.time(),
+            'heartbeat_at': heartbeat_at,
+            'status': json.loads(status) if status else None,
+        }
+
+
+run_lease = RunLease(RUN_LEASE_DB)
+# 本 process 目前持有的租約（沒有則為 None）
+_run_owner = None
+
+
+def start_run(job, target, *args, on_start=None):
+    """
+    取得租約後在背景線程執行 target；任一 worker 已在執行則回傳 False
+    on_start 在取得租約後、線程啟動前呼叫（重置 scrape_status）
+    執行期間每 RUN_HEARTBEAT 秒寫入狀態快照，讓其他 worker 也能回報進度
+    """
+    global _run_owner
+    owner = run_lease.acquire(job)
+    if not owner:
+        return False
+    _run_owner = owner
+    if on_start:
+        on_start()
+    run_lease.heartbeat(owner, status_snapshot())
+
+    def heartbeat_loop(stop):
+        while not stop.wait(RUN_HEARTBEAT):
+            if not run_lease.heartbeat(owner, status_snapshot()):
+                print("[LEASE] 租約已被其他執行接手")
+                return
+
+    def runner():
+        global _run_owner
+        stop = threading.Event()
+        threading.Thread(target=heartbeat_loop, args=(stop,), daemon=True).start()
+        try:
+            target(*args)
+        finally:
+            stop.set()
+            run_lease.release(owner, status_snapshot())
+            _run_owner = None
+
+    threading.Thread(target=runner, daemon=True).start()
+    return True
+
 
 # ========== Shopify Token ==========
 
@@ -142,6 +340,49 @@ def shopify_graphql(query, variables=None):
     return {'errors': ['Max retries exceeded']}
 
 
+QUERY_COST_LIMIT = 1000  # Shopify 單一 query 的 requestedQueryCost 上限
+
+
+def paginate_graphql(query, path, variables=None, page_size=50, max_page_size=250):
+    """
+    依 extensions.cost 自動調整每頁筆數的分頁讀取，逐筆 yield node
+    query 需接受 $first: Int! 與 $cursor: String，path 為 data 到 connection 的 key
+    - 下一頁筆數 = 依本頁單筆成本推算，讓每頁 requestedQueryCost 接近上限
+    - 剩餘點數不夠下一頁時，依 restoreRate 等剛好足夠的時間（取代固定 sleep）
+    - MAX_COST_EXCEEDED → 依回報的 cost 縮小筆數重送
+    - 其他錯誤（含 shopify_graphql 重試用盡）直接丟例外，不回傳不完整的結果
+    """
+    size = page_size
+    cursor = None
+    while True:
+        data = shopify_graphql(query, {**(variables or {}), 'first': size, 'cursor': cursor})
+        exceeded = next((e.get('extensions') for e in data.get('errors') or []
+                         if isinstance(e, dict) and (e.get('extensions') or {}).get('code') == 'MAX_COST_EXCEEDED'), None)
+        if exceeded and size > 1:
+            size = max(1, int(size * exceeded.get('maxCost', QUERY_COST_LIMIT) / max(exceeded.get('cost', 0), 1)) - 1)
+            continue
+        if data.get('errors') or data.get('data') is None:
+            raise Exception(f"GraphQL 錯誤: {data.get('errors')}")
+        connection = data['data']
+        for key in path:
+            connection = (connection or {}).get(key) or {}
+        for edge in connection.get('edges', []):
+            yield edge['node']
+        page_info = connection.get('pageInfo', {})
+        if not page_info.get('hasNextPage'):
+            return
+        cursor = page_info.get('endCursor')
+        cost = (data.get('extensions') or {}).get('cost') or {}
+        throttle = cost.get('throttleStatus') or {}
+        if cost.get('requestedQueryCost'):
+            per_item = cost['requestedQueryCost'] / size
+            budget = min(QUERY_COST_LIMIT, throttle.get('maximumAvailable', QUERY_COST_LIMIT * 2) / 2)
+            size = max(1, min(max_page_size, int(budget / per_item)))
+            available = throttle.get('currentlyAvailable')
+            if available is not None and available < per_item * size:
+                time.sleep((per_item * size - available) / (throttle.get('restoreRate') or 50))
+
+
 def calculate_selling_price(cost, weight):
     if not cost or cost <= 0:
         return 0
@@ -194,41 +435,591 @@ def translate_with_chatgpt(title, description, max_retries=2):
             'page_title': '', 'meta_description': ''}
 
 
+# ========== HTTP 商品詳情（優先，失敗才用 Playwright）==========
+
+HTTP_DETAIL = os.environ.get('HUMANMADE_HTTP_DETAIL', '1') == '1'
+_SFCC_SITE_RE = re.compile(r'/on/demandware\.store/(Sites-[A-Za-z0-9_-]+-Site)/([a-z]{2}_[A-Z]{2})/')
+_LD_JSON_RE = re.compile(r'<script[^>]*application/ld\+json[^>]*>(.*?)</script>', re.S | re.I)
+_TAG_RE = re.compile(r'<[^>]+>')
+_SIZE_RE = re.compile(r'^(XXS|XS|S|M|L|XL|2XL|3XL|ONE SIZE|FREE|\d+)$', re.I)
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def http_session():
+    """humanmade.jp 共用連線池（keep-alive，各 worker thread 共用）"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=max(4, DETAIL_WORKERS * 2)))
+            session.headers.update(HEADERS_BROWSER)
+            _http_session = session
+        return _http_session
+
+
+def _html_to_text(html):
+    return re.sub(r'\n\s*\n+', '\n', _TAG_RE.sub('\n', (html or '').replace('<br>', '\n'))).strip()
+
+
+def _ld_json_product(html):
+    """頁面內 JSON-LD 的 Product（沒有則 {}）"""
+    for block in _LD_JSON_RE.findall(html):
+        try:
+            data = json.loads(block.strip())
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else data.get('@graph', [data]):
+            if isinstance(item, dict) and item.get('@type') == 'Product':
+                return item
+    return {}
+
+
+def _sfcc_product(html, item_id):
+    """SFCC Product-Show（format=ajax）JSON 的 product；站台路徑從頁面內的 demandware.store URL 取得"""
+    m = _SFCC_SITE_RE.search(html)
+    if not m:
+        return {}
+    url = f"{SOURCE_URL}/on/demandware.store/{m.group(1)}/{m.group(2)}/Product-Show"
+    r = http_session().get(url, params={'pid': item_id, 'format': 'ajax'},
+                           headers={'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest'}, timeout=15)
+    if r.status_code != 200 or 'json' not in r.headers.get('content-type', ''):
+        return {}
+    return r.json().get('product') or {}
+
+
+def fetch_product_http(url, item_id):
+    """
+    不開瀏覽器取得商品詳情：商品頁 HTML（JSON-LD）+ SFCC Product-Show JSON
+    回傳與 scrape_product_page 相同格式；驗證不過回傳 None（改由 Playwright 解析）：
+    WAF 擋下、缺標題 / 價格 / 圖片，或 SFCC JSON 沒有 variationAttributes / available（無法判斷尺寸與庫存）
+    """
+    try:
+        r = http_session().get(url, timeout=15)
+    except requests.RequestException as e:
+        print(f"  [HTTP] {item_id}: {e}")
+        return None
+    if r.status_code != 200 or 'html' not in r.headers.get('content-type', ''):
+        return None
+    html = r.text
+    ld = _ld_json_product(html)
+    try:
+        sfcc = _sfcc_product(html, item_id)
+    except (requests.RequestException, ValueError):
+        sfcc = {}
+    if not sfcc.get('variationAttributes') or 'available' not in sfcc:
+        return None
+
+    data = {'title': '', 'description': '', 'price_text': '', 'colors': [], 'sizes': [], 'images': [],
+            'item_id': '', 'material': '', 'made_in': '', 'available': True, 'url': url}
+    data['title'] = (sfcc.get('productName') or ld.get('name') or '').strip()
+
+    offers = ld.get('offers') or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    price = ((sfcc.get('price') or {}).get('sales') or {}).get('value') or offers.get('price')
+    try:
+        price_jpy = int(float(str(price).replace(',', ''))) if price else 0
+    except ValueError:
+        price_jpy = 0
+    data['price_text'] = f"¥{price_jpy:,}" if price_jpy else ''
+
+    for attr in sfcc.get('variationAttributes') or []:
+        values = [v.get('displayValue', '').strip() for v in attr.get('values', []) if v.get('displayValue')]
+        if attr.get('attributeId', attr.get('id')) == 'color':
+            data['colors'] = values
+        elif attr.get('attributeId', attr.get('id')) == 'size':
+            data['sizes'] = [v for v in values if _SIZE_RE.match(v)]
+
+    images = [img.get('url') or img.get('absURL') for img in (sfcc.get('images') or {}).get('large', [])]
+    if not any(images):
+        images = ld.get('image') or []
+        images = [images] if isinstance(images, str) else images
+    data['images'] = [urljoin(SOURCE_URL, u) for u in images if u][:10]
+
+    description = _html_to_text(sfcc.get('longDescription') or sfcc.get('shortDescription') or ld.get('description') or '')
+    data['description'] = description
+    material = re.search(r'MATERIAL[：:]\s*([^\n]+)', description, re.I)
+    made_in = re.search(r'MADE\s+IN\s+([A-Z]+)', description, re.I)
+    data['material'] = material.group(1).strip() if material else ''
+    data['made_in'] = made_in.group(1).strip() if made_in else ''
+
+    data['available'] = bool(sfcc.get('available')) and sfcc.get('readyToOrder', True) is not False
+
+    if not data['title'] or not price_jpy or not data['images']:
+        return None
+    data['price_jpy'] = price_jpy
+    data['item_id'] = sfcc.get('id') or ld.get('sku') or item_id
+    data['handle'] = item_id
+    return data
+
+
+# ========== 商品列表：分頁 API ==========
+
+LISTING_PAGE_SIZE = int(os.environ.get('HUMANMADE_LISTING_PAGE_SIZE', '96'))
+_PRODUCT_LINK_RE = re.compile(r'href="(?:https?://[^"/]+)?/([^"/]+)/([A-Z][A-Z0-9]+)\.html')
+_EXCLUDE_PAGES = ('about', 'faq', 'shipping', 'payment', 'privacy', 'terms', 'inquiries', 'dealers', 'legal', 'counterfeit', 'maintenance')
+
+
+def _is_paging_url(url):
+    """SFCC 列表分頁 API（VIEW MORE 呼叫的 Search-UpdateGrid / Search-Show?format=ajax，帶 start / sz）"""
+    query = parse_qs(urlparse(url).query)
+    return 'Search-UpdateGrid' in url or ('Search-Show' in url and 'start' in query and 'sz' in query)
+
+
+def parse_product_links(html):
+    """從列表 HTML 片段取出 [(item_id, category)]（規則與頁面上的 JS 相同）"""
+    links = {}
+    for category, item_id in _PRODUCT_LINK_RE.findall(html):
+        if any(ex in category for ex in _EXCLUDE_PAGES) or any(ex in item_id.lower() for ex in _EXCLUDE_PAGES):
+            continue
+        links.setdefault(item_id, category)
+    return list(links.items())
+
+
+_CARD_PRICE_RE = re.compile(r'(?:¥|￥|&yen;|&#165;)\s*([\d,]+)')
+_CARD_SOLD_OUT_RE = re.compile(r'SOLD\s*OUT|sold-?out|売り切れ|在庫なし', re.I)
+
+
+def parse_listing_cards(html):
+    """
+    從列表 HTML 取出每個商品卡片的 {item_id: {'price_jpy', 'sold_out'}}
+    卡片範圍 = 該商品第一個連結到下一個商品第一個連結之間；取不到價格時 price_jpy 為 None
+    """
+    starts = []
+    seen = set()
+    for m in _PRODUCT_LINK_RE.finditer(html):
+        category, item_id = m.groups()
+        if item_id in seen or any(ex in category for ex in _EXCLUDE_PAGES) \
+                or any(ex in item_id.lower() for ex in _EXCLUDE_PAGES):
+            continue
+        seen.add(item_id)
+        starts.append((m.start(), item_id))
+    cards = {}
+    for i, (start, item_id) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else start + 4000
+        chunk = html[start:end]
+        prices = _CARD_PRICE_RE.findall(chunk)
+        cards[item_id] = {
+            'price_jpy': int(prices[-1].replace(',', '')) if prices else None,  # 特價時取最後一個
+            'sold_out': bool(_CARD_SOLD_OUT_RE.search(chunk)),
+        }
+    return cards
+
+
+def select_detail_links(product_links, cards, known):
+    """
+    增量模式：依列表卡片決定哪些商品要進詳情頁
+    - 新商品 → 爬取；卡片顯示售完則直接略過（反正不會上架）
+    - 已上架、卡片價格 = Shopify 成本價且未售完 → 不爬，視為仍有庫存
+    - 已上架但價格變動 / 售完 / 卡片取不到價格 → 爬取確認
+    known: {handle.lower(): (Shopify handle, 成本價)}
+    回傳 (要爬的連結, 未變動的 Shopify handle)
+    """
+    to_visit, unchanged = [], []
+    for item_id, category in product_links:
+        card = cards.get(item_id) or {}
+        entry = known.get(f"humanmade-{item_id}".lower())
+        if entry is None:
+            if card.get('sold_out'):
+                increment_status('out_of_stock')
+                increment_status('skipped')
+            else:
+                to_visit.append((item_id, category))
+            continue
+        handle, cost = entry
+        if not card.get('sold_out') and card.get('price_jpy') is not None and cost is not None \
+                and abs(card['price_jpy'] - cost) < 1:
+            unchanged.append(handle)
+        else:
+            to_visit.append((item_id, category))
+    return to_visit, unchanged
+
+
+def _with_paging(url, start, size):
+    parts = urlparse(url)
+    query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+    query.update(start=str(start), sz=str(size))
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+async def list_products_via_api(context, paging_url, cards=None):
+    """
+    直接呼叫分頁 API 逐頁取得商品連結（context.request：沿用瀏覽器 cookie 通過 WAF，不渲染頁面）
+    start 依實際回傳的商品數前進（伺服器可能限制 sz），沒有新商品就停止
+    cards 有傳入時一併收集列表卡片資訊（parse_listing_cards）
+    """
+    links = {}
+    start = 0
+    for _ in range(200):
+        response = await context.request.get(_with_paging(paging_url, start, LISTING_PAGE_SIZE), timeout=30000)
+        if not response.ok:
+            raise Exception(f"HTTP {response.status}")
+        html = await response.text()
+        page_links = parse_product_links(html)
+        if cards is not None:
+            for item_id, card in parse_listing_cards(html).items():
+                cards.setdefault(item_id, card)
+        new = [(item_id, category) for item_id, category in page_links if item_id not in links]
+        if not new:
+            break
+        links.update(new)
+        start += len(page_links)
+        print(f"[Phase 1] 分頁 API start={start}，目前 {len(links)} 個商品")
+        update_status(current_product=f"分頁 API 取得商品列表... {len(links)} 個")
+    return list(links.items())
+
+
 # ========== Playwright 爬蟲核心 ==========
 
-async def scrape_all_products_playwright():
+BROWSER_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+
+
+async def launch_browser(p):
+    return await p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu'])
+
+
+# 請求攔截：只需要 DOM（圖片只讀 img.src），不下載圖片 / 影音 / 字型，也不載入追蹤碼與 Global-e
+BLOCK_RESOURCES = os.environ.get('HUMANMADE_BLOCK_RESOURCES', '1') == '1'
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+BLOCKED_HOSTS = (
+    'global-e.com', 'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googleadservices.com',
+    'facebook.net', 'facebook.com', 'criteo.com', 'criteo.net', 'hotjar.com', 'tiktok.com', 'clarity.ms',
+    'yimg.jp', 'yahoo.co.jp', 'line-scdn.net', 'line.me', 'twitter.com', 'pinterest.com', 'karte.io', 'adobedtm.com',
+)
+# 主站與其 API / 靜態檔（SFCC）一律放行；其他第三方只放行文件本身需要的 stylesheet
+ALLOWED_HOSTS = ('humanmade.jp', 'demandware.net', 'demandware.static', 'salesforce-commerce.com')
+
+
+def _host_matches(host, domains):
+    return any(host == d or host.endswith('.' + d) for d in domains)
+
+
+async def _route_filter(route):
+    request = route.request
+    host = urlparse(request.url).hostname or ''
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or _host_matches(host, BLOCKED_HOSTS):
+        return await route.abort()
+    if not _host_matches(host, ALLOWED_HOSTS) and request.resource_type not in ('document', 'stylesheet'):
+        return await route.abort()
+    await route.continue_()
+
+
+async def new_browser_context(browser, storage_state=None):
+    context = await browser.new_context(user_agent=BROWSER_UA, locale='ja-JP', extra_http_headers={'Accept-Language': 'ja,en;q=0.9'},
+                                        storage_state=storage_state)
+    if BLOCK_RESOURCES:
+        await context.route('**/*', _route_filter)
+    return context
+
+
+async def dismiss_popups(page):
+    """同意 Cookie、移除 Global-e 國際運送彈窗；回傳是否成功點擊 Cookie 同意"""
+    consented = False
+    try:
+        cookie_btn = page.locator('text=同意する').first
+        if await cookie_btn.is_visible(timeout=3000):
+            await cookie_btn.click()
+            consented = True
+            print("[瀏覽器] ✓ 已關閉 Cookie 彈窗")
+    except Exception:
+        pass
+    try:
+        await page.evaluate('''() => {
+            const ge = document.getElementById('globalePopupWrapper');
+            if (ge) ge.remove();
+            document.querySelectorAll('[class*="globale"], [id*="globale"]').forEach(el => {
+                if (getComputedStyle(el).position === 'fixed') el.remove();
+            });
+        }''')
+    except Exception:
+        pass
+    return consented
+
+
+# 常駐瀏覽器：已同意 Cookie / 關閉彈窗的 storage state、開過幾頁後重啟
+STORAGE_STATE_PATH = os.environ.get('HUMANMADE_STORAGE_STATE', '/tmp/humanmade_storage_state.json')
+STORAGE_STATE_TTL = int(os.environ.get('HUMANMADE_STORAGE_STATE_TTL', '21600'))  # 秒；超過就重新暖機
+WARM_UP_RETRY = 600  # 暖機失敗（沒點到 Cookie 同意）後隔多久再試
+BROWSER_RECYCLE_PAGES = int(os.environ.get('HUMANMADE_BROWSER_RECYCLE', '300'))
+RECYCLE_WAIT = 60  # 需要回收時，最多等借出中的 context 歸還幾秒（逾時照常借出，不回收）
+
+
+class BrowserService:
+    """
+    app 擁有的常駐 Chromium（run_scrape 與測試端點共用，不再每次啟動 / 關閉）
+    - 專屬執行緒跑 asyncio loop；run(coro) 可從任何執行緒同步執行
+    - lease() 借出 context（載入 storage state），用完自動關閉
+    - storage state 只在成功同意 Cookie 後存檔；瀏覽器重新啟動或檔案超過 STORAGE_STATE_TTL 時重新暖機
+    - 借出前檢查瀏覽器是否存活；累計開過 BROWSER_RECYCLE_PAGES 頁時，新的借出先等借出中的 context 歸還再重啟
+      （Phase 2 的 worker 看到 recycle_due 會主動歸還 context，所以長時間的執行中途也會回收）
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._start_lock = threading.Lock()
+        self._browser_lock = None
+        self._playwright = None
+        self.browser = None
+        self.pages = 0
+        self.active = 0
+        self.launches = 0
+        self._warmed_at = 0  # 最近一次暖機嘗試的時間
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True, name='browser-service').start()
+            return self._loop
+
+    def run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result(timeout)
+
+    def start(self):
+        """背景預先啟動瀏覽器並暖機（不等待）"""
+        future = asyncio.run_coroutine_threadsafe(self._get_browser(reserve=False), self._ensure_loop())
+        future.add_done_callback(lambda f: f.exception() and print(f"[瀏覽器] 預先啟動失敗: {f.exception()}"))
+
+    async def _get_browser(self, reserve=True):
+        """取得可用的瀏覽器；reserve=True 時在鎖內先佔一個 active（避免另一個 lease 同時判斷可回收而關掉它）"""
+        if self._browser_lock is None:
+            self._browser_lock = asyncio.Lock()
+        async with self._browser_lock:
+            # 需要回收 → 持鎖擋住新的借出，等借出中的 context 歸還
+            deadline = time.time() + RECYCLE_WAIT
+            while self.browser is not None and self.recycle_due and self.active > 0 and time.time() < deadline:
+                await asyncio.sleep(0.5)
+            recycle = self.recycle_due and self.active == 0
+            if self.browser is not None and (recycle or not self.browser.is_connected()):
+                print(f"[瀏覽器] {'已開 ' + str(self.pages) + ' 頁，重啟回收' if recycle else '連線中斷，重新啟動'}")
+                try:
+                    await self.browser.close()
+                except Exception:
+                    pass
+                self.browser = None
+            if self.browser is None:
+                if self._playwright is None:
+                    from playwright.async_api import async_playwright
+                    self._playwright = await async_playwright().start()
+                self.browser = await launch_browser(self._playwright)
+                self.pages = 0
+                self.launches += 1
+                await self._warm_up(self.browser)
+            elif self._state() is None and time.time() - self._warmed_at >= WARM_UP_RETRY:
+                await self._warm_up(self.browser)
+            if reserve:
+                self.active += 1
+            return self.browser
+
+    async def _discard(self, browser):
+        """關閉異常的瀏覽器（已被換掉就不動）"""
+        async with self._browser_lock:
+            if self.browser is browser:
+                self.browser = None
+        try:
+            await browser.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _state():
+        """未過期的 storage state 路徑；沒有或超過 STORAGE_STATE_TTL 回傳 None"""
+        try:
+            fresh = time.time() - os.path.getmtime(STORAGE_STATE_PATH) < STORAGE_STATE_TTL
+        except OSError:
+            return None
+        return STORAGE_STATE_PATH if fresh else None
+
+    async def _warm_up(self, browser):
+        """開一次列表頁：同意 Cookie、關閉彈窗；確實點到同意才存 storage state 供之後的 context 使用"""
+        self._warmed_at = time.time()
+        context = await new_browser_context(browser)
+        try:
+            page = await context.new_page()
+            await page.goto(ALL_ITEMS_URL, wait_until='domcontentloaded', timeout=60000)
+            if await dismiss_popups(page):
+                await context.storage_state(path=STORAGE_STATE_PATH)
+                print(f"[瀏覽器] ✓ 暖機完成，storage state 已存至 {STORAGE_STATE_PATH}")
+            else:
+                print("[瀏覽器] 暖機未點到 Cookie 同意，不更新 storage state")
+        except Exception as e:
+            print(f"[瀏覽器] 暖機失敗: {e}")
+        finally:
+            await context.close()
+
+    @property
+    def recycle_due(self):
+        return self.pages >= BROWSER_RECYCLE_PAGES
+
+    def _count_navigation(self, request):
+        if request.resource_type == 'document' and request.is_navigation_request():
+            self.pages += 1
+
+    def _released(self, _context):
+        self.active = max(self.active - 1, 0)
+
+    async def new_context(self):
+        browser = await self._get_browser()
+        try:
+            try:
+                context = await new_browser_context(browser, self._state())
+            except Exception as e:
+                # 瀏覽器異常 → 關掉重開一次（已佔的 active 沿用）
+                print(f"[瀏覽器] 建立 context 失敗，重新啟動: {e}")
+                await self._discard(browser)
+                browser = await self._get_browser(reserve=False)
+                context = await new_browser_context(browser, self._state())
+        except Exception:
+            self._released(None)
+            raise
+        context.on('close', self._released)
+        context.on('request', self._count_navigation)
+        return context
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        context = await self.new_context()
+        try:
+            yield context
+        finally:
+            try:
+                await context.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        return {'running': bool(self.browser), 'pages': self.pages, 'active_contexts': self.active, 'launches': self.launches}
+
+
+browser_service = BrowserService()
+if os.environ.get('HUMANMADE_BROWSER_PRELAUNCH', '1') == '1':
+    browser_service.start()
+
+
+async def scrape_product_details(product_links):
+    """
+    Phase 2：DETAIL_WORKERS 個 worker 並行爬取商品詳情
+    - 先用 HTTP（fetch_product_http）取得，驗證不過才向 browser_service 借 context/page 用 Playwright 解析
+    - 每個 worker 各自計算連續失敗，達 MAX_CONSECUTIVE_FAILURES 只重建自己的 context
+    - 開 context / page 失敗算該商品失敗並退避；連續 MAX_CONSECUTIVE_FAILURES 次開不起來只停掉該 worker
+    - 結果依 product_links 原順序合併
+    """
+    results = [None] * len(product_links)
+    work = asyncio.Queue()
+    for idx, link in enumerate(product_links):
+        work.put_nowait((idx, link))
+    done = 0
+
+    async def open_page():
+        context = await browser_service.new_context()
+        try:
+            return context, await context.new_page()
+        except Exception:
+            await context.close()
+            raise
+
+    async def worker(worker_id):
+        nonlocal done, http_hits
+        context = page = None  # 只有 HTTP 取不到時才開 page
+        consecutive_failures = 0
+        open_failures = 0
+        while open_failures < MAX_CONSECUTIVE_FAILURES:
+            try:
+                idx, (item_id, category) = work.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            product_url = f"{SOURCE_URL}/{category}/{item_id}.html"
+            product_data = await asyncio.to_thread(fetch_product_http, product_url, item_id) if HTTP_DETAIL else None
+            if product_data:
+                http_hits += 1
+            else:
+                if page is None:
+                    try:
+                        context, page = await open_page()
+                        open_failures = 0
+                    except Exception as e:
+                        open_failures += 1
+                        print(f"[⚠️] worker {worker_id} 開啟 page 失敗（{open_failures}/{MAX_CONSECUTIVE_FAILURES}）: {e}")
+                        await asyncio.sleep(5 * open_failures)
+                # 重試最多 2 次
+                for retry in range(2 if page is not None else 0):
+                    product_data = await scrape_product_page(page, product_url, item_id)
+                    if product_data:
+                        break
+                    print(f"  [RETRY] {item_id} 第 {retry+1} 次重試...")
+                    await asyncio.sleep(3)
+
+            done += 1
+            update_status(progress=done, current_product=f"爬取商品: {item_id}")
+            if product_data:
+                product_data['category_path'] = category
+                results[idx] = product_data
+                print(f"[{done}/{len(product_links)}] ✓ {item_id}: {product_data.get('title', 'N/A')} - ¥{product_data.get('price_jpy', 0)}")
+                consecutive_failures = 0
+            else:
+                print(f"[{done}/{len(product_links)}] ✗ {item_id}: 解析失敗")
+                consecutive_failures += 1
+
+            # 瀏覽器該回收了 → 歸還 context，下次開 page 時換到新的瀏覽器
+            if context is not None and browser_service.recycle_due:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+                context = page = None
+
+            # 這個 worker 連續失敗太多次 → 重建它自己的 context
+            if consecutive_failures >= MAX_CONSECUTIVE_FAILURES and context is not None:
+                print(f"[⚠️] worker {worker_id} 連續 {MAX_CONSECUTIVE_FAILURES} 次失敗，重建 context...")
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+                context = page = None
+                consecutive_failures = 0
+
+            # 控速避免被封
+            await asyncio.sleep(DETAIL_DELAY)
+        if open_failures >= MAX_CONSECUTIVE_FAILURES:
+            print(f"[⚠️] worker {worker_id} 連續無法開啟 page，停止（剩餘商品由其他 worker 處理）")
+        if context is not None:
+            try:
+                await context.close()
+            except Exception:
+                pass
+
+    http_hits = 0
+    await asyncio.gather(*(worker(i) for i in range(max(1, min(DETAIL_WORKERS, len(product_links))))))
+    print(f"[Phase 2] HTTP 直接取得 {http_hits} 個，Playwright {sum(1 for r in results if r) - http_hits} 個")
+    return [r for r in results if r]
+
+async def scrape_all_products_playwright(known=None):
     """
     使用 Playwright 真實瀏覽器爬取 humanmade.jp 所有商品
     策略：
     1. 開啟商品列表頁，攔截網路請求找 API
     2. 滾動載入所有商品卡片
     3. 收集商品連結
-    4. 逐一進入商品頁面解析詳細資料
+    4. 多個 page 並行進入商品頁面解析詳細資料（scrape_product_details）
+    known（增量模式）：{handle.lower(): (Shopify handle, 成本價)}，只爬新商品或卡片有變動的商品
+    回傳 (商品詳情, 未變動而略過的 Shopify handle)
     """
-    from playwright.async_api import async_playwright
-
     products = []
+    unchanged = []
+    cards = {}  # item_id -> 列表卡片價格 / 售完
     api_responses = []  # 攔截到的 API 回應
+    paging_urls = []  # 攔截到的分頁 API（Search-UpdateGrid 等，帶 start / sz）
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu']
-        )
-        context = await browser.new_context(
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-            locale='ja-JP',
-            extra_http_headers={
-                'Accept-Language': 'ja,en;q=0.9',
-            }
-        )
-
+    async with browser_service.lease() as context:
         # === Phase 1: 取得商品列表 ===
         page = await context.new_page()
 
         # 攔截 API 請求（自動偵測後端 API）
         async def handle_response(response):
             url = response.url
+            if _is_paging_url(url):
+                paging_urls.append(url)
             if any(kw in url for kw in ['products', 'items', 'catalog', 'api', 'graphql']):
                 try:
                     ct = response.headers.get('content-type', '')
@@ -245,44 +1036,40 @@ async def scrape_all_products_playwright():
         update_status(current_product="載入商品列表頁面...")
 
         try:
-            await page.goto(ALL_ITEMS_URL, wait_until='networkidle', timeout=60000)
+            await page.goto(ALL_ITEMS_URL, wait_until='domcontentloaded', timeout=60000)
+            await page.wait_for_selector('a[href*=".html"]', timeout=15000)
         except Exception as e:
-            print(f"[WARNING] networkidle timeout, continuing... {e}")
-            await page.wait_for_timeout(5000)
+            print(f"[WARNING] 列表頁載入逾時，繼續... {e}")
 
-        # === 關閉 Cookie 彈窗 ===
-        try:
-            cookie_btn = page.locator('text=同意する').first
-            if await cookie_btn.is_visible(timeout=3000):
-                await cookie_btn.click()
-                print("[Phase 1] ✓ 已關閉 Cookie 彈窗")
-                await page.wait_for_timeout(1000)
-        except:
-            pass
+        # === 關閉 Cookie / Global-e 彈窗（storage state 已同意時不會出現）===
+        await dismiss_popups(page)
 
-        # === 關閉 Global-e 國際運送彈窗 ===
-        try:
-            await page.evaluate('''() => {
-                const ge = document.getElementById('globalePopupWrapper');
-                if (ge) ge.remove();
-                document.querySelectorAll('[class*="globale"], [id*="globale"]').forEach(el => {
-                    if (getComputedStyle(el).position === 'fixed') el.remove();
-                });
-            }''')
-            print("[Phase 1] ✓ 已移除 Global-e 彈窗")
-            await page.wait_for_timeout(1000)
-        except:
-            pass
+        # === 優先：直接呼叫分頁 API 取得商品列表 ===
+        api_links = []
+        paging_url = paging_urls[-1] if paging_urls else None
+        if not paging_url:
+            try:
+                data_url = await page.get_attribute('button.show-more', 'data-url', timeout=3000)
+                paging_url = urljoin(SOURCE_URL, data_url) if data_url else None
+            except Exception:
+                paging_url = None
+        if paging_url:
+            update_status(current_product="透過分頁 API 取得商品列表...")
+            try:
+                api_links = await list_products_via_api(context, paging_url, cards)
+            except Exception as e:
+                print(f"[Phase 1] 分頁 API 失敗，改用 VIEW MORE: {e}")
 
-        # === 點擊 VIEW MORE 載入所有商品 ===
-        print("[Phase 1] 點擊 VIEW MORE 載入所有商品...")
-        update_status(current_product="點擊 VIEW MORE 載入所有商品...")
+        # === 備援：點擊 VIEW MORE 載入所有商品 ===
+        if not api_links:
+            print("[Phase 1] 點擊 VIEW MORE 載入所有商品...")
+            update_status(current_product="點擊 VIEW MORE 載入所有商品...")
 
-        for click_round in range(50):  # 最多點 50 次
+        for click_round in range(0 if api_links else 50):  # 最多點 50 次
             try:
                 # 先滾到底部讓按鈕可見
                 await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-                await page.wait_for_timeout(1500)
+                await page.wait_for_timeout(300)
 
                 # 清除可能新出現的彈窗
                 await page.evaluate('''() => {
@@ -293,7 +1080,14 @@ async def scrape_all_products_playwright():
                 # 找 VIEW MORE 按鈕
                 view_more = page.locator('button.show-more').first
                 if await view_more.is_visible(timeout=3000):
+                    before = await page.evaluate('document.querySelectorAll(\'a[href*=".html"]\').length')
                     await view_more.click(force=True)
+                    # 等新的商品卡片出現（取代固定等待）
+                    try:
+                        await page.wait_for_function(
+                            'n => document.querySelectorAll(\'a[href*=".html"]\').length > n', arg=before, timeout=10000)
+                    except Exception:
+                        pass
                     count = await page.evaluate('''() => {
                         const ids = new Set();
                         document.querySelectorAll('a[href]').forEach(a => {
@@ -303,7 +1097,6 @@ async def scrape_all_products_playwright():
                         return ids.size;
                     }''')
                     print(f"[Phase 1] VIEW MORE 第 {click_round + 1} 次，目前 {count} 個商品")
-                    await page.wait_for_timeout(3000)
                 else:
                     print(f"[Phase 1] 沒有更多 VIEW MORE 按鈕，載入完成")
                     break
@@ -332,8 +1125,21 @@ async def scrape_all_products_playwright():
             return Array.from(links.entries());  // [[itemId, category], ...]
         }''')
 
+        # 合併分頁 API 結果（保留頁面順序，去重）
+        if api_links:
+            seen = {item_id for item_id, _ in product_links}
+            product_links = list(product_links) + [link for link in api_links if link[0] not in seen]
+
         print(f"[Phase 1] 共找到 {len(product_links)} 個不重複商品 ID")
 
+        # 增量模式：用列表卡片判斷，只爬新商品或有變動的商品
+        if known is not None:
+            for item_id, card in parse_listing_cards(await page.content()).items():
+                cards.setdefault(item_id, card)
+            total_links = len(product_links)
+            product_links, unchanged = select_detail_links(product_links, cards, known)
+            print(f"[增量] 列表 {total_links} 個：未變動 {len(unchanged)} 個略過，需爬取 {len(product_links)} 個")
+
         # 如果有攔截到 API，嘗試從中取得結構化資料
         if api_responses:
             print(f"[API] 攔截到 {len(api_responses)} 個 API 回應，嘗試解析...")
@@ -346,77 +1152,155 @@ async def scrape_all_products_playwright():
                 except:
                     pass
 
-        # === Phase 2: 逐一爬取商品詳情 ===
-        print(f"\n[Phase 2] 開始爬取 {len(product_links)} 個商品詳情...")
-        update_status(total=len(product_links))
-
-        consecutive_failures = 0
-        MAX_CONSECUTIVE_FAILURES = 5
+        await page.close()
 
-        for idx, (item_id, category) in enumerate(product_links):
-            update_status(progress=idx + 1, current_product=f"爬取商品: {item_id}")
+    # === Phase 2: 並行爬取商品詳情（列表 context 已歸還，瀏覽器可在途中回收）===
+    print(f"\n[Phase 2] 開始爬取 {len(product_links)} 個商品詳情（{DETAIL_WORKERS} 個 worker）...")
+    update_status(total=len(product_links))
+    products = await scrape_product_details(product_links)
 
-            product_url = f"{SOURCE_URL}/{category}/{item_id}.html"
-            product_data = None
-
-            # 重試最多 2 次
-            for retry in range(2):
-                product_data = await scrape_product_page(page, product_url, item_id)
-                if product_data:
-                    break
-                print(f"  [RETRY] {item_id} 第 {retry+1} 次重試...")
-                await page.wait_for_timeout(3000)
-
-            if product_data:
-                product_data['category_path'] = category
-                products.append(product_data)
-                print(f"[{idx+1}/{len(product_links)}] ✓ {item_id}: {product_data.get('title', 'N/A')} - ¥{product_data.get('price_jpy', 0)}")
-                consecutive_failures = 0
-            else:
-                print(f"[{idx+1}/{len(product_links)}] ✗ {item_id}: 解析失敗")
-                consecutive_failures += 1
+    print(f"\n[完成] 共成功爬取 {len(products)} 個商品")
+    return products, unchanged
+
+
+# 商品頁解析（瀏覽器內執行）：先用已知的 SFCC selector 一次取完，找不到才掃整頁
+# 參數 debug=true 時才收集所有 img 供診斷
+PRODUCT_EXTRACT_JS = '''(debug) => {
+    const result = {
+        title: '', description: '', price_text: '', colors: [], sizes: [], images: [],
+        item_id: '', material: '', made_in: '', available: true, url: window.location.href
+    };
+    const text = el => (el && el.textContent || '').trim();
+    const first = (selectors, ok) => {
+        for (const sel of selectors) {
+            const el = document.querySelector(sel);
+            if (el && ok(el)) return el;
+        }
+        return null;
+    };
+    const PRICE_RE = /[¥￥]\\s*[\\d,]+|NT\\$\\s*[\\d,]+/;
+
+    // === 商品名稱 ===
+    const titleEl = first(['h1.product-name', '.product-name', 'h1', '.product-title',
+        '[class*="product"] h1', '[class*="item"] h1', 'h2.product', 'main h1'], el => text(el).length > 2);
+    if (titleEl) result.title = text(titleEl);
+
+    // === 價格：SFCC 價格區塊 → 備援才掃整頁 ===
+    const priceEl = first(['.prices .sales .value', '.prices .price .value', '.sales .value', '.product-price', '.prices', '[data-price]'],
+        el => PRICE_RE.test(text(el)));
+    if (priceEl) {
+        result.price_text = text(priceEl);
+    } else {
+        for (const el of document.querySelectorAll('main *, body *')) {
+            if (el.children.length < 3 && PRICE_RE.test(el.textContent)) {
+                result.price_text = text(el);
+                break;
+            }
+        }
+    }
 
-            # 連續失敗太多次 → 重啟瀏覽器
-            if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
-                print(f"[⚠️] 連續 {MAX_CONSECUTIVE_FAILURES} 次失敗，重啟瀏覽器...")
-                try:
-                    await page.close()
-                    await context.close()
-                    await browser.close()
-                except:
-                    pass
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu']
-                )
-                context = await browser.new_context(
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    locale='ja-JP',
-                    extra_http_headers={'Accept-Language': 'ja,en;q=0.9'}
-                )
-                page = await context.new_page()
-                consecutive_failures = 0
-                print(f"[✓] 瀏覽器已重啟")
+    // === 顏色 ===
+    document.querySelectorAll('[class*="color"] label, [class*="color"] span, [class*="Color"] span, [data-option="color"] span').forEach(el => {
+        const t = text(el);
+        if (t && t.length < 30 && !/^(Color|色|カラー)$/i.test(t)) result.colors.push(t);
+    });
+    if (result.colors.length === 0) {
+        document.querySelectorAll('[class*="color"] img, [class*="swatch"] img').forEach(img => {
+            const alt = img.alt || img.title || '';
+            if (alt) result.colors.push(alt.trim());
+        });
+    }
 
-            # 控速避免被封
-            await page.wait_for_timeout(1500)
+    // === 尺寸 ===
+    document.querySelectorAll('[class*="size"] button, [class*="size"] label, [class*="Size"] button, [class*="Size"] label, ' +
+        '[data-option="size"] button, [data-option="size"] label').forEach(el => {
+        const t = text(el);
+        if (t && t.length < 10 && /^(XXS|XS|S|M|L|XL|2XL|3XL|ONE SIZE|FREE|\\d+)$/i.test(t)) result.sizes.push(t);
+    });
+
+    // === 圖片：商品圖容器 → 備援才看所有 img ===
+    const excludePatterns = ['icon', 'logo', 'svg', 'pixel', 'tracking', 'spacer', 'blank', 'globale', 'banner', 'badge', 'flag', 'payment'];
+    const seenSrc = new Set();
+    const imgSrc = img => {
+        let src = img.src || img.dataset.src || img.dataset.lazySrc || img.dataset.highresSrc || '';
+        if (!src && img.srcset) src = img.srcset.split(',')[0].trim().split(' ')[0];
+        return src;
+    };
+    const addImage = src => {
+        if (!src || seenSrc.has(src) || src.startsWith('data:') || !src.startsWith('http')) return;
+        const lower = src.toLowerCase();
+        if (excludePatterns.some(p => lower.includes(p))) return;
+        seenSrc.add(src);
+        result.images.push(src);
+    };
+    for (const sel of ['.primary-images img', '.pdp-images img', '.product-detail img', '.pdp-main img', '.product-images img',
+            '.product-gallery img', '[class*="carousel"] img', '[class*="slider"] img', '[class*="gallery"] img', '[class*="product"] img']) {
+        document.querySelectorAll(sel).forEach(img => addImage(imgSrc(img)));
+        if (result.images.length >= 3) break;
+    }
+    const allImgs = (result.images.length === 0 || debug) ? Array.from(document.querySelectorAll('img')) : [];
+    if (result.images.length === 0) {
+        allImgs.forEach(img => {
+            if (img.naturalWidth > 200 || img.width > 200 || !img.complete) addImage(img.src || img.dataset.src || '');
+        });
+    }
+    if (debug) {
+        result.debug_all_imgs = allImgs.map(img => ({
+            src: (img.src || img.dataset.src || '').substring(0, 150), w: img.naturalWidth || img.width || 0,
+            cls: (img.className || '').substring(0, 50), parent: (img.parentElement?.className || '').substring(0, 50)
+        })).filter(i => i.src.startsWith('http'));
+    }
 
-        await browser.close()
+    // === 說明文（SFCC: #collapsible-description-1）===
+    const descEl = first(['#collapsible-description-1 p', '#collapsible-description-1', '.value.content p', '.value.content',
+        '.product-description .description-text', '.product-description .content', '.product-description p',
+        '.product-description', '.description-and-detail .description', '.pdp-description'], el => el.innerText.trim().length > 20);
+    if (descEl) result.description = descEl.innerText.trim();
+
+    // === ITEM ID / MATERIAL / MADE IN：先看商品詳情區塊，找不到才讀整頁文字（只讀一次）===
+    const detailEl = document.querySelector('.product-detail, .pdp-main, main');
+    let pageText = detailEl ? detailEl.innerText : '';
+    if (!/ITEM\\s*ID/i.test(pageText)) pageText = document.body.innerText;
+    const itemIdMatch = pageText.match(/ITEM\\s*ID[：:]\\s*([A-Z0-9]+)/i);
+    if (itemIdMatch) result.item_id = itemIdMatch[1];
+    const materialMatch = pageText.match(/MATERIAL[：:]\\s*([^\\n]+)/i);
+    if (materialMatch) result.material = materialMatch[1].trim();
+    const madeInMatch = pageText.match(/MADE\\s+IN\\s+([A-Z]+)/i);
+    if (madeInMatch) result.made_in = madeInMatch[1].trim();
+    if (!result.description) {
+        const itemIdIdx = pageText.indexOf('ITEM ID');
+        if (itemIdIdx > 0) {
+            const lines = pageText.substring(Math.max(0, itemIdIdx - 500), itemIdIdx).trim().split('\\n').filter(l => l.trim().length > 10);
+            if (lines.length > 0) result.description = lines.join('\\n');
+        }
+    }
 
-    print(f"\n[完成] 共成功爬取 {len(products)} 個商品")
-    return products
+    // === 是否可購買 ===
+    if (document.querySelector('[class*="sold-out"], [class*="soldout"], .notify-me')) result.available = false;
+    for (const btn of document.querySelectorAll('.add-to-cart, .notify-me, button, a.btn, [role="button"]')) {
+        const txt = text(btn).toUpperCase();
+        if (txt.includes('NOTIFY') || txt.includes('SOLD OUT') || txt.includes('品切れ')) {
+            result.available = false;
+            if (txt.includes('NOTIFY')) result.notify_me = true;
+            break;
+        }
+    }
+    return result;
+}'''
 
 
 async def scrape_product_page(page, url, item_id):
     """解析單一商品頁面"""
     try:
-        await page.goto(url, wait_until='networkidle', timeout=30000)
-    except Exception as e:
-        try:
-            # networkidle timeout 但頁面可能已載入
-            await page.wait_for_timeout(3000)
-        except:
-            return None
+        await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+    except Exception:
+        return None
+    try:
+        # 只等需要的元素：商品名稱與價格
+        await page.wait_for_selector('h1', timeout=10000)
+        await page.wait_for_selector('.prices .price .value, .sales .value, [class*="price"]', timeout=5000)
+    except Exception:
+        pass  # 找不到時照樣解析，由後面的 title 檢查判斷失敗
 
     # 每次進入商品頁都清除可能的彈窗
     try:
@@ -428,243 +1312,22 @@ async def scrape_product_page(page, url, item_id):
         pass
 
     try:
-        data = await page.evaluate('''() => {
-            const result = {
-                title: '',
-                description: '',
-                price_text: '',
-                colors: [],
-                sizes: [],
-                images: [],
-                item_id: '',
-                material: '',
-                made_in: '',
-                available: true,
-                url: window.location.href
-            };
-
-            // === 商品名稱 ===
-            // 嘗試多種 selector
-            const titleSelectors = [
-                'h1', '.product-title', '.product-name',
-                '[class*="product"] h1', '[class*="item"] h1',
-                'h2.product', 'main h1'
-            ];
-            for (const sel of titleSelectors) {
-                const el = document.querySelector(sel);
-                if (el && el.textContent.trim().length > 2) {
-                    result.title = el.textContent.trim();
-                    break;
-                }
-            }
-
-            // === 價格（取得日圓價格）===
-            const priceSelectors = [
-                '.prices .price .value', '.sales .value',  // SFCC 常見
-                '[class*="price"]', '.product-price', '.price',
-                '[data-price]'
-            ];
-            const allElements = document.querySelectorAll('*');
-            for (const el of allElements) {
-                const text = el.textContent.trim();
-                // 找包含 ¥ 或 NT$ 的元素
-                if (text.match(/[¥￥]\\s*[\\d,]+/) && el.children.length < 3) {
-                    result.price_text = text;
-                    break;
-                }
-                if (text.match(/NT\\$\\s*[\\d,]+/) && el.children.length < 3) {
-                    result.price_text = text;
-                    break;
-                }
-            }
-
-            // === 顏色 ===
-            const colorLabels = document.querySelectorAll(
-                '[class*="color"] label, [class*="color"] span, ' +
-                '[class*="Color"] span, [data-option="color"] span'
-            );
-            colorLabels.forEach(el => {
-                const text = el.textContent.trim();
-                if (text && text.length < 30 && !text.match(/^(Color|色|カラー)$/i)) {
-                    result.colors.push(text);
-                }
-            });
-            // 也從圖片 alt 嘗試
-            if (result.colors.length === 0) {
-                document.querySelectorAll('[class*="color"] img, [class*="swatch"] img').forEach(img => {
-                    const alt = img.alt || img.title || '';
-                    if (alt) result.colors.push(alt.trim());
-                });
-            }
-
-            // === 尺寸 ===
-            const sizeElements = document.querySelectorAll(
-                '[class*="size"] button, [class*="size"] label, ' +
-                '[class*="Size"] button, [class*="Size"] label, ' +
-                '[data-option="size"] button, [data-option="size"] label'
-            );
-            sizeElements.forEach(el => {
-                const text = el.textContent.trim();
-                if (text && text.length < 10 && text.match(/^(XXS|XS|S|M|L|XL|2XL|3XL|ONE SIZE|FREE|\\d+)$/i)) {
-                    result.sizes.push(text);
-                }
-            });
-
-            // === 圖片 ===
-            // SFCC/Demandware 常見的商品圖片容器
-            const imageSelectors = [
-                '.product-detail img', '.pdp-main img',
-                '.product-images img', '.product-gallery img',
-                '[class*="carousel"] img', '[class*="slider"] img',
-                '[class*="gallery"] img', '[class*="product"] img',
-                '.primary-images img', '.pdp-images img',
-                'main img[src]', '.container img[src]'
-            ];
-            const seenSrc = new Set();
-            // 排除的關鍵字
-            const excludePatterns = ['icon', 'logo', 'svg', 'pixel', 'tracking', 'spacer', 'blank', 'globale', 'banner', 'badge', 'flag', 'payment'];
-            
-            for (const sel of imageSelectors) {
-                document.querySelectorAll(sel).forEach(img => {
-                    let src = img.src || img.dataset.src || img.dataset.lazySrc || img.dataset.highresSrc || '';
-                    // 也檢查 srcset
-                    if (!src && img.srcset) {
-                        const firstSrc = img.srcset.split(',')[0].trim().split(' ')[0];
-                        if (firstSrc) src = firstSrc;
-                    }
-                    if (src && !seenSrc.has(src)) {
-                        const srcLower = src.toLowerCase();
-                        const isExcluded = excludePatterns.some(p => srcLower.includes(p));
-                        // 排除太小的圖（通常是 icon）和 data: URI
-                        if (!isExcluded && !src.startsWith('data:') && src.startsWith('http')) {
-                            seenSrc.add(src);
-                            result.images.push(src);
-                        }
-                    }
-                });
-                if (result.images.length >= 3) break;  // 找到 3+ 張就夠了
-            }
-            // Fallback: 拿所有大圖
-            if (result.images.length === 0) {
-                document.querySelectorAll('img').forEach(img => {
-                    const src = img.src || img.dataset.src || '';
-                    if (src && src.startsWith('http') && !seenSrc.has(src)) {
-                        const srcLower = src.toLowerCase();
-                        const isExcluded = excludePatterns.some(p => srcLower.includes(p));
-                        if (!isExcluded && (img.naturalWidth > 200 || img.width > 200 || !img.complete)) {
-                            seenSrc.add(src);
-                            result.images.push(src);
-                        }
-                    }
-                });
-            }
-            
-            // Debug: 記錄所有 img src 供診斷
-            result.debug_all_imgs = [];
-            document.querySelectorAll('img').forEach(img => {
-                const src = img.src || img.dataset.src || '';
-                if (src && src.startsWith('http')) {
-                    result.debug_all_imgs.push({
-                        src: src.substring(0, 150),
-                        w: img.naturalWidth || img.width || 0,
-                        cls: (img.className || '').substring(0, 50),
-                        parent: (img.parentElement?.className || '').substring(0, 50)
-                    });
-                }
-            });
-
-            // === 商品說明 / ITEM ID / MATERIAL ===
-            const bodyText = document.body.innerText;
-            const itemIdMatch = bodyText.match(/ITEM\\s*ID[：:]\\s*([A-Z0-9]+)/i);
-            if (itemIdMatch) result.item_id = itemIdMatch[1];
-
-            const materialMatch = bodyText.match(/MATERIAL[：:]\\s*([^\\n]+)/i);
-            if (materialMatch) result.material = materialMatch[1].trim();
-
-            const madeInMatch = bodyText.match(/MADE\\s+IN\\s+([A-Z]+)/i);
-            if (madeInMatch) result.made_in = madeInMatch[1].trim();
-
-            // 商品說明（取 product description 區塊）
-            // SFCC 的說明文在 #collapsible-description-1 裡
-            const descSelectors = [
-                '#collapsible-description-1 p',
-                '#collapsible-description-1',
-                '.value.content p',
-                '.value.content',
-                '.product-description .description-text',
-                '.product-description .content',
-                '.product-description p',
-                '.product-description',
-                '.description-and-detail .description',
-                '.pdp-description',
-            ];
-            for (const sel of descSelectors) {
-                const el = document.querySelector(sel);
-                if (el) {
-                    const text = el.innerText.trim();
-                    if (text.length > 20) {
-                        result.description = text;
-                        break;
-                    }
-                }
-            }
-            // Fallback: 從頁面文字中找 ITEM ID 附近的說明文
-            if (!result.description) {
-                const bodyText = document.body.innerText;
-                // 找 ITEM ID 前面的段落作為說明
-                const itemIdIdx = bodyText.indexOf('ITEM ID');
-                if (itemIdIdx > 0) {
-                    // 往前找一段文字
-                    const beforeText = bodyText.substring(Math.max(0, itemIdIdx - 500), itemIdIdx).trim();
-                    const lines = beforeText.split('\\n').filter(l => l.trim().length > 10);
-                    if (lines.length > 0) {
-                        result.description = lines.join('\\n');
-                    }
-                }
-            }
-            // Debug
-            result.debug_desc_length = (result.description || '').length;
-            result.debug_desc_preview = (result.description || '').substring(0, 200);
-
-            // === 是否可購買 ===
-            const soldOutEl = document.querySelector(
-                '[class*="sold-out"], [class*="soldout"], .notify-me'
-            );
-            if (soldOutEl) {
-                result.available = false;
-            }
-            // 檢查按鈕文字判斷是否為 NOTIFY ME / SOLD OUT
-            const allButtons = document.querySelectorAll('button, a.btn, [role="button"]');
-            for (const btn of allButtons) {
-                const txt = btn.textContent.trim().toUpperCase();
-                if (txt.includes('NOTIFY') || txt.includes('SOLD OUT') || txt.includes('品切れ')) {
-                    result.available = false;
-                    if (txt.includes('NOTIFY')) result.notify_me = true;
-                    break;
-                }
-            }
-
-            return result;
-        }''')
+        data = await page.evaluate(PRODUCT_EXTRACT_JS, HUMANMADE_DEBUG)
 
         if not data or not data.get('title'):
             return None
 
-        # Debug: 印出圖片診斷資訊
-        debug_imgs = data.pop('debug_all_imgs', [])
-        debug_desc = data.pop('debug_desc_preview', '')
-        debug_desc_len = data.pop('debug_desc_length', 0)
-        
-        print(f"  [DESC] {item_id}: 說明文 {debug_desc_len} 字 - {debug_desc[:100]}")
-        
-        if len(data.get('images', [])) == 0:
-            print(f"  [IMG DEBUG] {item_id}: 沒抓到商品圖片！頁面上所有 img:")
-            for di in debug_imgs[:15]:
-                print(f"    {di['src']} (w={di['w']}, class={di['cls']}, parent={di['parent']})")
-        else:
-            print(f"  [IMG] {item_id}: 抓到 {len(data.get('images', []))} 張圖片")
-            for img in data['images'][:3]:
-                print(f"    {img[:120]}")
+        if HUMANMADE_DEBUG:
+            debug_imgs = data.pop('debug_all_imgs', [])
+            print(f"  [DESC] {item_id}: 說明文 {len(data.get('description', ''))} 字 - {data.get('description', '')[:100]}")
+            if len(data.get('images', [])) == 0:
+                print(f"  [IMG DEBUG] {item_id}: 沒抓到商品圖片！頁面上所有 img:")
+                for di in debug_imgs[:15]:
+                    print(f"    {di['src']} (w={di['w']}, class={di['cls']}, parent={di['parent']})")
+            else:
+                print(f"  [IMG] {item_id}: 抓到 {len(data.get('images', []))} 張圖片")
+                for img in data['images'][:3]:
+                    print(f"    {img[:120]}")
 
         # 解析價格（從日圓或台幣文字）
         price_jpy = 0
@@ -704,9 +1367,9 @@ def get_collection_products_with_details(collection_id):
         return products_map
 
     query = """
-    query($collectionId: ID!, $cursor: String) {
+    query($collectionId: ID!, $first: Int!, $cursor: String) {
       collection(id: $collectionId) {
-        products(first: 50, after: $cursor) {
+        products(first: $first, after: $cursor) {
           pageInfo { hasNextPage endCursor }
           edges {
             node {
@@ -726,43 +1389,27 @@ def get_collection_products_with_details(collection_id):
       }
     }
     """
-    cursor = None
-    while True:
-        data = shopify_graphql(query, {
-            "collectionId": f"gid://shopify/Collection/{collection_id}",
-            "cursor": cursor
-        })
-        collection = data.get('data', {}).get('collection')
-        if not collection:
-            break
-        products_data = collection.get('products', {})
-        for edge in products_data.get('edges', []):
-            node = edge['node']
-            product_id = int(node['id'].split('/')[-1])
-            handle = node['handle']
-            variants_info = []
-            for ve in node.get('variants', {}).get('edges', []):
-                vn = ve['node']
-                variant_id = int(vn['id'].split('/')[-1])
-                cost = None
-                uc = (vn.get('inventoryItem') or {}).get('unitCost')
-                if uc:
-                    cost = uc.get('amount')
-                opts = vn.get('selectedOptions', [])
-                variants_info.append({
-                    'variant_id': variant_id, 'price': vn.get('price'), 'cost': cost,
-                    'sku': vn.get('sku'),
-                    'option1': opts[0]['value'] if len(opts) > 0 else '',
-                    'option2': opts[1]['value'] if len(opts) > 1 else '',
-                    'option3': opts[2]['value'] if len(opts) > 2 else ''
-                })
-            products_map[handle] = {'product_id': product_id, 'variants': variants_info}
-        page_info = products_data.get('pageInfo', {})
-        if page_info.get('hasNextPage'):
-            cursor = page_info['endCursor']
-            time.sleep(0.5)
-        else:
-            break
+    for node in paginate_graphql(query, ('collection', 'products'),
+                                 {"collectionId": f"gid://shopify/Collection/{collection_id}"}, page_size=50):
+        product_id = int(node['id'].split('/')[-1])
+        handle = node['handle']
+        variants_info = []
+        for ve in node.get('variants', {}).get('edges', []):
+            vn = ve['node']
+            variant_id = int(vn['id'].split('/')[-1])
+            cost = None
+            uc = (vn.get('inventoryItem') or {}).get('unitCost')
+            if uc:
+                cost = uc.get('amount')
+            opts = vn.get('selectedOptions', [])
+            variants_info.append({
+                'variant_id': variant_id, 'price': vn.get('price'), 'cost': cost,
+                'sku': vn.get('sku'),
+                'option1': opts[0]['value'] if len(opts) > 0 else '',
+                'option2': opts[1]['value'] if len(opts) > 1 else '',
+                'option3': opts[2]['value'] if len(opts) > 2 else ''
+            })
+        products_map[handle] = {'product_id': product_id, 'variants': variants_info}
     print(f"[INFO] Collection 內有 {len(products_map)} 個商品")
     return products_map
 
@@ -775,6 +1422,116 @@ def delete_product(product_id):
     return False
 
 
+DELETE_BATCH_SIZE = 10  # 每個 GraphQL request 合併的 productDelete 數（alias）
+DELETE_WORKERS = int(os.environ.get('HUMANMADE_DELETE_WORKERS', '3'))  # 同時送出的批次數
+
+
+def _delete_batch(product_ids):
+    """一批 productDelete 以 alias 合併成一個 GraphQL request，回傳成功刪除的 product_id list"""
+    params = ', '.join(f"$in{i}: ProductDeleteInput!" for i in range(len(product_ids)))
+    fields = ' '.join(f"d{i}: productDelete(input: $in{i}) {{ deletedProductId userErrors {{ field message }} }}"
+                      for i in range(len(product_ids)))
+    data = shopify_graphql(f"mutation({params}) {{ {fields} }}",
+                           {f"in{i}": {"id": f"gid://shopify/Product/{pid}"} for i, pid in enumerate(product_ids)})
+    result = data.get('data') or {}
+    deleted = []
+    for i, pid in enumerate(product_ids):
+        r = result.get(f"d{i}") or {}
+        if r.get('deletedProductId'):
+            deleted.append(pid)
+        else:
+            scrape_status['errors'].append({'error': f"刪除 {pid} 失敗: {r.get('userErrors') or data.get('errors')}"})
+    return deleted
+
+
+def delete_products(product_ids):
+    """
+    批次刪除：每 DELETE_BATCH_SIZE 個合併成一個 request，DELETE_WORKERS 個批次並行
+    （shopify_graphql 遇到 Throttled / 429 會自行等待重試）
+    進度寫入 scrape_status['deleted']，回傳成功刪除數
+    """
+    batches = [product_ids[i:i + DELETE_BATCH_SIZE] for i in range(0, len(product_ids), DELETE_BATCH_SIZE)]
+    deleted = 0
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as pool:
+        for future in as_completed([pool.submit(_delete_batch, batch) for batch in batches]):
+            try:
+                ids = future.result()
+            except Exception as e:
+                scrape_status['errors'].append({'error': f'刪除失敗: {e}'})
+                continue
+            deleted += len(ids)
+            increment_status('deleted', len(ids))
+            update_status(current_product=f"刪除中 [{deleted}/{len(product_ids)}]")
+            for pid in ids:
+                print(f"[已刪除] Product ID: {pid}")
+    return deleted
+
+
+UPDATE_BATCH_SIZE = 10  # 每個 GraphQL request 合併的 productVariantsBulkUpdate 數（alias，一個商品一個）
+UPDATE_WORKERS = int(os.environ.get('HUMANMADE_UPDATE_WORKERS', '3'))  # 同時送出的批次數
+
+
+def variant_price_changes(product_data, existing):
+    """
+    比對爬取的 price_jpy 與 Shopify 現有 variant 的售價 / 成本（unitCost）
+    回傳需要更新的 ProductVariantsBulkInput list（只含有差異的欄位；無差異回傳空 list）
+    """
+    price_jpy = product_data.get('price_jpy', 0)
+    selling_price = calculate_selling_price(price_jpy, DEFAULT_WEIGHT)
+    changes = []
+    for v in existing['variants']:
+        change = {}
+        if v.get('price') is None or abs(float(v['price']) - selling_price) >= 0.01:
+            change['price'] = f"{selling_price:.2f}"
+        if v.get('cost') is None or abs(float(v['cost']) - price_jpy) >= 0.01:
+            change['inventoryItem'] = {'cost': f"{price_jpy:.2f}"}
+        if change:
+            changes.append({'id': f"gid://shopify/ProductVariant/{v['variant_id']}", **change})
+    return changes
+
+
+def _update_batch(updates):
+    """一批 productVariantsBulkUpdate 以 alias 合併成一個 GraphQL request，回傳成功更新的 product_id list"""
+    params = ', '.join(f"$p{i}: ID!, $v{i}: [ProductVariantsBulkInput!]!" for i in range(len(updates)))
+    fields = ' '.join(f"u{i}: productVariantsBulkUpdate(productId: $p{i}, variants: $v{i}) "
+                      f"{{ productVariants {{ id }} userErrors {{ field message }} }}" for i in range(len(updates)))
+    variables = {}
+    for i, (pid, variants) in enumerate(updates):
+        variables[f"p{i}"] = f"gid://shopify/Product/{pid}"
+        variables[f"v{i}"] = variants
+    data = shopify_graphql(f"mutation({params}) {{ {fields} }}", variables)
+    result = data.get('data') or {}
+    updated = []
+    for i, (pid, _) in enumerate(updates):
+        r = result.get(f"u{i}") or {}
+        if r.get('productVariants') is not None and not r.get('userErrors'):
+            updated.append(pid)
+        else:
+            scrape_status['errors'].append({'error': f"更新價格 {pid} 失敗: {r.get('userErrors') or data.get('errors')}"})
+    return updated
+
+
+def update_variant_prices(updates):
+    """
+    批次更新已上架商品的售價 / 成本：updates = [(product_id, variants input)]
+    每 UPDATE_BATCH_SIZE 個商品合併成一個 request，UPDATE_WORKERS 個批次並行
+    進度寫入 scrape_status['price_updated']，回傳成功更新的商品數
+    """
+    batches = [updates[i:i + UPDATE_BATCH_SIZE] for i in range(0, len(updates), UPDATE_BATCH_SIZE)]
+    updated = 0
+    with ThreadPoolExecutor(max_workers=UPDATE_WORKERS) as pool:
+        for future in as_completed([pool.submit(_update_batch, batch) for batch in batches]):
+            try:
+                ids = future.result()
+            except Exception as e:
+                scrape_status['errors'].append({'error': f'更新價格失敗: {e}'})
+                continue
+            updated += len(ids)
+            increment_status('price_updated', len(ids))
+            update_status(current_product=f"更新價格中 [{updated}/{len(updates)}]")
+    return updated
+
+
 def publish_to_channels(resource_type, resource_id):
     """發佈到所有銷售頻道"""
     data = shopify_graphql('{ publications(first:20){ edges{ node{ id name }}}}')
@@ -972,40 +1729,52 @@ def increment_status(key, value=1):
 
 # ========== 主流程 ==========
 
-def run_scrape():
+def reset_status():
     global scrape_status
-    try:
-        with status_lock:
-            scrape_status = {
-                "running": True, "progress": 0, "total": 0, "current_product": "",
-                "products": [], "errors": [], "uploaded": 0, "skipped": 0,
-                "skipped_exists": 0, "filtered_by_price": 0, "out_of_stock": 0,
-                "deleted": 0, "price_updated": 0
-            }
+    with status_lock:
+        scrape_status = {
+            "running": True, "progress": 0, "total": 0, "current_product": "",
+            "products": RingLog(), "errors": RingLog(), "uploaded": 0, "skipped": 0,
+            "skipped_exists": 0, "filtered_by_price": 0, "out_of_stock": 0,
+            "deleted": 0, "price_updated": 0
+        }
+
 
+def run_scrape(incremental=INCREMENTAL_SCRAPE):
+    """由 start_run 啟動（scrape_status 已由 reset_status 重置）；incremental=True 只爬新商品或有變動的商品"""
+    try:
         # === Step 1: Shopify Collection 設定 ===
         update_status(current_product="設定 Shopify Collection...")
         collection_id = get_or_create_collection("Human Made")
 
         update_status(current_product="取得 Collection 內現有商品（GraphQL）...")
         collection_products_map = get_collection_products_with_details(collection_id)
-        existing_handles = set(collection_products_map.keys())
+        existing_handles = {h.lower(): h for h in collection_products_map}  # Shopify handle 一律小寫比對
 
         # === Step 2: Playwright 爬取所有商品 ===
         update_status(current_product="啟動瀏覽器爬取 humanmade.jp...")
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        product_list = loop.run_until_complete(scrape_all_products_playwright())
-        loop.close()
+        known = None
+        if incremental:
+            known = {}
+            for h, info in collection_products_map.items():
+                costs = [float(v['cost']) for v in info['variants'] if v.get('cost') is not None]
+                known[h.lower()] = (h, costs[0] if costs else None)
+        product_list, unchanged = browser_service.run(scrape_all_products_playwright(known))
+
+        # 列表價格未變動的已上架商品：視為仍有庫存，不重新處理
+        in_stock_handles = set(unchanged)
+        increment_status('skipped_exists', len(unchanged))
+        increment_status('skipped', len(unchanged))
 
         # === 安全機制：來源商品太少則跳過刪除 ===
-        source_too_few = len(product_list) < MIN_PRODUCTS_FOR_CLEANUP
+        source_count = len(product_list) + len(unchanged)
+        source_too_few = source_count < MIN_PRODUCTS_FOR_CLEANUP
         if source_too_few:
-            print(f"[⚠️ 安全機制] 來源僅 {len(product_list)} 個商品（門檻 {MIN_PRODUCTS_FOR_CLEANUP}），將跳過刪除")
+            print(f"[⚠️ 安全機制] 來源僅 {source_count} 個商品（門檻 {MIN_PRODUCTS_FOR_CLEANUP}），將跳過刪除")
 
         update_status(total=len(product_list))
-        in_stock_handles = set()
+        price_updates = []  # [(product_id, variants input)]
 
         # === Step 3: 上架/更新商品 ===
         for idx, product in enumerate(product_list):
@@ -1021,10 +1790,19 @@ def run_scrape():
             if is_available:
                 in_stock_handles.add(my_handle)
 
-            # 已存在的商品 → 跳過（未來可加價格更新）
-            if my_handle in existing_handles:
-                increment_status('skipped_exists')
-                increment_status('skipped')
+            # 已存在的商品 → 售價 / 成本有差異才排入批次更新，其餘跳過（售完的交給 Step 4 清理）
+            if my_handle.lower() in existing_handles:
+                existing = collection_products_map.get(existing_handles[my_handle.lower()])
+                if is_available:
+                    in_stock_handles.add(existing_handles[my_handle.lower()])
+                changes = variant_price_changes(product, existing) \
+                    if existing and is_available and price_jpy >= MIN_PRICE else []
+                if changes:
+                    price_updates.append((existing['product_id'], changes))
+                    print(f"  [價格變動] {handle}: ¥{price_jpy}（{len(changes)} 個 variant）")
+                else:
+                    increment_status('skipped_exists')
+                    increment_status('skipped')
                 continue
 
             # 價格過濾
@@ -1043,50 +1821,50 @@ def run_scrape():
             result = upload_to_shopify(product, collection_id)
             if result['success']:
                 in_stock_handles.add(my_handle)
-                existing_handles.add(my_handle)
+                existing_handles[my_handle.lower()] = my_handle
                 increment_status('uploaded')
-                with status_lock:
-                    scrape_status['products'].append({
-                        'handle': handle,
-                        'title': result.get('translated', {}).get('title', title),
-                        'original_title': title,
-                        'variants_count': result.get('variants_count', 0),
-                        'status': 'success'
-                    })
+                scrape_status['products'].append({
+                    'handle': handle,
+                    'title': result.get('translated', {}).get('title', title),
+                    'original_title': title,
+                    'variants_count': result.get('variants_count', 0),
+                    'status': 'success'
+                })
             else:
                 error_msg = result.get('error', '')[:300]
                 print(f"  [上架失敗] {handle}: {error_msg}")
-                with status_lock:
-                    scrape_status['errors'].append({
-                        'handle': handle, 'title': title, 'error': error_msg
-                    })
+                scrape_status['errors'].append({
+                    'handle': handle, 'title': title, 'error': error_msg
+                })
                 # 如果是 429 rate limit，多等一下
                 if '429' in str(error_msg) or 'throttle' in str(error_msg).lower():
                     print(f"  [RATE LIMIT] 等待 10 秒...")
                     time.sleep(10)
             time.sleep(1.0)  # 每個商品間隔 1 秒（翻譯 + Shopify API）
 
+        # === Step 3b: 已上架商品價格 / 成本批次更新 ===
+        if price_updates:
+            update_status(current_product=f"更新 {len(price_updates)} 個商品價格...")
+            print(f"[價格更新] {len(price_updates)} 個商品")
+            update_variant_prices(price_updates)
+
         # === Step 4: 清理（含安全機制）===
         if source_too_few:
             update_status(current_product="⚠️ 來源商品過少，跳過清理以避免誤刪")
             print(f"[安全機制] 跳過刪除步驟")
         else:
-            update_status(current_product="清理下架/缺貨商品...")
-            for my_handle, product_info in collection_products_map.items():
-                if my_handle not in in_stock_handles:
-                    update_status(current_product=f"刪除: {my_handle}")
-                    print(f"[刪除] {my_handle} / ID: {product_info['product_id']}")
-                    if delete_product(product_info['product_id']):
-                        increment_status('deleted')
-                    time.sleep(0.5)
+            to_delete = [info['product_id'] for my_handle, info in collection_products_map.items()
+                         if my_handle not in in_stock_handles]
+            update_status(current_product=f"清理下架/缺貨商品 {len(to_delete)} 個...")
+            print(f"[刪除] {len(to_delete)} 個下架/缺貨商品")
+            delete_products(to_delete)
 
         update_status(current_product="完成！")
 
     except Exception as e:
         import traceback
         traceback.print_exc()
-        with status_lock:
-            scrape_status['errors'].append({'error': str(e)})
+        scrape_status['errors'].append({'error': str(e)})
     finally:
         with status_lock:
             scrape_status['running'] = False
@@ -1143,24 +1921,168 @@ function clearLog(){{document.getElementById('logArea').innerHTML=''}}
 async function testShopify(){{log('測試 Shopify 連線...');try{{const r=await fetch('/api/test-shopify');const d=await r.json();if(d.success)log('✓ 連線成功！商店: '+d.shop.name,'success');else log('✗ 連線失敗: '+d.error,'error')}}catch(e){{log('✗ '+e.message,'error')}}}}
 async function testScrape(){{log('測試爬取 humanmade.jp（前 3 個商品）...');log('⏳ 啟動瀏覽器中，可能需要 30-60 秒...','warn');try{{const r=await fetch('/api/test-scrape',{{timeout:120000}});const d=await r.json();if(d.success){{log('✓ 測試成功！找到 '+d.total_links+' 個商品連結','success');(d.samples||[]).forEach(s=>log('  - '+s.item_id+': '+s.title+' ¥'+s.price_jpy))}}else log('✗ 測試失敗: '+(d.error||'未知錯誤'),'error')}}catch(e){{log('✗ '+e.message,'error')}}}}
 async function testUpload(){{log('🧪 測試上架（爬取前 3 個商品 + 上架到 Shopify）...');log('⏳ 啟動瀏覽器 + 翻譯 + 上架，約需 2-3 分鐘...','warn');try{{const r=await fetch('/api/test-upload',{{method:'POST'}});const d=await r.json();if(d.success){{log('========== 測試上架結果 ==========','success');(d.results||[]).forEach(s=>{{if(s.status==='uploaded')log('✓ '+s.item_id+': '+s.title+' ('+s.variants_count+' variants)','success');else log('✗ '+s.item_id+': '+s.status+' '+(s.error||''),'error')}})}}else log('✗ 測試失敗: '+(d.error||'未知錯誤'),'error')}}catch(e){{log('✗ '+e.message,'error')}}}}
-async function startScrape(){{clearLog();log('開始爬取流程（Playwright v3.0）...');log('⏳ 啟動 Chromium 瀏覽器...','warn');document.getElementById('startBtn').disabled=true;document.getElementById('progressSection').style.display='block';try{{const r=await fetch('/api/start',{{method:'POST'}});const d=await r.json();if(!d.success){{log('✗ '+d.error,'error');document.getElementById('startBtn').disabled=false;return}}log('✓ 爬取任務已啟動','success');pollInterval=setInterval(pollStatus,2000)}}catch(e){{log('✗ '+e.message,'error');document.getElementById('startBtn').disabled=false}}}}
-async function pollStatus(){{try{{const r=await fetch('/api/status');const d=await r.json();const p=d.total>0?(d.progress/d.total*100):0;document.getElementById('progressFill').style.width=p+'%';document.getElementById('statusText').textContent=d.current_product+' ('+d.progress+'/'+d.total+')';document.getElementById('uploadedCount').textContent=d.uploaded;document.getElementById('priceUpdatedCount').textContent=d.price_updated||0;document.getElementById('skippedCount').textContent=d.skipped;document.getElementById('filteredCount').textContent=d.filtered_by_price||0;document.getElementById('outOfStockCount').textContent=d.out_of_stock||0;document.getElementById('deletedCount').textContent=d.deleted||0;document.getElementById('errorCount').textContent=d.errors.length;if(!d.running&&d.progress>0){{clearInterval(pollInterval);document.getElementById('startBtn').disabled=false;log('========== 爬取完成 ==========','success')}}}}catch(e){{}}}}
+async function startScrape(){{clearLog();log('開始爬取流程（Playwright v3.0）...');log('⏳ 啟動 Chromium 瀏覽器...','warn');document.getElementById('startBtn').disabled=true;document.getElementById('progressSection').style.display='block';try{{const r=await fetch('/api/start',{{method:'POST'}});const d=await r.json();if(!d.success){{log('✗ '+d.error,'error');document.getElementById('startBtn').disabled=false;return}}log('✓ 爬取任務已啟動','success');startEvents()}}catch(e){{log('✗ '+e.message,'error');document.getElementById('startBtn').disabled=false}}}}
+function renderStatus(d){{const p=d.total>0?(d.progress/d.total*100):0;document.getElementById('progressFill').style.width=p+'%';document.getElementById('statusText').textContent=d.current_product+' ('+d.progress+'/'+d.total+')';document.getElementById('uploadedCount').textContent=d.uploaded;document.getElementById('priceUpdatedCount').textContent=d.price_updated||0;document.getElementById('skippedCount').textContent=d.skipped;document.getElementById('filteredCount').textContent=d.filtered_by_price||0;document.getElementById('outOfStockCount').textContent=d.out_of_stock||0;document.getElementById('deletedCount').textContent=d.deleted||0;document.getElementById('errorCount').textContent=d.errors_total}}
+function finishRun(){{document.getElementById('startBtn').disabled=false;log('========== 爬取完成 ==========','success')}}
+async function pollStatus(){{try{{const r=await fetch('/api/status');const d=await r.json();renderStatus(d);if(!d.running&&d.progress>0){{clearInterval(pollInterval);finishRun()}}}}catch(e){{}}}}
+// SSE：只推送變動欄位與新錯誤；連不上（或連線已滿）改回輪詢
+function startEvents(){{if(!window.EventSource){{pollInterval=setInterval(pollStatus,2000);return}}const s={{}};let opened=false;const es=new EventSource('/api/events');es.onopen=()=>{{opened=true}};es.addEventListener('progress',ev=>{{const d=JSON.parse(ev.data);Object.assign(s,d.status);s.errors_total=d.errors_total;renderStatus(s);d.errors.forEach(e=>log('✗ '+(e.handle?e.handle+': ':'')+e.error,'error'))}});es.addEventListener('done',()=>{{es.close();finishRun()}});es.onerror=()=>{{if(!opened||es.readyState===EventSource.CLOSED){{es.close();pollInterval=setInterval(pollStatus,2000)}}}}}}
 </script></body></html>'''
 
 
+def status_snapshot():
+    """純量欄位 + 紀錄筆數 + 最近幾筆（回應大小與商品數無關）"""
+    with status_lock:
+        data = {k: v for k, v in scrape_status.items() if not isinstance(v, RingLog)}
+        products, errors = scrape_status['products'], scrape_status['errors']
+    data['products_total'] = products.total
+    data['errors_total'] = errors.total
+    data['recent_products'] = products.tail(STATUS_RECENT)
+    data['recent_errors'] = errors.tail(STATUS_RECENT)
+    data['browser'] = browser_service.stats()
+    return data
+
+
+def _log_page(key):
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    with status_lock:
+        log = scrape_status[key]
+    return jsonify(log.page(offset, limit))
+
+
+def lease_status():
+    """
+    本 process 沒有在執行時，回傳租約裡的狀態快照
+    （其他 worker 的執行中進度，或重啟前最後一次執行的結果）；沒有則回傳 None
+    """
+    lease = run_lease.current()
+    if _run_owner or not lease or lease['status'] is None:
+        return None
+    data = lease['status']
+    if lease['expired']:
+        # 執行中的 worker 已消失（超過 TTL 沒有心跳）
+        data['running'] = False
+        data['lease_expired'] = True
+    return data
+
+
+def shared_status():
+    return lease_status() or status_snapshot()
+
+
 @app.route('/api/status')
 def get_status():
-    with status_lock:
-        return jsonify(dict(scrape_status))
+    return jsonify(shared_status())
+
+
+@app.route('/api/status/products')
+def get_status_products():
+    return _log_page('products')
+
+
+@app.route('/api/status/errors')
+def get_status_errors():
+    return _log_page('errors')
+
+
+def _sse(event, data, event_id=''):
+    head = f"id: {event_id}\n" if event_id else ''
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+SNAPSHOT_RECORD_KEYS = ('products_total', 'errors_total', 'recent_products', 'recent_errors')
+
+
+def _lease_records(recent, total, cursor):
+    """從租約快照的最近幾筆取出 cursor 之後的新紀錄（總數比 cursor 小代表新的一輪執行 → 從頭）"""
+    if total < cursor:
+        cursor = 0
+    n = min(total - cursor, len(recent))
+    return (recent[-n:] if n > 0 else []), total
+
+
+def _event_stream(p_cur, e_cur):
+    """
+    每 SSE_INTERVAL 秒比對一次 scrape_status，只送有變動的欄位 + 新增的商品/錯誤紀錄
+    event id = "商品cursor-錯誤cursor"，斷線重連時由 Last-Event-ID 接續
+    本 process 沒在執行時改讀租約裡的快照（與 /api/status 相同），其他 worker 執行中不會誤送 done
+    """
+    products = errors = None
+    prev = {}
+    seen_running = False
+    started = last_sent = time.time()
+
+    while True:
+        now = time.time()
+        shared = lease_status()
+        if shared is not None:
+            snap = {k: v for k, v in shared.items() if k not in SNAPSHOT_RECORD_KEYS}
+            new_products, p_cur = _lease_records(shared.get('recent_products', []), shared.get('products_total', 0), p_cur)
+            new_errors, e_cur = _lease_records(shared.get('recent_errors', []), shared.get('errors_total', 0), e_cur)
+        else:
+            with status_lock:
+                snap = {k: v for k, v in scrape_status.items() if not isinstance(v, RingLog)}
+                # 新的一輪執行會換掉 RingLog → 從頭送
+                if scrape_status['products'] is not products or scrape_status['errors'] is not errors:
+                    if products is not None:
+                        p_cur = e_cur = 0
+                        prev = {}
+                    products, errors = scrape_status['products'], scrape_status['errors']
+            new_products, p_cur = products.since(p_cur)
+            new_errors, e_cur = errors.since(e_cur)
+        delta = {k: v for k, v in snap.items() if k not in prev or prev[k] != v}
+
+        if delta or new_products or new_errors:
+            yield _sse('progress', {
+                'status': delta,
+                'products': new_products,
+                'errors': new_errors,
+                'products_total': p_cur,
+                'errors_total': e_cur,
+            }, f"{p_cur}-{e_cur}")
+            prev = snap
+            last_sent = now
+        elif now - last_sent >= SSE_KEEPALIVE:
+            yield ": keep-alive\n\n"
+            last_sent = now
+
+        seen_running = seen_running or snap['running']
+        if not snap['running'] and (seen_running or now - started >= SSE_START_GRACE):
+            yield _sse('done', {'products_total': p_cur, 'errors_total': e_cur})
+            return
+        if now - started >= SSE_MAX_SECONDS:
+            return
+        time.sleep(SSE_INTERVAL)
+
+
+@app.route('/api/events')
+def api_events():
+    """SSE 進度推送（取代 /api/status 輪詢）；連線已滿回 503，前端改回輪詢"""
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({'error': 'SSE 連線已滿，請改用 /api/status'}), 503
+
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor', '')
+    try:
+        p_cur, e_cur = (int(x) for x in cursor.split('-', 1))
+    except ValueError:
+        p_cur = e_cur = 0
+
+    resp = Response(_event_stream(p_cur, e_cur), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    resp.call_on_close(_sse_slots.release)
+    return resp
 
 
 @app.route('/api/start', methods=['GET', 'POST'])
 def api_start():
-    if scrape_status['running']:
-        return jsonify({'success': False, 'error': '爬取正在進行中'})
     if not load_shopify_token():
         return jsonify({'success': False, 'error': '環境變數未設定'})
-    threading.Thread(target=run_scrape, daemon=True).start()
+    incremental = INCREMENTAL_SCRAPE and request.args.get('full') != '1'
+    if not start_run('start', run_scrape, incremental, on_start=reset_status):
+        return jsonify({'success': False, 'error': '爬取正在進行中'})
     return jsonify({'success': True, 'message': 'Human Made v3.0 爬蟲已啟動'})
 
 
@@ -1176,12 +2098,12 @@ def api_cron():
     if req_token != cron_token:
         return jsonify({'success': False, 'error': '驗證失敗'}), 403
 
-    if scrape_status['running']:
-        return jsonify({'success': False, 'error': '爬取正在進行中'})
     if not load_shopify_token():
         return jsonify({'success': False, 'error': '環境變數未設定'})
+    incremental = INCREMENTAL_SCRAPE and request.args.get('full') != '1'
+    if not start_run('cron', run_scrape, incremental, on_start=reset_status):
+        return jsonify({'success': False, 'error': '爬取正在進行中'})
 
-    threading.Thread(target=run_scrape, daemon=True).start()
     print(f"[CRON] 定時爬取已觸發")
     return jsonify({'success': True, 'message': 'Cron 觸發成功', 'time': time.strftime('%Y-%m-%d %H:%M:%S')})
 
@@ -1200,23 +2122,14 @@ def test_shopify():
 def test_scrape():
     """測試爬取（只爬前 3 個商品）"""
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
         async def test():
-            from playwright.async_api import async_playwright
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox', '--disable-dev-shm-usage']
-                )
-                context = await browser.new_context(
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    locale='ja-JP'
-                )
+            async with browser_service.lease() as context:
                 page = await context.new_page()
-                await page.goto(ALL_ITEMS_URL, wait_until='networkidle', timeout=60000)
-                await page.wait_for_timeout(3000)
+                await page.goto(ALL_ITEMS_URL, wait_until='domcontentloaded', timeout=60000)
+                try:
+                    await page.wait_for_selector('a[href*=".html"]', timeout=15000)
+                except Exception:
+                    pass
 
                 # 關閉 Cookie 彈窗（多種方式嘗試）
                 print("[TEST] 嘗試關閉 Cookie 彈窗...")
@@ -1291,13 +2204,10 @@ def test_scrape():
                             'images_count': len(data.get('images', [])),
                             'available': data.get('available', False)
                         })
-                    await page.wait_for_timeout(1500)
 
-                await browser.close()
                 return {'total_links': len(links), 'samples': samples}
 
-        result = loop.run_until_complete(test())
-        loop.close()
+        result = browser_service.run(test())
         return jsonify({'success': True, **result})
 
     except Exception as e:
@@ -1313,40 +2223,18 @@ def test_upload():
         return jsonify({'success': False, 'error': '環境變數未設定'})
 
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
         async def do_test_upload():
-            from playwright.async_api import async_playwright
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox', '--disable-dev-shm-usage']
-                )
-                context = await browser.new_context(
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    locale='ja-JP'
-                )
+            async with browser_service.lease() as context:
                 page = await context.new_page()
-                await page.goto(ALL_ITEMS_URL, wait_until='networkidle', timeout=60000)
-                await page.wait_for_timeout(3000)
-
-                # 關閉彈窗
-                try:
-                    btn = page.locator('text=同意する').first
-                    if await btn.is_visible(timeout=3000):
-                        await btn.click()
-                        await page.wait_for_timeout(1000)
-                except:
-                    pass
+                await page.goto(ALL_ITEMS_URL, wait_until='domcontentloaded', timeout=60000)
                 try:
-                    await page.evaluate('''() => {
-                        const ge = document.getElementById('globalePopupWrapper');
-                        if (ge) ge.remove();
-                    }''')
-                except:
+                    await page.wait_for_selector('a[href*=".html"]', timeout=15000)
+                except Exception:
                     pass
 
+                # 關閉彈窗
+                await dismiss_popups(page)
+
                 # 取得商品連結（不用 VIEW MORE，首頁就夠了）
                 links = await page.evaluate('''() => {
                     const items = new Map();
@@ -1366,7 +2254,7 @@ def test_upload():
                 }''')
 
                 # 取前 3 個爬取 + 上架
-                collection_id = get_or_create_collection("Human Made")
+                collection_id = await asyncio.to_thread(get_or_create_collection, "Human Made")
                 results = []
 
                 for item_id, category in links[:3]:
@@ -1381,7 +2269,7 @@ def test_upload():
                     data['category_path'] = category  # 保存類別路徑
 
                     print(f"[TEST UPLOAD] 上架: {data.get('title', item_id)} ¥{data.get('price_jpy', 0)}")
-                    upload_result = upload_to_shopify(data, collection_id)
+                    upload_result = await asyncio.to_thread(upload_to_shopify, data, collection_id)
 
                     if upload_result['success']:
                         results.append({
@@ -1402,13 +2290,9 @@ def test_upload():
                         })
                         print(f"[TEST UPLOAD] ✗ 上架失敗: {upload_result.get('error', '')[:100]}")
 
-                    await page.wait_for_timeout(1500)
-
-                await browser.close()
                 return results
 
-        results = loop.run_until_complete(do_test_upload())
-        loop.close()
+        results = browser_service.run(do_test_upload())
         return jsonify({'success': True, 'results': results})
 
     except Exception as e:
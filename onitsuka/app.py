@@ -21,12 +21,19 @@ except ImportError:
                     key, val = line.split('=', 1)
                     os.environ.setdefault(key.strip(), val.strip())
 
+import asyncio
+import itertools
+import json
+import sqlite3
 import threading
+import uuid
 import time
 import math
+from collections import deque
 from datetime import datetime
-from flask import Flask, jsonify, request, render_template_string
+from flask import Flask, Response, jsonify, request, render_template_string
 
+from models import OnitsukaProduct
 from scraper import (
     OnitsukaScraper,
     ShopifyUploader,
@@ -42,6 +49,205 @@ from scraper import (
 
 app = Flask(__name__)
 
+# 預設使用 asyncio 版爬蟲 / 上架（也可在 /api/start-scrape 帶 async_mode 指定）
+ASYNC_SCRAPER = os.getenv("ASYNC_SCRAPER", "").lower() in ("1", "true", "yes")
+# asyncio 版同時上架的商品數
+ASYNC_UPLOAD_CONCURRENCY = int(os.getenv("ASYNC_UPLOAD_CONCURRENCY", "4"))
+# 狀態紀錄（商品 / 錯誤）最多保留的筆數
+STATUS_LOG_SIZE = int(os.getenv("STATUS_LOG_SIZE", "500"))
+# /api/status 附帶的最近紀錄筆數
+STATUS_RECENT = 50
+# /api/events（SSE）：檢查間隔、單一連線最長秒數（之後瀏覽器會自動重連）、同時連線上限
+SSE_INTERVAL = 1.0
+SSE_MAX_SECONDS = 300
+SSE_KEEPALIVE = 15
+# 連線時尚未開始執行 → 最多等這麼久再送 done（執行緒可能還沒把 running 設為 True）
+SSE_START_GRACE = 5
+# Run lease（SQLite）：跨 gunicorn worker / 重啟只允許一個執行
+RUN_LEASE_DB = os.getenv("RUN_LEASE_DB", "/tmp/onitsuka_run.sqlite3")
+# 超過 TTL 沒有心跳 → 視為已中斷，可被下一個執行接手
+RUN_LEASE_TTL = int(os.getenv("RUN_LEASE_TTL", "120"))
+RUN_HEARTBEAT = 10
+# 每條 SSE 連線會佔用一個 gunicorn thread，不能超過 --threads 太多
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "1"))
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_CLIENTS)
+
+
+# ============================================================
+# 狀態紀錄（固定容量）
+# ============================================================
+class RingLog:
+    """只保留最近 maxlen 筆的紀錄；total 為累計筆數，offset 以累計序號計算"""
+
+    def __init__(self, maxlen: int = STATUS_LOG_SIZE):
+        self._items = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+            self.total += 1
+
+    def __len__(self):
+        return self.total
+
+    def page(self, offset: int = 0, limit: int = 50) -> dict:
+        """依累計序號分頁；已被擠掉的舊紀錄從 first_available 開始"""
+        with self._lock:
+            first = self.total - len(self._items)
+            start = max(offset, first)
+            items = list(itertools.islice(self._items, start - first, start - first + limit))
+            total = self.total
+        return {"total": total, "first_available": first, "offset": start, "limit": limit, "items": items}
+
+    def tail(self, n: int) -> list:
+        with self._lock:
+            skip = max(len(self._items) - n, 0)
+            return list(itertools.islice(self._items, skip, None))
+
+    def since(self, cursor: int) -> tuple:
+        """序號 >= cursor 的紀錄 + 新 cursor（已被擠掉的略過）"""
+        with self._lock:
+            first = self.total - len(self._items)
+            if cursor > self.total:
+                # 新的一輪執行，舊 cursor 失效
+                cursor = 0
+            start = max(cursor, first)
+            return list(itertools.islice(self._items, start - first, None)), self.total
+
+
+# ============================================================
+# Run lease（單一執行）
+# ============================================================
+class RunLease:
+    """
+    SQLite 上的執行租約：acquire 成功才可開始執行，
+    執行中定期 heartbeat（延長期限 + 寫入狀態快照），結束時 release
+    """
+
+    def __init__(self, path: str, name: str = "scrape", ttl: int = RUN_LEASE_TTL):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS run_lease ("
+                " name TEXT PRIMARY KEY, owner TEXT, job TEXT,"
+                " expires_at REAL, heartbeat_at REAL, status TEXT)"
+            )
+
+    def _connect(self):
+        # isolation_level=None → 自己控制 BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def acquire(self, job: str) -> str | None:
+        """取得租約，回傳 owner id；已有未過期的執行則回傳 None"""
+        owner = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT owner, expires_at FROM run_lease WHERE name = ?", (self.name,)
+            ).fetchone()
+            if row and row[0] and row[1] > now:
+                conn.execute("ROLLBACK")
+                return None
+            if row and row[0]:
+                logger.warning(f"⚠️ 上一次執行的租約已過期（{row[0][:8]}），接手執行")
+            conn.execute(
+                "INSERT INTO run_lease (name, owner, job, expires_at, heartbeat_at, status)"
+                " VALUES (?, ?, ?, ?, ?, NULL)"
+                " ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, job = excluded.job,"
+                " expires_at = excluded.expires_at, heartbeat_at = excluded.heartbeat_at, status = NULL",
+                (self.name, owner, job, now + self.ttl, now),
+            )
+            conn.execute("COMMIT")
+            return owner
+        finally:
+            conn.close()
+
+    def heartbeat(self, owner: str, status: dict) -> bool:
+        """延長期限並寫入狀態快照；租約已被接手則回傳 False"""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE run_lease SET expires_at = ?, heartbeat_at = ?, status = ?"
+                " WHERE name = ? AND owner = ?",
+                (now + self.ttl, now, json.dumps(status, ensure_ascii=False), self.name, owner),
+            )
+            return cur.rowcount == 1
+
+    def release(self, owner: str, status: dict):
+        """結束執行：清除 owner，保留最後的狀態快照"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE run_lease SET owner = NULL, expires_at = 0, heartbeat_at = ?, status = ?"
+                " WHERE name = ? AND owner = ?",
+                (time.time(), json.dumps(status, ensure_ascii=False), self.name, owner),
+            )
+
+    def current(self) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT owner, job, expires_at, heartbeat_at, status FROM run_lease WHERE name = ?",
+                (self.name,),
+            ).fetchone()
+        if not row:
+            return None
+        owner, job, expires_at, heartbeat_at, status = row
+        return {
+            "owner": owner,
+            "job": job,
+            "active": bool(owner) and expires_at > time.time(),
+            "expired": bool(owner) and expires_at <= time.time(),
+            "heartbeat_at": heartbeat_at,
+            "status": json.loads(status) if status else None,
+        }
+
+
+run_lease = RunLease(RUN_LEASE_DB)
+# 本 process 目前持有的租約（沒有則為 None）
+_run_owner = None
+
+
+def start_run(job: str, target, *args, on_start=None) -> bool:
+    """
+    取得租約後在背景線程執行 target；任一 worker 已在執行則回傳 False
+    on_start 在取得租約後、線程啟動前呼叫（重置 scrape_status）
+    執行期間每 RUN_HEARTBEAT 秒寫入狀態快照，讓其他 worker 也能回報進度
+    """
+    global _run_owner
+    owner = run_lease.acquire(job)
+    if not owner:
+        return False
+    _run_owner = owner
+    if on_start:
+        on_start()
+    run_lease.heartbeat(owner, status_snapshot())
+
+    def heartbeat_loop(stop: threading.Event):
+        while not stop.wait(RUN_HEARTBEAT):
+            if not run_lease.heartbeat(owner, status_snapshot()):
+                logger.error("🛑 租約已被其他執行接手")
+                return
+
+    def runner():
+        global _run_owner
+        stop = threading.Event()
+        threading.Thread(target=heartbeat_loop, args=(stop,), daemon=True).start()
+        try:
+            target(*args)
+        finally:
+            stop.set()
+            run_lease.release(owner, status_snapshot())
+            _run_owner = None
+
+    threading.Thread(target=runner, daemon=True).start()
+    return True
+
+
 # ============================================================
 # 全域狀態
 # ============================================================
@@ -53,8 +259,8 @@ scrape_status = {
     "uploaded": 0,
     "skipped": 0,
     "failed": 0,
-    "errors": [],
-    "products": [],
+    "errors": RingLog(),
+    "products": RingLog(),
     "start_time": None,
     "end_time": None,
 }
@@ -315,51 +521,93 @@ function resetButtons() {
     document.getElementById('btn-test').disabled = false;
 }
 
+function renderStatus(s) {
+    document.getElementById('stat-uploaded').textContent = s.uploaded;
+    document.getElementById('stat-skipped').textContent = s.skipped;
+    document.getElementById('stat-failed').textContent = s.failed;
+
+    if (s.total > 0) {
+        const pct = Math.round((s.progress / s.total) * 100);
+        document.getElementById('progress-bar').style.width = pct + '%';
+        document.getElementById('progress-pct').textContent = pct + '%';
+        document.getElementById('progress-detail').textContent =
+            `${s.progress} / ${s.total} 商品`;
+    }
+    document.getElementById('progress-label').textContent = s.current_product || '處理中...';
+    document.getElementById('product-count').textContent =
+        s.products_total > s.recent_products.length
+            ? `(${s.products_total} 筆，顯示最近 ${s.recent_products.length} 筆)`
+            : `(${s.products_total} 筆)`;
+
+    const container = document.getElementById('product-items');
+    container.innerHTML = s.recent_products.map(p => `
+        <div class="product-item">
+            <img src="${p.image || ''}" alt="" onerror="this.style.display='none'">
+            <div class="info">
+                <div>${p.title}</div>
+                <div class="sku">${p.sku}</div>
+            </div>
+            <div class="price">
+                ¥${Number(p.selling_price).toLocaleString()}
+                <span class="original">¥${Number(p.price_jpy).toLocaleString()}</span>
+            </div>
+            <span class="status-badge ${p.status || ''}">${p.status_text || ''}</span>
+        </div>
+    `).join('');
+}
+
+function finishRun(s) {
+    resetButtons();
+    document.getElementById('progress-label').textContent = '✅ 完成';
+    document.getElementById('progress-bar').style.width = '100%';
+    log(`完成！上架: ${s.uploaded}, 跳過: ${s.skipped}, 失敗: ${s.failed}`);
+}
+
 function startPolling() {
-    pollInterval = setInterval(async () => {
-        try {
-            const resp = await fetch('/api/status');
-            const s = await resp.json();
-
-            document.getElementById('stat-uploaded').textContent = s.uploaded;
-            document.getElementById('stat-skipped').textContent = s.skipped;
-            document.getElementById('stat-failed').textContent = s.failed;
-
-            if (s.total > 0) {
-                const pct = Math.round((s.progress / s.total) * 100);
-                document.getElementById('progress-bar').style.width = pct + '%';
-                document.getElementById('progress-pct').textContent = pct + '%';
-                document.getElementById('progress-detail').textContent =
-                    `${s.progress} / ${s.total} 商品`;
-            }
-            document.getElementById('progress-label').textContent = s.current_product || '處理中...';
-            document.getElementById('product-count').textContent = `(${s.products.length} 筆)`;
-
-            const container = document.getElementById('product-items');
-            container.innerHTML = s.products.map(p => `
-                <div class="product-item">
-                    <img src="${p.image || ''}" alt="" onerror="this.style.display='none'">
-                    <div class="info">
-                        <div>${p.title}</div>
-                        <div class="sku">${p.sku}</div>
-                    </div>
-                    <div class="price">
-                        ¥${Number(p.selling_price).toLocaleString()}
-                        <span class="original">¥${Number(p.price_jpy).toLocaleString()}</span>
-                    </div>
-                    <span class="status-badge ${p.status || ''}">${p.status_text || ''}</span>
-                </div>
-            `).join('');
-
-            if (!s.running) {
-                clearInterval(pollInterval);
-                resetButtons();
-                document.getElementById('progress-label').textContent = '✅ 完成';
-                document.getElementById('progress-bar').style.width = '100%';
-                log(`完成！上架: ${s.uploaded}, 跳過: ${s.skipped}, 失敗: ${s.failed}`);
-            }
-        } catch (e) { /* ignore */ }
-    }, 2000);
+    if (window.EventSource) {
+        startEvents();
+        return;
+    }
+    pollInterval = setInterval(pollStatus, 2000);
+}
+
+async function pollStatus() {
+    try {
+        const resp = await fetch('/api/status');
+        const s = await resp.json();
+        renderStatus(s);
+        if (!s.running) {
+            clearInterval(pollInterval);
+            finishRun(s);
+        }
+    } catch (e) { /* ignore */ }
+}
+
+// SSE：伺服器只推送變動的欄位與新增的商品紀錄
+function startEvents() {
+    const state = { recent_products: [], products_total: 0 };
+    let opened = false;
+    const es = new EventSource('/api/events');
+    es.onopen = () => { opened = true; };
+    es.addEventListener('progress', ev => {
+        const d = JSON.parse(ev.data);
+        Object.assign(state, d.status);
+        state.products_total = d.products_total;
+        state.errors_total = d.errors_total;
+        state.recent_products = state.recent_products.concat(d.products).slice(-50);
+        renderStatus(state);
+    });
+    es.addEventListener('done', () => {
+        es.close();
+        finishRun(state);
+    });
+    es.onerror = () => {
+        // 連不上（或連線已滿 503）→ 改回輪詢；已連上後斷線則由瀏覽器自動重連
+        if (!opened || es.readyState === EventSource.CLOSED) {
+            es.close();
+            pollInterval = setInterval(pollStatus, 2000);
+        }
+    };
 }
 
 function testPrice() {
@@ -392,22 +640,171 @@ def index():
     )
 
 
+def status_snapshot() -> dict:
+    """純量欄位 + 紀錄筆數 + 最近幾筆（回應大小與商品數無關）"""
+    data = {k: v for k, v in scrape_status.items() if not isinstance(v, RingLog)}
+    products, errors = scrape_status["products"], scrape_status["errors"]
+    data["products_total"] = products.total
+    data["errors_total"] = errors.total
+    data["recent_products"] = products.tail(STATUS_RECENT)
+    data["recent_errors"] = errors.tail(STATUS_RECENT)
+    return data
+
+
+def _log_page(key: str):
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    return jsonify(scrape_status[key].page(offset, limit))
+
+
+def lease_status() -> dict | None:
+    """
+    本 process 沒有在執行時，回傳租約裡的狀態快照
+    （其他 worker 的執行中進度，或重啟前最後一次執行的結果）；沒有則回傳 None
+    """
+    lease = run_lease.current()
+    if _run_owner or not lease or lease["status"] is None:
+        return None
+    data = lease["status"]
+    if lease["expired"]:
+        # 執行中的 worker 已消失（超過 TTL 沒有心跳）
+        data["running"] = False
+        data["lease_expired"] = True
+    return data
+
+
+def shared_status() -> dict:
+    return lease_status() or status_snapshot()
+
+
 @app.route("/api/status")
 def api_status():
-    return jsonify(scrape_status)
+    return jsonify(shared_status())
+
+
+@app.route("/api/status/products")
+def api_status_products():
+    return _log_page("products")
+
+
+@app.route("/api/status/errors")
+def api_status_errors():
+    return _log_page("errors")
+
+
+def _sse(event: str, data: dict, event_id: str = "") -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+SNAPSHOT_RECORD_KEYS = ("products_total", "errors_total", "recent_products", "recent_errors")
+
+
+def _lease_records(recent: list, total: int, cursor: int) -> tuple[list, int]:
+    """從租約快照的最近幾筆取出 cursor 之後的新紀錄（總數比 cursor 小代表新的一輪執行 → 從頭）"""
+    if total < cursor:
+        cursor = 0
+    n = min(total - cursor, len(recent))
+    return (recent[-n:] if n > 0 else []), total
+
+
+def _event_stream(p_cur: int, e_cur: int):
+    """
+    每 SSE_INTERVAL 秒比對一次 scrape_status，只送有變動的欄位 + 新增的商品/錯誤紀錄
+    event id = "商品cursor-錯誤cursor"，斷線重連時由 Last-Event-ID 接續
+    本 process 沒在執行時改讀租約裡的快照（與 /api/status 相同），其他 worker 執行中不會誤送 done
+    """
+    products, errors = scrape_status["products"], scrape_status["errors"]
+    prev = {}
+    seen_running = False
+    started = last_sent = time.time()
+
+    while True:
+        now = time.time()
+        shared = lease_status()
+        if shared is not None:
+            snap = {k: v for k, v in shared.items() if k not in SNAPSHOT_RECORD_KEYS}
+            new_products, p_cur = _lease_records(shared.get("recent_products", []), shared.get("products_total", 0), p_cur)
+            new_errors, e_cur = _lease_records(shared.get("recent_errors", []), shared.get("errors_total", 0), e_cur)
+        else:
+            # 新的一輪執行會換掉 RingLog → 從頭送
+            if scrape_status["products"] is not products or scrape_status["errors"] is not errors:
+                products, errors = scrape_status["products"], scrape_status["errors"]
+                p_cur = e_cur = 0
+                prev = {}
+            snap = {k: v for k, v in scrape_status.items() if not isinstance(v, RingLog)}
+            new_products, p_cur = products.since(p_cur)
+            new_errors, e_cur = errors.since(e_cur)
+        delta = {k: v for k, v in snap.items() if k not in prev or prev[k] != v}
+
+        if delta or new_products or new_errors:
+            yield _sse("progress", {
+                "status": delta,
+                "products": new_products,
+                "errors": new_errors,
+                "products_total": p_cur,
+                "errors_total": e_cur,
+            }, f"{p_cur}-{e_cur}")
+            prev = snap
+            last_sent = now
+        elif now - last_sent >= SSE_KEEPALIVE:
+            yield ": keep-alive\n\n"
+            last_sent = now
+
+        seen_running = seen_running or snap["running"]
+        if not snap["running"] and (seen_running or now - started >= SSE_START_GRACE):
+            yield _sse("done", {"products_total": p_cur, "errors_total": e_cur})
+            return
+        if now - started >= SSE_MAX_SECONDS:
+            return
+        time.sleep(SSE_INTERVAL)
+
+
+@app.route("/api/events")
+def api_events():
+    """SSE 進度推送（取代 /api/status 輪詢）；連線已滿回 503，前端改回輪詢"""
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({"error": "SSE 連線已滿，請改用 /api/status"}), 503
+
+    cursor = request.headers.get("Last-Event-ID") or request.args.get("cursor", "")
+    try:
+        p_cur, e_cur = (int(x) for x in cursor.split("-", 1))
+    except ValueError:
+        p_cur = e_cur = 0
 
+    resp = Response(_event_stream(p_cur, e_cur), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    resp.call_on_close(_sse_slots.release)
+    return resp
 
-@app.route("/api/start-scrape", methods=["POST"])
-def api_start_scrape():
+
+def _reset_status():
     global scrape_status
-    if scrape_status["running"]:
-        return jsonify({"error": "爬蟲正在執行中，請等待完成"})
+    scrape_status = {
+        "running": True,
+        "progress": 0,
+        "total": 0,
+        "current_product": "初始化 GraphQL...",
+        "uploaded": 0,
+        "skipped": 0,
+        "failed": 0,
+        "errors": RingLog(),
+        "products": RingLog(),
+        "start_time": datetime.now().isoformat(),
+        "end_time": None,
+    }
 
+
+@app.route("/api/start-scrape", methods=["POST"])
+def api_start_scrape():
     data = request.get_json() or {}
     category = data.get("category", "men")
     max_pages = data.get("max_pages", 0)
     test_mode = data.get("test_mode", False)
     test_count = data.get("test_count", 3)
+    async_mode = bool(data.get("async_mode", ASYNC_SCRAPER))
 
     if category == "all":
         cats = list(CATEGORIES.keys())
@@ -416,27 +813,12 @@ def api_start_scrape():
     else:
         return jsonify({"error": f"無效分類: {category}"})
 
-    # 重置狀態
-    scrape_status = {
-        "running": True,
-        "progress": 0,
-        "total": 0,
-        "current_product": "初始化 GraphQL...",
-        "uploaded": 0,
-        "skipped": 0,
-        "failed": 0,
-        "errors": [],
-        "products": [],
-        "start_time": datetime.now().isoformat(),
-        "end_time": None,
-    }
-
-    thread = threading.Thread(
-        target=run_scrape_thread,
-        args=(cats, max_pages, test_mode, test_count),
-        daemon=True,
-    )
-    thread.start()
+    if not start_run(
+        f"scrape:{category}", run_scrape_thread,
+        cats, max_pages, test_mode, test_count, async_mode,
+        on_start=_reset_status,
+    ):
+        return jsonify({"error": "爬蟲正在執行中，請等待完成"})
 
     cat_names = ", ".join(CATEGORIES[c]["name"] for c in cats)
     test_label = f" [🧪 測試模式：上架 {test_count} 個]" if test_mode else ""
@@ -457,11 +839,15 @@ def api_test_price():
 # ============================================================
 # 背景爬蟲執行
 # ============================================================
-def run_scrape_thread(categories: list, max_pages: int, test_mode: bool = False, test_count: int = 3):
-    """在背景線程中執行爬蟲"""
+def run_scrape_thread(categories: list, max_pages: int, test_mode: bool = False, test_count: int = 3,
+                      async_mode: bool = False):
+    """在背景線程中執行爬蟲（async_mode 時在此線程內跑一個 event loop）"""
     global scrape_status
     try:
-        run_scrape(categories, max_pages, test_mode, test_count)
+        if async_mode:
+            asyncio.run(run_scrape_async(categories, max_pages, test_mode, test_count))
+        else:
+            run_scrape(categories, max_pages, test_mode, test_count)
     except Exception as e:
         logger.error(f"爬蟲執行錯誤: {e}")
         scrape_status["errors"].append(str(e))
@@ -470,6 +856,42 @@ def run_scrape_thread(categories: list, max_pages: int, test_mode: bool = False,
         scrape_status["end_time"] = datetime.now().isoformat()
 
 
+def _new_product_entry(product: OnitsukaProduct) -> dict:
+    """scrape_status["products"] 的單筆紀錄"""
+    return {
+        "sku": product.sku,
+        "title": product.title,
+        "price_jpy": product.price_jpy,
+        "selling_price": product.selling_price,
+        "image": product.image,
+        "status": "",
+        "status_text": "",
+    }
+
+
+def _skip_reason(product: OnitsukaProduct, is_duplicate: bool) -> str | None:
+    """上架前檢查：回傳跳過原因（顯示文字），None 表示要上架"""
+    # 重複檢查
+    if is_duplicate:
+        return "已存在"
+
+    # 庫存檢查：所有尺寸都缺貨就跳過
+    if not product.in_stock:
+        logger.info(f"  ⏭️ 跳過缺貨商品: {product.sku}")
+        # 非 configurable 商品只看 stock_status
+        return "全部缺貨" if product.sizes else "缺貨"
+    return None
+
+
+def _collect_unique(all_products: list, products: list):
+    """跨分類 SKU 去重"""
+    seen = {p.sku for p in all_products}
+    for p in products:
+        if p.sku not in seen:
+            seen.add(p.sku)
+            all_products.append(p)
+
+
 def run_scrape(categories: list, max_pages: int, test_mode: bool = False, test_count: int = 3):
     """爬蟲主流程（同步，不需要 Playwright）"""
     global scrape_status
@@ -492,10 +914,7 @@ def run_scrape(categories: list, max_pages: int, test_mode: bool = False, test_c
         pages = 1 if test_mode else max_pages
         products = scraper.scrape_category(cat_key, pages)
 
-        for p in products:
-            # 跨分類 SKU 去重
-            if not any(existing["sku"] == p["sku"] for existing in all_products):
-                all_products.append(p)
+        _collect_unique(all_products, products)
 
         logger.info(f"{cat['name']} 找到 {len(products)} 個商品 (累計不重複: {len(all_products)})")
 
@@ -510,42 +929,16 @@ def run_scrape(categories: list, max_pages: int, test_mode: bool = False, test_c
     # 處理每個商品
     for idx, product in enumerate(all_products):
         scrape_status["progress"] = idx + 1
-        scrape_status["current_product"] = f"[{idx+1}/{len(all_products)}] {product['sku']} - {product['title']}"
-
-        product_entry = {
-            "sku": product["sku"],
-            "title": product["title"],
-            "price_jpy": product["price_jpy"],
-            "selling_price": product["selling_price"],
-            "image": product.get("image", ""),
-            "status": "",
-            "status_text": "",
-        }
+        scrape_status["current_product"] = f"[{idx+1}/{len(all_products)}] {product.sku} - {product.title}"
 
-        # 重複檢查
-        if uploader and uploader.is_duplicate(product["sku"]):
-            product_entry["status"] = "skip"
-            product_entry["status_text"] = "已存在"
-            scrape_status["skipped"] += 1
-            scrape_status["products"].append(product_entry)
-            continue
+        product_entry = _new_product_entry(product)
 
-        # 庫存檢查：所有尺寸都缺貨就跳過
-        sizes = product.get("sizes", [])
-        if sizes and not any(s.get("available", False) for s in sizes):
+        skip_text = _skip_reason(product, bool(uploader and uploader.is_duplicate(product.sku)))
+        if skip_text:
             product_entry["status"] = "skip"
-            product_entry["status_text"] = "全部缺貨"
+            product_entry["status_text"] = skip_text
             scrape_status["skipped"] += 1
             scrape_status["products"].append(product_entry)
-            logger.info(f"  ⏭️ 跳過缺貨商品: {product['sku']}")
-            continue
-        # 非 configurable 商品檢查 stock_status
-        if not sizes and product.get("stock_status") != "IN_STOCK":
-            product_entry["status"] = "skip"
-            product_entry["status_text"] = "缺貨"
-            scrape_status["skipped"] += 1
-            scrape_status["products"].append(product_entry)
-            logger.info(f"  ⏭️ 跳過缺貨商品: {product['sku']}")
             continue
 
         try:
@@ -559,7 +952,7 @@ def run_scrape(categories: list, max_pages: int, test_mode: bool = False, test_c
                     product_entry["status"] = "error"
                     product_entry["status_text"] = "失敗"
                     scrape_status["failed"] += 1
-                    scrape_status["errors"].append(f"{product['sku']}: {result.get('error', '')[:100]}")
+                    scrape_status["errors"].append(f"{product.sku}: {result.get('error', '')[:100]}")
             else:
                 product_entry["status"] = "skip"
                 product_entry["status_text"] = "測試模式"
@@ -575,25 +968,127 @@ def run_scrape(categories: list, max_pages: int, test_mode: bool = False, test_c
             # 標記剩餘商品
             for remaining in all_products[idx+1:]:
                 scrape_status["products"].append({
-                    "sku": remaining["sku"],
-                    "title": remaining.get("title", ""),
-                    "price": remaining.get("selling_price", 0),
+                    "sku": remaining.sku,
+                    "title": remaining.title,
+                    "price": remaining.selling_price,
                     "status": "skip",
                     "status_text": "等待明日",
                 })
                 scrape_status["skipped"] += 1
             break
         except Exception as e:
-            logger.error(f"❌ 處理商品 {product['sku']} 異常: {e}")
+            logger.error(f"❌ 處理商品 {product.sku} 異常: {e}")
             product_entry["status"] = "error"
             product_entry["status_text"] = f"異常: {str(e)[:50]}"
             scrape_status["failed"] += 1
-            scrape_status["errors"].append(f"{product['sku']}: {str(e)[:100]}")
+            scrape_status["errors"].append(f"{product.sku}: {str(e)[:100]}")
 
         scrape_status["products"].append(product_entry)
         time.sleep(0.3)
 
 
+async def run_scrape_async(categories: list, max_pages: int, test_mode: bool = False, test_count: int = 3):
+    """
+    爬蟲主流程（asyncio 版）
+    所有分類、分頁、Scene7 檢查、翻譯與 Shopify 寫入都在同一個 event loop 併發
+    """
+    import aiohttp
+    from async_scraper import AsyncOnitsukaScraper, AsyncShopifyUploader, HostLimiter
+
+    limiter = HostLimiter()
+    scraper = AsyncOnitsukaScraper(limiter=limiter)
+    try:
+        scrape_status["current_product"] = "初始化 GraphQL 連線..."
+        await scraper.init()
+
+        # 爬取每個分類（分類之間也併發）
+        pages = 1 if test_mode else max_pages
+        scrape_status["current_product"] = "爬取 " + ", ".join(CATEGORIES[c]["name"] for c in categories) + " ..."
+        results = await asyncio.gather(*(scraper.scrape_category(c, pages) for c in categories))
+    finally:
+        await scraper.close()
+
+    all_products = []
+    for cat_key, products in zip(categories, results):
+        _collect_unique(all_products, products)
+        logger.info(f"{CATEGORIES[cat_key]['name']} 找到 {len(products)} 個商品 (累計不重複: {len(all_products)})")
+
+    # 測試模式限制
+    if test_mode and len(all_products) > test_count:
+        all_products = all_products[:test_count]
+        logger.info(f"🧪 測試模式：只處理前 {test_count} 個商品")
+
+    scrape_status["total"] = len(all_products)
+    logger.info(f"共 {len(all_products)} 個商品待處理（async，併發 {ASYNC_UPLOAD_CONCURRENCY}）")
+
+    async with aiohttp.ClientSession() as session:
+        uploader = (AsyncShopifyUploader(session=session, limiter=limiter)
+                    if (SHOPIFY_STORE and SHOPIFY_ACCESS_TOKEN) else None)
+        if uploader:
+            await uploader.get_existing_skus()
+        upload_sem = asyncio.Semaphore(ASYNC_UPLOAD_CONCURRENCY)
+        daily_limit = asyncio.Event()
+
+        async def process(product: OnitsukaProduct):
+            async with upload_sem:
+                product_entry = _new_product_entry(product)
+                if daily_limit.is_set():
+                    product_entry["status"] = "skip"
+                    product_entry["status_text"] = "等待明日"
+                    scrape_status["skipped"] += 1
+                    scrape_status["products"].append(product_entry)
+                    return
+
+                scrape_status["progress"] += 1
+                scrape_status["current_product"] = (
+                    f"[{scrape_status['progress']}/{len(all_products)}] {product.sku} - {product.title}"
+                )
+
+                is_dup = bool(uploader and await uploader.is_duplicate(product.sku))
+                skip_text = _skip_reason(product, is_dup)
+                if skip_text:
+                    product_entry["status"] = "skip"
+                    product_entry["status_text"] = skip_text
+                    scrape_status["skipped"] += 1
+                    scrape_status["products"].append(product_entry)
+                    return
+
+                try:
+                    if uploader:
+                        result = await uploader.upload_product(product)
+                        if result["success"]:
+                            product_entry["status"] = "success"
+                            product_entry["status_text"] = "已上架"
+                            scrape_status["uploaded"] += 1
+                        else:
+                            product_entry["status"] = "error"
+                            product_entry["status_text"] = "失敗"
+                            scrape_status["failed"] += 1
+                            scrape_status["errors"].append(f"{product.sku}: {result.get('error', '')[:100]}")
+                    else:
+                        product_entry["status"] = "skip"
+                        product_entry["status_text"] = "測試模式"
+                except DailyLimitReached as e:
+                    # Shopify 每日 variant 上限 → 其餘尚未開始的商品全部標記等待明日
+                    if not daily_limit.is_set():
+                        daily_limit.set()
+                        logger.error(f"🛑 {e}")
+                        scrape_status["errors"].append("🛑 Shopify 每日 variant 上限已達，自動停止")
+                    product_entry["status"] = "error"
+                    product_entry["status_text"] = "每日上限"
+                    scrape_status["failed"] += 1
+                except Exception as e:
+                    logger.error(f"❌ 處理商品 {product.sku} 異常: {e}")
+                    product_entry["status"] = "error"
+                    product_entry["status_text"] = f"異常: {str(e)[:50]}"
+                    scrape_status["failed"] += 1
+                    scrape_status["errors"].append(f"{product.sku}: {str(e)[:100]}")
+
+                scrape_status["products"].append(product_entry)
+
+        await asyncio.gather(*(process(p) for p in all_products))
+
+
 # ============================================================
 # 批次修改標題 API
 # ============================================================
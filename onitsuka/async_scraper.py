@@ -0,0 +1,726 @@
+"""
+Onitsuka Tiger 非同步爬蟲 + Shopify 上架 (asyncio + aiohttp)
+=============================================================
+- 與 scraper.py 的 OnitsukaScraper / ShopifyUploader 方法名稱一致，但全部是 coroutine
+- 所有請求跑在同一個 event loop，依 host 使用各自的 Semaphore 控制併發
+  （Onitsuka GraphQL、Scene7 CDN、OpenAI、Shopify 分開計算）
+- 解析 / payload 組合邏輯直接共用 scraper.py，不重複實作
+"""
+
+import asyncio
+import json
+from urllib.parse import urlparse
+
+import aiohttp
+
+from models import OnitsukaProduct
+from scraper import (
+    _ProductParserMixin,
+    _translation_payload,
+    _strip_japanese_chars,
+    _raise_if_daily_limit,
+    _next_page_url,
+    _image_size_from_headers,
+    DailyLimitReached,
+    ShopifyUploader,
+    CATEGORIES,
+    CATEGORIES_QUERY,
+    GENDER_METADATA_QUERY,
+    SCENE7_PRIMARY_SUFFIXES,
+    SCENE7_EXTRA_SUFFIXES,
+    SCENE7_QUALITY_PARAM,
+    GRAPHQL_URL,
+    BASE_URL,
+    STORE_CODE,
+    SHOPIFY_STORE,
+    SHOPIFY_ACCESS_TOKEN,
+    OPENAI_API_KEY,
+    logger,
+)
+
+# 每個 host 同時進行中的請求上限（未列出的 host 用 DEFAULT_HOST_CONCURRENCY）
+HOST_CONCURRENCY = {
+    "www.onitsukatiger.com": 4,
+    "asics.scene7.com": 16,
+    "api.openai.com": 8,
+    f"{SHOPIFY_STORE}.myshopify.com": 2,  # REST bucket 40 / 每秒回補 2
+}
+DEFAULT_HOST_CONCURRENCY = 4
+# 單一分類同時抓取的 GraphQL 頁數
+PAGE_CONCURRENCY = 4
+
+_TIMEOUT_GRAPHQL = aiohttp.ClientTimeout(total=30)
+_TIMEOUT_PAGE = aiohttp.ClientTimeout(total=15)
+_TIMEOUT_IMAGE = aiohttp.ClientTimeout(total=5)
+_TIMEOUT_SHOPIFY = aiohttp.ClientTimeout(total=60)
+
+
+class HostLimiter:
+    """依 URL 的 host 回傳對應的 asyncio.Semaphore"""
+
+    def __init__(self, limits: dict | None = None, default: int = DEFAULT_HOST_CONCURRENCY):
+        self._limits = dict(HOST_CONCURRENCY if limits is None else limits)
+        self._default = default
+        self._semaphores = {}
+
+    def __call__(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        sem = self._semaphores.get(host)
+        if sem is None:
+            sem = asyncio.Semaphore(self._limits.get(host, self._default))
+            self._semaphores[host] = sem
+        return sem
+
+
+class _Response:
+    """已讀完 body 的回應（aiohttp 的 response 離開 context 後就不能再讀）"""
+
+    __slots__ = ("status_code", "headers", "text")
+
+    def __init__(self, status_code: int, headers, text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+async def _request(session: aiohttp.ClientSession, limiter: HostLimiter, method: str, url: str,
+                   **kwargs) -> _Response:
+    async with limiter(url):
+        async with session.request(method, url, **kwargs) as resp:
+            return _Response(resp.status, resp.headers, await resp.text())
+
+
+async def _api_request_with_retry(session, limiter, method, url, max_retries=3, **kwargs) -> _Response:
+    """帶 retry 的 API 請求（處理 429 rate limit），與同步版行為一致"""
+    resp = None
+    for attempt in range(max_retries):
+        resp = await _request(session, limiter, method, url, **kwargs)
+        if resp.status_code == 429:
+            # 檢查是否為 daily limit（不是一般 rate limit，retry 也沒用）
+            try:
+                _raise_if_daily_limit(resp.json())
+            except ValueError:
+                pass
+            # 一般 rate limit → retry
+            retry_after = float(resp.headers.get("Retry-After", 2 * (attempt + 1)))
+            logger.warning(f"  ⏳ Rate limit (429)，等待 {retry_after}s...")
+            await asyncio.sleep(retry_after)
+            continue
+        return resp
+    return resp
+
+
+# ============================================================
+# 翻譯 (ChatGPT API)
+# ============================================================
+async def translate_ja_to_zhtw_async(session: aiohttp.ClientSession, limiter: HostLimiter, text: str) -> str:
+    """translate_ja_to_zhtw 的非同步版本"""
+    if not text or not text.strip():
+        return text
+    if not OPENAI_API_KEY:
+        return text
+
+    for attempt in range(3):
+        try:
+            resp = await _request(
+                session, limiter, "POST",
+                "https://api.openai.com/v1/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {OPENAI_API_KEY}",
+                    "Content-Type": "application/json",
+                },
+                json=_translation_payload(text),
+                timeout=_TIMEOUT_GRAPHQL,
+            )
+            if resp.status_code == 200:
+                result = resp.json()["choices"][0]["message"]["content"].strip()
+                # 最後防線：程式化清除殘留日文
+                return _strip_japanese_chars(result)
+            elif resp.status_code == 429:
+                wait = float(resp.headers.get("Retry-After", 3 * (attempt + 1)))
+                logger.warning(f"  ⏳ OpenAI rate limit，等待 {wait}s...")
+                await asyncio.sleep(wait)
+                continue
+            else:
+                logger.error(f"翻譯 API 錯誤: {resp.status_code}")
+                return _strip_japanese_chars(text)
+        except Exception as e:
+            logger.error(f"翻譯失敗 (attempt {attempt+1}): {e}")
+            return _strip_japanese_chars(text)
+    return _strip_japanese_chars(text)
+
+
+# ============================================================
+# GraphQL 爬蟲核心
+# ============================================================
+class AsyncOnitsukaScraper(_ProductParserMixin):
+    """OnitsukaScraper 的非同步版本：分頁、Scene7 檢查、商品頁抓圖全部併發"""
+
+    def __init__(self, session: aiohttp.ClientSession | None = None, limiter: HostLimiter | None = None):
+        self._own_session = session is None
+        self.session = session
+        self.limiter = limiter or HostLimiter()
+        self._gender_map = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._own_session and self.session is not None:
+            await self.session.close()
+
+    async def init(self):
+        """初始化：取 cookies + 解析分類 UID + 解析 gender 對應表"""
+        logger.info("初始化 session（async）...")
+        if self.session is None:
+            self.session = aiohttp.ClientSession(headers={
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+                "Accept": "application/json",
+                "Accept-Language": "ja-JP,ja;q=0.9",
+                "Store": STORE_CODE,
+                "Referer": f"{BASE_URL}/jp/ja-jp/",
+                "Origin": BASE_URL,
+            })
+        self._gender_map = {}
+        try:
+            await _request(self.session, self.limiter, "GET", f"{BASE_URL}/jp/ja-jp/", timeout=_TIMEOUT_PAGE)
+            logger.info(f"  Cookies: {[c.key for c in self.session.cookie_jar]}")
+        except Exception as e:
+            logger.warning(f"  取 cookies 失敗: {e}")
+
+        # 分類 UID 與 gender 對應表互不相依 → 同時查
+        await asyncio.gather(self._resolve_category_uids(), self._resolve_gender_mapping())
+
+    async def _graphql(self, query, retries=3):
+        """發送 GraphQL 請求"""
+        for attempt in range(retries):
+            try:
+                resp = await _request(
+                    self.session, self.limiter, "POST", GRAPHQL_URL,
+                    json={"query": query}, timeout=_TIMEOUT_GRAPHQL,
+                )
+                if resp.status_code == 200:
+                    data = resp.json()
+                    if "errors" in data:
+                        logger.warning(f"  GraphQL errors: {json.dumps(data['errors'], ensure_ascii=False)[:200]}")
+                    return data.get("data")
+                elif resp.status_code == 429:
+                    await asyncio.sleep((attempt + 1) * 3)
+                    continue
+                elif resp.status_code == 503:
+                    await asyncio.sleep((attempt + 1) * 2)
+                    continue
+                else:
+                    logger.error(f"  GraphQL HTTP {resp.status_code}")
+                    return None
+            except asyncio.TimeoutError:
+                logger.warning(f"  GraphQL timeout, retry {attempt+1}/{retries}")
+                await asyncio.sleep(2)
+            except Exception as e:
+                logger.error(f"  GraphQL error: {e}")
+                return None
+        return None
+
+    async def _resolve_category_uids(self):
+        """用 GraphQL 取得男裝/女裝分類的 UID"""
+        logger.info("解析分類 UID...")
+        data = await self._graphql(CATEGORIES_QUERY)
+        if not data:
+            logger.error("無法取得分類，將使用搜尋模式")
+            return
+        self._apply_category_uids(data)
+
+    async def _resolve_gender_mapping(self):
+        """查詢 gender attribute 的 option 對應表"""
+        logger.info("解析 gender 對應表...")
+        data = await self._graphql(GENDER_METADATA_QUERY)
+        if not data:
+            logger.warning("  ⚠️ 無法查詢 gender 對應表，使用分類 fallback")
+            return
+        self._apply_gender_mapping(data)
+
+    async def _fetch_page(self, uid: str, page: int):
+        """抓單一頁；gender 欄位造成錯誤時改用不帶 gender 的查詢"""
+        data = await self._graphql(self._products_query(uid, page, not hasattr(self, '_gender_field_broken')))
+        if data is None and not hasattr(self, '_gender_field_broken'):
+            logger.warning("  ⚠️ GraphQL 查詢失敗，嘗試不帶 gender 欄位...")
+            self._gender_field_broken = True
+            data = await self._graphql(self._products_query(uid, page, False))
+        if not data or "products" not in data:
+            logger.error(f"  第 {page} 頁查詢失敗")
+            return None
+        return data["products"]
+
+    async def scrape_category(self, category_key: str, max_pages: int = 0) -> list:
+        """
+        爬取指定分類的所有商品
+        先抓第 1 頁取得 total_pages，其餘頁面與每個商品的圖片解析全部併發
+        max_pages=0 表示全部
+        """
+        cat = CATEGORIES.get(category_key)
+        if not cat:
+            logger.error(f"無效分類: {category_key}")
+            return []
+
+        uid = cat.get("uid")
+        if not uid:
+            logger.warning(f"分類 {cat['name']} 沒有 UID，嘗試用搜尋...")
+            return []
+
+        logger.info(f"=== 開始爬取: {cat['name']} (uid={uid}) ===")
+
+        first = await self._fetch_page(uid, 1)
+        if first is None:
+            return []
+        total_pages = first.get("page_info", {}).get("total_pages", 1)
+        logger.info(f"  共 {first.get('total_count', 0)} 個商品, {total_pages} 頁")
+        last_page = min(total_pages, max_pages) if max_pages > 0 else total_pages
+        if last_page < total_pages:
+            logger.info(f"  已達最大頁數限制 ({max_pages})")
+
+        page_sem = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+        async def fetch(page):
+            async with page_sem:
+                return await self._fetch_page(uid, page)
+
+        rest = await asyncio.gather(*(fetch(p) for p in range(2, last_page + 1)))
+        pages = [first] + list(rest)
+
+        # 依頁序排好 item，再併發正規化（Scene7 / 商品頁請求）
+        items = []
+        for page_no, products in enumerate(pages, start=1):
+            if products is None:
+                continue
+            page_items = products.get("items", [])
+            logger.info(f"  第 {page_no}/{total_pages} 頁: +{len(page_items)} 商品")
+            items.extend(page_items)
+
+        normalized = await asyncio.gather(*(self._normalize_product(item, category_key) for item in items))
+
+        all_products = []
+        seen_skus = set()
+        for product in normalized:
+            # SKU 去重
+            if product and product.sku not in seen_skus:
+                seen_skus.add(product.sku)
+                all_products.append(product)
+
+        logger.info(f"  ✅ {cat['name']} 共取得 {len(all_products)} 個不重複商品")
+        return all_products
+
+    async def _normalize_product(self, item: dict, category_key: str) -> OnitsukaProduct | None:
+        """將 GraphQL 商品資料正規化為統一格式"""
+        sku = item.get("sku", "")
+        if not sku:
+            return None
+
+        price_jpy = self._extract_price(item)
+        if price_jpy <= 0:
+            return None
+
+        product_url = self._product_url(item)
+        all_images = (
+            await self._build_scene7_images(sku)
+            or await self._fetch_product_images(sku, product_url)
+            or self._listing_images(item, sku)
+        )
+        return self._build_product(item, category_key, price_jpy, product_url, all_images)
+
+    async def _fetch_product_images(self, sku: str, product_url: str = "") -> list:
+        """Scene7 沒圖的商品，直接抓商品頁 HTML 取得實際圖片 URL"""
+        if not product_url:
+            return []
+        try:
+            resp = await _request(self.session, self.limiter, "GET", product_url, timeout=_TIMEOUT_PAGE)
+            if resp.status_code != 200:
+                logger.warning(f"  ⚠️ 商品頁 {resp.status_code}: {product_url}")
+                return []
+            images = self._extract_page_images(resp.text)
+            if images:
+                logger.info(f"  📸 商品頁: {len(images)} 張圖片 ({sku})")
+            else:
+                logger.warning(f"  ⚠️ 商品頁也沒找到圖片: {sku}")
+            return images
+        except Exception as e:
+            logger.warning(f"  ⚠️ 抓商品頁失敗 ({sku}): {e}")
+            return []
+
+    async def _build_scene7_images(self, sku: str) -> list:
+        """用 ASICS Scene7 CDN 組合商品圖片 URL（檢查請求併發送出）"""
+        if not sku or "_" not in sku:
+            return []
+
+        scene7_base = f"https://asics.scene7.com/is/image/asics/{sku}"
+        main_url = f"{scene7_base}_{SCENE7_PRIMARY_SUFFIXES[0]}{SCENE7_QUALITY_PARAM}"
+        extra_urls = [f"{scene7_base}_{s}{SCENE7_QUALITY_PARAM}" for s in SCENE7_EXTRA_SUFFIXES]
+
+        # 主圖與額外角度一起檢查，省掉一個來回
+        checks = await asyncio.gather(*(self._check_image_exists(u) for u in [main_url] + extra_urls))
+        if checks[0]:
+            # 主圖存在 → 其餘 3 個主要角度大概率也存在，直接加入
+            images = [main_url] + [f"{scene7_base}_{s}{SCENE7_QUALITY_PARAM}" for s in SCENE7_PRIMARY_SUFFIXES[1:]]
+            images += [u for u, ok in zip(extra_urls, checks[1:]) if ok]
+            logger.info(f"  📸 Scene7: {len(images)} 張圖片 ({sku})")
+            return images
+
+        # 嘗試不帶 -1 的主圖
+        alt_main = f"{scene7_base}_SR_RT_GLB{SCENE7_QUALITY_PARAM}"
+        alt_urls = [f"{scene7_base}_{s}{SCENE7_QUALITY_PARAM}" for s in SCENE7_PRIMARY_SUFFIXES[1:]]
+        alt_checks = await asyncio.gather(*(self._check_image_exists(u) for u in [alt_main] + alt_urls))
+        if not alt_checks[0]:
+            return []
+        images = [alt_main] + [u for u, ok in zip(alt_urls, alt_checks[1:]) if ok]
+        logger.info(f"  📸 Scene7: {len(images)} 張圖片 ({sku})")
+        return images
+
+    async def _check_image_exists(self, url: str) -> bool:
+        """檢查 Scene7 圖片是否存在（> 10KB 才算真圖，只下載 1 byte）"""
+        try:
+            async with self.limiter(url):
+                async with self.session.get(url, timeout=_TIMEOUT_IMAGE, allow_redirects=True,
+                                            headers={"Range": "bytes=0-0"}) as resp:
+                    if resp.status in (200, 206):
+                        return _image_size_from_headers(resp.headers) > 10000
+                    return False
+        except Exception:
+            return False
+
+
+# ============================================================
+# Shopify 上架
+# ============================================================
+class AsyncShopifyUploader:
+    """ShopifyUploader 的非同步版本（payload 組合共用同步版）"""
+
+    def __init__(self, session: aiohttp.ClientSession | None = None, limiter: HostLimiter | None = None):
+        if not SHOPIFY_STORE or not SHOPIFY_ACCESS_TOKEN:
+            logger.warning("未設定 Shopify 環境變數，上架功能不可用")
+        self.base_url = f"https://{SHOPIFY_STORE}.myshopify.com/admin/api/2026-01"
+        self.graphql_url = f"{self.base_url}/graphql.json"
+        self.headers = {
+            "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN,
+            "Content-Type": "application/json",
+        }
+        self._own_session = session is None
+        self.session = session or aiohttp.ClientSession()
+        self.limiter = limiter or HostLimiter()
+        self._existing_skus = None
+        self._existing_skus_lock = asyncio.Lock()
+        self._collection_cache = {}
+        self._collection_lock = asyncio.Lock()
+        self._publication_ids = None
+        self._publication_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._own_session:
+            await self.session.close()
+
+    async def _rest(self, method, url, timeout=_TIMEOUT_SHOPIFY, **kwargs) -> _Response:
+        return await _api_request_with_retry(
+            self.session, self.limiter, method, url, headers=self.headers, timeout=timeout, **kwargs)
+
+    # --- 銷售管道 ---
+    async def get_publication_ids(self) -> list:
+        async with self._publication_lock:
+            if self._publication_ids is not None:
+                return self._publication_ids
+            self._publication_ids = []
+            query = '{ publications(first: 20) { edges { node { id name } } } }'
+            try:
+                resp = await _request(self.session, self.limiter, "POST", self.graphql_url,
+                                      headers=self.headers, json={"query": query}, timeout=_TIMEOUT_PAGE)
+                if resp.status_code == 200:
+                    pubs = resp.json().get("data", {}).get("publications", {}).get("edges", [])
+                    seen = set()
+                    for pub in pubs:
+                        name = pub["node"]["name"]
+                        if name not in seen:
+                            seen.add(name)
+                            self._publication_ids.append(pub["node"]["id"])
+                    logger.info(f"找到 {len(self._publication_ids)} 個銷售管道: {', '.join(seen)}")
+            except Exception as e:
+                logger.error(f"取得銷售管道異常: {e}")
+            return self._publication_ids
+
+    async def publish_to_all_channels(self, resource_type: str, resource_id: int):
+        pub_ids = await self.get_publication_ids()
+        if not pub_ids:
+            return
+        mutation = """
+        mutation publishablePublish($id: ID!, $input: [PublicationInput!]!) {
+          publishablePublish(id: $id, input: $input) {
+            publishable { availablePublicationsCount { count } }
+            userErrors { field message }
+          }
+        }
+        """
+        gid = f"gid://shopify/{resource_type}/{resource_id}"
+        variables = {"id": gid, "input": [{"publicationId": pid} for pid in pub_ids]}
+        try:
+            resp = await _request(self.session, self.limiter, "POST", self.graphql_url, headers=self.headers,
+                                  json={"query": mutation, "variables": variables}, timeout=_TIMEOUT_PAGE)
+            if resp.status_code == 200:
+                errors = resp.json().get("data", {}).get("publishablePublish", {}).get("userErrors", [])
+                if errors:
+                    for err in errors:
+                        logger.warning(f"  發布警告: {err.get('message')}")
+                else:
+                    logger.info(f"  ✅ {resource_type} {resource_id} 已發布到 {len(pub_ids)} 個管道")
+        except Exception as e:
+            logger.error(f"  發布異常: {e}")
+
+    # --- SKU 重複檢查 ---
+    async def get_existing_skus(self) -> set:
+        async with self._existing_skus_lock:
+            if self._existing_skus is not None:
+                return self._existing_skus
+            skus = set()
+            url = f"{self.base_url}/products.json?limit=250&fields=id,variants,tags"
+            while url:
+                try:
+                    resp = await self._rest("GET", url)
+                    if resp.status_code != 200:
+                        break
+                    for product in resp.json().get("products", []):
+                        for variant in product.get("variants", []):
+                            sku = variant.get("sku", "")
+                            if sku:
+                                skus.add(sku.split("-")[0].upper())
+                                skus.add(sku.upper())
+                    url = _next_page_url(resp.headers.get("Link", ""))
+                except Exception as e:
+                    logger.error(f"取得 SKU 失敗: {e}")
+                    break
+            logger.info(f"Shopify 已有 {len(skus)} 個 SKU")
+            self._existing_skus = skus
+            return skus
+
+    async def is_duplicate(self, sku: str) -> bool:
+        existing = await self.get_existing_skus()
+        # Onitsuka Tiger 每個色號是獨立商品，只查完整 SKU
+        return sku.upper() in existing
+
+    async def batch_rename_titles(self, old_prefix: str, new_prefix: str) -> dict:
+        """批次修改商品標題前綴（每頁的 PUT 併發送出）"""
+        counts = {"updated": 0, "skipped": 0, "errors": 0}
+
+        async def rename(p):
+            new_title = p["title"].replace(old_prefix, new_prefix, 1)
+            put_resp = await self._rest(
+                "PUT", f"{self.base_url}/products/{p['id']}.json",
+                json={"product": {"id": p["id"], "title": new_title}}, timeout=_TIMEOUT_PAGE,
+            )
+            if put_resp.status_code == 200:
+                counts["updated"] += 1
+                if counts["updated"] % 20 == 0:
+                    logger.info(f"  已更新 {counts['updated']} 個商品標題...")
+            else:
+                counts["errors"] += 1
+                logger.warning(f"  更新失敗 {p['id']}: {put_resp.status_code}")
+
+        url = f"{self.base_url}/products.json?limit=250&fields=id,title"
+        while url:
+            try:
+                resp = await self._rest("GET", url)
+                if resp.status_code != 200:
+                    logger.error(f"取得商品失敗: {resp.status_code}")
+                    break
+                targets = []
+                for p in resp.json().get("products", []):
+                    if old_prefix in p["title"] and new_prefix not in p["title"]:
+                        targets.append(p)
+                    else:
+                        counts["skipped"] += 1
+                await asyncio.gather(*(rename(p) for p in targets))
+                url = _next_page_url(resp.headers.get("Link", ""))
+            except Exception as e:
+                logger.error(f"批次更新異常: {e}")
+                break
+        logger.info(f"✅ 標題更新完成: {counts['updated']} 個更新, {counts['skipped']} 個跳過, {counts['errors']} 個失敗")
+        return counts
+
+    # --- Collection ---
+    async def get_or_create_collection(self, title: str) -> int | None:
+        # 同名 Collection 只能建立一次 → 整段查詢/建立要上鎖
+        async with self._collection_lock:
+            if title in self._collection_cache:
+                return self._collection_cache[title]
+            try:
+                resp = await self._rest("GET", f"{self.base_url}/custom_collections.json",
+                                        params={"title": title}, timeout=_TIMEOUT_GRAPHQL)
+                if resp.status_code == 200:
+                    for c in resp.json().get("custom_collections", []):
+                        if c["title"] == title:
+                            self._collection_cache[title] = c["id"]
+                            await self.publish_to_all_channels("Collection", c["id"])
+                            return c["id"]
+            except Exception:
+                pass
+            try:
+                resp = await self._rest(
+                    "POST", f"{self.base_url}/custom_collections.json",
+                    json={"custom_collection": {"title": title, "published": True}}, timeout=_TIMEOUT_GRAPHQL,
+                )
+                if resp.status_code == 201:
+                    cid = resp.json()["custom_collection"]["id"]
+                    self._collection_cache[title] = cid
+                    await self.publish_to_all_channels("Collection", cid)
+                    return cid
+            except Exception as e:
+                logger.error(f"建立 Collection 失敗: {e}")
+            return None
+
+    async def _add_to_collection(self, product_id: int, collection_id: int):
+        try:
+            await self._rest(
+                "POST", f"{self.base_url}/collects.json",
+                json={"collect": {"product_id": product_id, "collection_id": collection_id}},
+                timeout=_TIMEOUT_GRAPHQL,
+            )
+        except Exception:
+            pass
+
+    # --- 上架商品 ---
+    async def upload_product(self, product: OnitsukaProduct, translate: bool = True) -> dict:
+        """上架單個商品到 Shopify（翻譯 + SEO 併發）"""
+        title = product.title
+        sku = product.sku
+        desc_html = product.description_html
+        short_desc = product.short_description_html
+
+        # 翻譯描述（長/短描述同時送出）
+        if translate and OPENAI_API_KEY:
+            desc_html, short_desc = await asyncio.gather(
+                translate_ja_to_zhtw_async(self.session, self.limiter, desc_html),
+                translate_ja_to_zhtw_async(self.session, self.limiter, short_desc),
+            )
+
+        seo = await self._generate_seo(title, short_desc, sku)
+        payload, size_stock = ShopifyUploader._build_product_payload(product, desc_html, short_desc, seo)
+
+        try:
+            resp = await self._rest("POST", f"{self.base_url}/products.json", json=payload)
+            if resp.status_code == 201:
+                shopify_product = resp.json()["product"]
+                product_id = shopify_product["id"]
+
+                async def add_collections():
+                    # 加入所有相關 Collections（根據性別）
+                    for col_name in product.collection_names:
+                        col_id = await self.get_or_create_collection(col_name)
+                        if col_id:
+                            await self._add_to_collection(product_id, col_id)
+                            logger.info(f"  📂 加入 Collection: {col_name}")
+
+                # 庫存 / metafield / Collection / 發布 互不相依 → 同時進行
+                await asyncio.gather(
+                    self._set_inventory_levels(shopify_product, size_stock),
+                    self._set_product_metafield(product_id, product.url),
+                    add_collections(),
+                    self.publish_to_all_channels("Product", product_id),
+                )
+
+                gender_label = {"men": "男", "women": "女", "unisex": "男+女", "kids": "童"}
+                logger.info(
+                    f"✅ 上架成功: {sku} - {title} → ¥{product.selling_price} "
+                    f"[{gender_label.get(product.gender.value, '?')}]"
+                )
+                (await self.get_existing_skus()).add(sku.upper())
+                return {"success": True, "product_id": product_id}
+            else:
+                logger.error(f"❌ 上架失敗: {sku} - {resp.status_code} {resp.text[:200]}")
+                return {"success": False, "error": resp.text[:200]}
+        except DailyLimitReached:
+            raise
+        except Exception as e:
+            logger.error(f"❌ 上架異常: {sku} - {e}")
+            return {"success": False, "error": str(e)}
+
+    async def _set_product_metafield(self, product_id: int, url: str):
+        if not url:
+            return
+        try:
+            await self._rest(
+                "POST", f"{self.base_url}/products/{product_id}/metafields.json",
+                json={"metafield": {"namespace": "custom", "key": "link", "value": url, "type": "url"}},
+                timeout=_TIMEOUT_GRAPHQL,
+            )
+        except Exception:
+            pass
+
+    async def _set_inventory_levels(self, shopify_product: dict, size_stock: dict):
+        try:
+            first_variant = shopify_product.get("variants", [{}])[0]
+            first_inv_id = first_variant.get("inventory_item_id")
+            if not first_inv_id:
+                return
+            inv_resp = await self._rest(
+                "GET", f"{self.base_url}/inventory_levels.json?inventory_item_ids={first_inv_id}",
+                timeout=_TIMEOUT_GRAPHQL,
+            )
+            inv_levels = inv_resp.json().get("inventory_levels", [])
+            if inv_levels:
+                location_id = inv_levels[0]["location_id"]
+            else:
+                loc_resp = await self._rest("GET", f"{self.base_url}/locations.json", timeout=_TIMEOUT_GRAPHQL)
+                locations = loc_resp.json().get("locations", [])
+                if not locations:
+                    return
+                location_id = locations[0]["id"]
+
+            has_default = "__default__" in size_stock
+
+            async def set_level(variant):
+                size_name = variant.get("option1", "")
+                qty = size_stock["__default__"] if has_default else size_stock.get(size_name, 0)
+                inv_item_id = variant.get("inventory_item_id")
+                if not inv_item_id:
+                    return None
+                resp = await self._rest(
+                    "POST", f"{self.base_url}/inventory_levels/set.json",
+                    json={"location_id": location_id, "inventory_item_id": inv_item_id, "available": qty},
+                    timeout=_TIMEOUT_GRAPHQL,
+                )
+                return qty if resp.status_code == 200 else None
+
+            results = await asyncio.gather(*(set_level(v) for v in shopify_product.get("variants", [])))
+            in_stock = sum(1 for q in results if q is not None and q > 0)
+            out_stock = sum(1 for q in results if q == 0)
+            logger.info(f"  📦 庫存: {in_stock} 有貨, {out_stock} 缺貨")
+        except Exception as e:
+            logger.warning(f"  ⚠️ 庫存設定失敗: {e}")
+
+    async def _generate_seo(self, title: str, desc: str, sku: str) -> dict:
+        if not OPENAI_API_KEY:
+            return {}
+        for attempt in range(3):
+            try:
+                resp = await _request(
+                    self.session, self.limiter, "POST",
+                    "https://api.openai.com/v1/chat/completions",
+                    headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
+                    json=ShopifyUploader._seo_payload(title, desc, sku),
+                    timeout=_TIMEOUT_GRAPHQL,
+                )
+                if resp.status_code == 200:
+                    content = resp.json()["choices"][0]["message"]["content"]
+                    return ShopifyUploader._parse_seo_content(content)
+                elif resp.status_code == 429:
+                    await asyncio.sleep(3 * (attempt + 1))
+                    continue
+            except Exception:
+                pass
+        return {}
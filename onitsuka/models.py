@@ -0,0 +1,132 @@
+"""
+Onitsuka Tiger 商品資料結構
+============================
+- OnitsukaProduct: __slots__ 精簡商品紀錄（取代 _normalize_product 回傳的大 dict）
+- 性別 / 分類 / 庫存用 Enum（全程共用同一個物件，不重複存字串）
+- 尺寸表用 tuple；HTML 描述以 zlib 壓縮保存，讀取時才解壓
+"""
+
+import sys
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import NamedTuple
+
+class Gender(str, Enum):
+    MEN = "men"
+    WOMEN = "women"
+    UNISEX = "unisex"
+    KIDS = "kids"
+
+
+class Category(str, Enum):
+    MEN = "men"
+    WOMEN = "women"
+
+
+class StockStatus(str, Enum):
+    IN_STOCK = "IN_STOCK"
+    OUT_OF_STOCK = "OUT_OF_STOCK"
+    UNKNOWN = ""
+
+    @classmethod
+    def parse(cls, value) -> "StockStatus":
+        try:
+            return cls(value or "")
+        except ValueError:
+            return cls.UNKNOWN
+
+
+# 性別 → 要加入的 Collections（unisex → 男女都加）
+GENDER_COLLECTIONS = {
+    Gender.MEN: ("Onitsuka Tiger 男裝",),
+    Gender.WOMEN: ("Onitsuka Tiger 女裝",),
+    Gender.KIDS: ("Onitsuka Tiger 童裝",),
+    Gender.UNISEX: ("Onitsuka Tiger 男裝", "Onitsuka Tiger 女裝"),
+}
+
+
+class SizeEntry(NamedTuple):
+    size: str
+    sku: str
+    available: bool
+
+
+def _pack_html(html: str) -> bytes:
+    return zlib.compress(html.encode("utf-8")) if html else b""
+
+
+def _unpack_html(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8") if blob else ""
+
+
+class OnitsukaProduct:
+    """正規化後的單一商品（每個色號一筆）"""
+
+    __slots__ = (
+        "sku", "title", "price_jpy", "selling_price", "regular_price_jpy", "discount_percent",
+        "stock_status", "type", "url", "images", "sizes", "configurable_options",
+        "category", "gender", "scraped_at", "_description", "_short_description",
+    )
+
+    def __init__(self, sku: str, title: str, price_jpy: int, selling_price: int,
+                 regular_price_jpy: int, discount_percent, stock_status: StockStatus,
+                 type_id: str, url: str,
+                 images: tuple, sizes: tuple, configurable_options: tuple,
+                 category: Category, gender: Gender,
+                 description_html: str = "", short_description_html: str = "",
+                 scraped_at: float | None = None):
+        self.sku = sku
+        self.title = title
+        self.price_jpy = price_jpy
+        self.selling_price = selling_price
+        self.regular_price_jpy = regular_price_jpy
+        self.discount_percent = discount_percent
+        self.stock_status = stock_status
+        self.type = sys.intern(type_id) if type_id else ""
+        self.url = url
+        self.images = images
+        self.sizes = sizes
+        self.configurable_options = configurable_options
+        self.category = category
+        self.gender = gender
+        self.scraped_at = scraped_at if scraped_at is not None else datetime.now().timestamp()
+        self._description = _pack_html(description_html)
+        self._short_description = _pack_html(short_description_html)
+
+    # --- 由其他欄位推導，不另外存 ---
+    @property
+    def item_code(self) -> str:
+        return self.sku.split("_")[0]
+
+    @property
+    def color_code(self) -> str:
+        parts = self.sku.split("_")
+        return parts[1] if len(parts) > 1 else ""
+
+    @property
+    def image(self) -> str:
+        return self.images[0] if self.images else ""
+
+    @property
+    def collection_names(self) -> tuple:
+        return GENDER_COLLECTIONS[self.gender]
+
+    # --- 描述：用到時才解壓 ---
+    @property
+    def description_html(self) -> str:
+        return _unpack_html(self._description)
+
+    @property
+    def short_description_html(self) -> str:
+        return _unpack_html(self._short_description)
+
+    @property
+    def in_stock(self) -> bool:
+        """有尺寸 → 任一尺寸有貨；沒有尺寸 → 看 stock_status"""
+        if self.sizes:
+            return any(s.available for s in self.sizes)
+        return self.stock_status is StockStatus.IN_STOCK
+
+    def __repr__(self):
+        return f"OnitsukaProduct(sku={self.sku!r}, title={self.title!r}, price_jpy={self.price_jpy})"
@@ -16,9 +16,12 @@ import math
 import time
 import logging
 import requests
-from datetime import datetime
 from html import unescape
 
+from models import (
+    OnitsukaProduct, SizeEntry, Gender, Category, StockStatus,
+)
+
 # ============================================================
 # Logging
 # ============================================================
@@ -72,6 +75,40 @@ def calculate_price(original_price_jpy: int) -> int:
 # ============================================================
 # 翻譯 (ChatGPT API)
 # ============================================================
+TRANSLATE_SYSTEM_PROMPT = (
+    "你是翻譯專家。請將以下日文商品描述翻譯成繁體中文。\n"
+    "嚴格規則：\n"
+    "1. 只回傳翻譯結果，不要加任何解釋。\n"
+    "2. 品牌名和型號名保留英文原文（如 MEXICO 66, SERRANO, Onitsuka Tiger 等）。\n"
+    "3. 【最重要】輸出中絕對禁止出現任何日文字元：\n"
+    "   - 禁止平假名（あ-ん）\n"
+    "   - 禁止片假名（ア-ン、オニツカタイガー→Onitsuka Tiger、ストライプ→條紋）\n"
+    "   - 所有片假名外來語必須翻譯成中文或還原成英文原文\n"
+    "   - 例：オニツカタイガーストライプ→Onitsuka Tiger 條紋\n"
+    "   - 例：デラックス→DELUXE、レザー→皮革、スニーカー→運動鞋\n"
+    "4. 如果原文已經是英文或中文，直接回傳原文。\n"
+    "5. 適當換行讓內容好閱讀：\n"
+    "   - 每個句子結束後換行\n"
+    "   - 商品特點用 ・ 開頭，每項獨立一行\n"
+    "   - 不要使用 HTML 標籤換行，直接用換行符\n"
+    "6. HTML 標籤保持不變。\n"
+    "7. 翻譯完成後自我檢查，如果輸出中仍有任何日文字元，必須全部替換。"
+)
+
+
+def _translation_payload(text: str) -> dict:
+    """OpenAI 翻譯請求的 JSON body"""
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": TRANSLATE_SYSTEM_PROMPT},
+            {"role": "user", "content": text},
+        ],
+        "temperature": 0,
+        "max_tokens": 2000,
+    }
+
+
 def translate_ja_to_zhtw(text: str) -> str:
     """用 OpenAI ChatGPT 將日文翻譯為繁體中文"""
     if not text or not text.strip():
@@ -87,36 +124,7 @@ def translate_ja_to_zhtw(text: str) -> str:
                     "Authorization": f"Bearer {OPENAI_API_KEY}",
                     "Content-Type": "application/json",
                 },
-                json={
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": (
-                                "你是翻譯專家。請將以下日文商品描述翻譯成繁體中文。\n"
-                                "嚴格規則：\n"
-                                "1. 只回傳翻譯結果，不要加任何解釋。\n"
-                                "2. 品牌名和型號名保留英文原文（如 MEXICO 66, SERRANO, Onitsuka Tiger 等）。\n"
-                                "3. 【最重要】輸出中絕對禁止出現任何日文字元：\n"
-                                "   - 禁止平假名（あ-ん）\n"
-                                "   - 禁止片假名（ア-ン、オニツカタイガー→Onitsuka Tiger、ストライプ→條紋）\n"
-                                "   - 所有片假名外來語必須翻譯成中文或還原成英文原文\n"
-                                "   - 例：オニツカタイガーストライプ→Onitsuka Tiger 條紋\n"
-                                "   - 例：デラックス→DELUXE、レザー→皮革、スニーカー→運動鞋\n"
-                                "4. 如果原文已經是英文或中文，直接回傳原文。\n"
-                                "5. 適當換行讓內容好閱讀：\n"
-                                "   - 每個句子結束後換行\n"
-                                "   - 商品特點用 ・ 開頭，每項獨立一行\n"
-                                "   - 不要使用 HTML 標籤換行，直接用換行符\n"
-                                "6. HTML 標籤保持不變。\n"
-                                "7. 翻譯完成後自我檢查，如果輸出中仍有任何日文字元，必須全部替換。"
-                            ),
-                        },
-                        {"role": "user", "content": text},
-                    ],
-                    "temperature": 0,
-                    "max_tokens": 2000,
-                },
+                json=_translation_payload(text),
                 timeout=30,
             )
             if resp.status_code == 200:
@@ -163,6 +171,14 @@ class DailyLimitReached(Exception):
     pass
 
 
+def _raise_if_daily_limit(body: dict):
+    """429 回應若是每日 variant 上限（retry 也沒用）→ 拋出 DailyLimitReached"""
+    errors = body.get("errors", {}) if isinstance(body, dict) else {}
+    error_text = json.dumps(errors)
+    if "Daily variant creation limit" in error_text or "daily" in error_text.lower():
+        raise DailyLimitReached("Shopify 每日 variant 建立上限已達，需等待 24 小時重置")
+
+
 def _api_request_with_retry(method, url, max_retries=3, **kwargs):
     """帶 retry 的 API 請求（處理 429 rate limit）"""
     for attempt in range(max_retries):
@@ -170,14 +186,9 @@ def _api_request_with_retry(method, url, max_retries=3, **kwargs):
         if resp.status_code == 429:
             # 檢查是否為 daily limit（不是一般 rate limit，retry 也沒用）
             try:
-                body = resp.json()
-                errors = body.get("errors", {})
-                error_text = json.dumps(errors)
-                if "Daily variant creation limit" in error_text or "daily" in error_text.lower():
-                    raise DailyLimitReached("Shopify 每日 variant 建立上限已達，需等待 24 小時重置")
-            except (ValueError, DailyLimitReached) as e:
-                if isinstance(e, DailyLimitReached):
-                    raise
+                _raise_if_daily_limit(resp.json())
+            except ValueError:
+                pass
             # 一般 rate limit → retry
             retry_after = float(resp.headers.get("Retry-After", 2 * (attempt + 1)))
             logger.warning(f"  ⏳ Rate limit (429)，等待 {retry_after}s...")
@@ -190,7 +201,337 @@ def _api_request_with_retry(method, url, max_retries=3, **kwargs):
 # ============================================================
 # GraphQL 爬蟲核心
 # ============================================================
-class OnitsukaScraper:
+PRODUCT_ITEM_FIELDS = """
+                        id uid name sku url_key type_id
+                        stock_status
+                        %s
+                        price_range {
+                            minimum_price {
+                                regular_price { value currency }
+                                final_price { value currency }
+                                discount { amount_off percent_off }
+                            }
+                        }
+                        image { url label }
+                        media_gallery { url label position }
+                        short_description { html }
+                        description { html }
+                        ... on ConfigurableProduct {
+                            configurable_options {
+                                attribute_code label
+                                values { value_index label }
+                            }
+                            variants {
+                                product {
+                                    id sku name stock_status
+                                    image { url label }
+                                }
+                                attributes { code label value_index }
+                            }
+                        }
+"""
+
+CATEGORIES_QUERY = """
+{
+    categories(filters: {}, pageSize: 50, currentPage: 1) {
+        items {
+            id uid name url_path product_count level
+            children {
+                id uid name url_path product_count level
+            }
+        }
+    }
+}
+"""
+
+GENDER_METADATA_QUERY = """
+{
+    customAttributeMetadata(attributes: [
+        { attribute_code: "gender", entity_type: "catalog_product" }
+    ]) {
+        items {
+            attribute_code
+            attribute_options {
+                value
+                label
+            }
+        }
+    }
+}
+"""
+
+# Scene7 商品頁實際顯示的 4 個主要角度
+SCENE7_PRIMARY_SUFFIXES = [
+    "SR_RT_GLB-1",   # 右側（主圖）
+    "SB_FR_GLB",     # 正面右
+    "SR_LT_GLB",     # 左側
+    "SB_FL_GLB",     # 正面左
+]
+# 額外角度
+SCENE7_EXTRA_SUFFIXES = [
+    "SB_TP_GLB",     # 俯視
+    "SB_BT_GLB",     # 底部
+    "SR_BK_GLB",     # 後面
+]
+SCENE7_QUALITY_PARAM = "?$otmag_zoom$&qlt=99,1"
+
+
+class _ProductParserMixin:
+    """
+    同步 / 非同步爬蟲共用的解析邏輯
+    這裡只放純資料處理（不發任何請求），I/O 由各自的爬蟲類別負責
+    """
+
+    _gender_map: dict
+
+    @staticmethod
+    def _products_query(uid: str, page: int, with_gender: bool) -> str:
+        """組合分類商品列表的 GraphQL 查詢"""
+        # 帶 gender 欄位查詢（Magento 自訂屬性可能叫 gender 也可能不存在）
+        return """
+            {
+                products(
+                    filter: { category_uid: { eq: "%s" } }
+                    pageSize: %d
+                    currentPage: %d
+                    sort: { position: ASC }
+                ) {
+                    total_count
+                    items {
+                        %s
+                    }
+                    page_info { current_page page_size total_pages }
+                }
+            }
+            """ % (uid, PAGE_SIZE, page, PRODUCT_ITEM_FIELDS % ("gender" if with_gender else ""))
+
+    @staticmethod
+    def _apply_category_uids(data: dict):
+        """把分類查詢結果寫回 CATEGORIES 的 uid"""
+        all_cats = data.get("categories", {}).get("items", [])
+
+        # 展平搜尋
+        def find_cat(cats, target_path):
+            for c in cats:
+                if c.get("url_path") == target_path:
+                    return c
+                children = c.get("children", [])
+                found = find_cat(children, target_path)
+                if found:
+                    return found
+            return None
+
+        for key, cat_config in CATEGORIES.items():
+            found = find_cat(all_cats, cat_config["url_path"])
+            if found:
+                cat_config["uid"] = found["uid"]
+                cat_config["magento_id"] = found["id"]
+                logger.info(f"  ✅ {cat_config['name']}: uid={found['uid']}, id={found['id']}, products={found.get('product_count', '?')}")
+            else:
+                logger.warning(f"  ⚠️ 找不到分類: {cat_config['url_path']}")
+
+    def _apply_gender_mapping(self, data: dict):
+        """把 gender attribute 的 option 寫入 _gender_map"""
+        items = data.get("customAttributeMetadata", {}).get("items", [])
+        for item in items:
+            if item.get("attribute_code") == "gender":
+                for opt in item.get("attribute_options", []):
+                    val = str(opt.get("value", ""))
+                    label = str(opt.get("label", "")).strip().upper()
+                    self._gender_map[val] = label
+                    logger.info(f"  gender {val} → {label}")
+
+        if self._gender_map:
+            logger.info(f"  ✅ gender 對應表: {len(self._gender_map)} 個選項")
+        else:
+            logger.warning("  ⚠️ gender attribute 沒有 options，使用分類 fallback")
+
+    @staticmethod
+    def _extract_price(item: dict) -> int:
+        """取整數價格（優先折扣後價格）"""
+        price_info = item.get("price_range", {}).get("minimum_price", {})
+        regular_price = price_info.get("regular_price", {}).get("value", 0)
+        final_price = price_info.get("final_price", {}).get("value", 0)
+        return int(round(final_price)) if final_price else int(round(regular_price))
+
+    @staticmethod
+    def _product_url(item: dict) -> str:
+        url_key = item.get("url_key", "")
+        return f"{BASE_URL}/jp/ja-jp/{url_key}.html" if url_key else ""
+
+    @staticmethod
+    def _listing_images(item: dict, sku: str) -> list:
+        """最後 fallback: 列表查詢的 media_gallery"""
+        gallery_images = []
+        for media in sorted(item.get("media_gallery", []), key=lambda x: x.get("position", 99)):
+            url = media.get("url", "")
+            if url and url not in gallery_images:
+                gallery_images.append(url)
+        if gallery_images:
+            logger.warning(f"  ⚠️ 僅列表縮圖: {len(gallery_images)} 張 ({sku})")
+            return gallery_images
+        main_image = item.get("image", {}).get("url", "")
+        return [main_image] if main_image else []
+
+    @staticmethod
+    def _extract_page_images(html: str) -> list:
+        """從商品頁 HTML 提取圖片 URL"""
+        images = []
+
+        # 方法1: 從 pdp-gallery-bigimg 區塊提取 Scene7 圖片
+        # <img src="https://asics.scene7.com/is/image/asics/1182A187_101_SR_RT_GLB-1?$otmag_zoom$&qlt=99,1"
+        gallery_match = re.findall(
+            r'class="pdp-gallery-img"[^>]*>.*?<img[^>]+src="([^"]+)"',
+            html, re.DOTALL
+        )
+        if gallery_match:
+            for url in gallery_match:
+                if url and url not in images:
+                    images.append(url)
+
+        # 方法2: 從 JSON-LD 或 script 裡的 gallery data 提取
+        if not images:
+            # 有些 Magento 會在 script 裡放 gallery JSON
+            json_match = re.findall(
+                r'"full"\s*:\s*"(https?://[^"]+(?:scene7|onitsukatiger)[^"]*)"',
+                html
+            )
+            for url in json_match:
+                if url and url not in images:
+                    images.append(url)
+
+        # 方法3: 抓所有 scene7 或 media/catalog 圖片 URL
+        if not images:
+            all_img_urls = re.findall(
+                r'(https://asics\.scene7\.com/is/image/asics/[^"\'&\s]+)',
+                html
+            )
+            seen = set()
+            for url in all_img_urls:
+                # 過濾掉 swatch 小圖和重複
+                if 'swatch' in url.lower() or 'thumbnail' in url.lower():
+                    continue
+                base_url = url.split('?')[0]  # 去掉 query params 做去重
+                if base_url not in seen:
+                    seen.add(base_url)
+                    # 加上高畫質參數
+                    final_url = f"{base_url}{SCENE7_QUALITY_PARAM}"
+                    images.append(final_url)
+
+        return images
+
+    def _build_product(self, item: dict, category_key: str, price_jpy: int,
+                       product_url: str, all_images: list) -> OnitsukaProduct:
+        """將 GraphQL 商品資料 + 已解析的圖片組成 OnitsukaProduct"""
+        sku = item.get("sku", "")
+        price_info = item.get("price_range", {}).get("minimum_price", {})
+        regular_price = price_info.get("regular_price", {}).get("value", 0)
+        discount = price_info.get("discount", {})
+
+        # 尺寸
+        sizes = []
+        for variant in item.get("variants", []):
+            v_product = variant.get("product", {})
+            v_attrs = variant.get("attributes", [])
+            size_label = ""
+            for attr in v_attrs:
+                if attr.get("code", "").lower() in ("size", "shoe_size", "clothing_size"):
+                    size_label = attr.get("label", "")
+                    break
+            # 如果沒有明確 size attribute，用第一個 attribute
+            if not size_label and v_attrs:
+                size_label = v_attrs[0].get("label", "")
+
+            if size_label:
+                sizes.append(SizeEntry(
+                    size_label,
+                    v_product.get("sku", ""),
+                    v_product.get("stock_status") == "IN_STOCK",
+                ))
+
+        # configurable_options → (attribute_code, label, ((value_index, label), ...))
+        configurable_options = tuple(
+            (opt.get("attribute_code", ""), opt.get("label", ""),
+             tuple((v.get("value_index"), v.get("label", "")) for v in opt.get("values", [])))
+            for opt in item.get("configurable_options", [])
+        )
+
+        # 性別判斷
+        # GraphQL 可能回傳 gender 欄位（數值或文字）
+        # Magento 常見: 1=MEN, 2=WOMEN, 3=UNISEX，或直接文字
+        raw_gender = item.get("gender")
+        gender = self._parse_gender(raw_gender, category_key)
+        # 只對前幾個商品印 debug（避免 log 爆量）
+        if not hasattr(self, '_gender_log_count'):
+            self._gender_log_count = 0
+        if self._gender_log_count < 5:
+            logger.info(f"  👤 {sku}: gender raw={raw_gender} → {gender.value}")
+            self._gender_log_count += 1
+
+        return OnitsukaProduct(
+            sku=sku,
+            title=item.get("name", ""),
+            price_jpy=price_jpy,
+            selling_price=calculate_price(price_jpy),
+            regular_price_jpy=int(round(regular_price)),
+            discount_percent=discount.get("percent_off", 0),
+            stock_status=StockStatus.parse(item.get("stock_status")),
+            type_id=item.get("type_id", ""),
+            url=product_url,
+            images=tuple(all_images),
+            sizes=tuple(sizes),
+            configurable_options=configurable_options,
+            category=Category(category_key),
+            gender=gender,
+            description_html=item.get("description", {}).get("html", ""),
+            short_description_html=item.get("short_description", {}).get("html", ""),
+        )
+
+    @staticmethod
+    def strip_html(html_text: str) -> str:
+        """移除 HTML 標籤，取得純文字"""
+        if not html_text:
+            return ""
+        text = re.sub(r'<[^>]+>', '', html_text)
+        text = unescape(text)
+        return text.strip()
+
+    def _parse_gender(self, raw_gender, fallback_category: str = "") -> Gender:
+        """
+        解析性別欄位
+        Magento gender 回傳的是 attribute option ID (如 2787)
+        需要透過 _gender_map 對應到 MEN/WOMEN/UNISEX
+        """
+        if raw_gender is None:
+            if fallback_category in ("men", "women"):
+                return Gender(fallback_category)
+            return Gender.UNISEX
+
+        raw_str = str(raw_gender).strip()
+
+        # 先查對應表（數字 option_id → label）
+        if raw_str in self._gender_map:
+            label = self._gender_map[raw_str]
+        else:
+            label = raw_str.upper()
+
+        # 解析 label
+        if label in ("MEN", "MALE", "M", "メンズ"):
+            return Gender.MEN
+        elif label in ("WOMEN", "FEMALE", "W", "F", "レディース", "ウィメンズ"):
+            return Gender.WOMEN
+        elif label in ("UNISEX", "U"):
+            return Gender.UNISEX
+        elif label in ("KIDS", "CHILDREN", "キッズ"):
+            return Gender.KIDS
+
+        # fallback
+        if fallback_category in ("men", "women"):
+            return Gender(fallback_category)
+        return Gender.UNISEX
+
+
+class OnitsukaScraper(_ProductParserMixin):
     """使用 Magento GraphQL API 爬取 Onitsuka Tiger Japan"""
 
     def __init__(self):
@@ -254,44 +595,11 @@ class OnitsukaScraper:
     def _resolve_category_uids(self):
         """用 GraphQL 取得男裝/女裝分類的 UID"""
         logger.info("解析分類 UID...")
-        query = """
-        {
-            categories(filters: {}, pageSize: 50, currentPage: 1) {
-                items {
-                    id uid name url_path product_count level
-                    children {
-                        id uid name url_path product_count level
-                    }
-                }
-            }
-        }
-        """
-        data = self._graphql(query)
+        data = self._graphql(CATEGORIES_QUERY)
         if not data:
             logger.error("無法取得分類，將使用搜尋模式")
             return
-
-        all_cats = data.get("categories", {}).get("items", [])
-
-        # 展平搜尋
-        def find_cat(cats, target_path):
-            for c in cats:
-                if c.get("url_path") == target_path:
-                    return c
-                children = c.get("children", [])
-                found = find_cat(children, target_path)
-                if found:
-                    return found
-            return None
-
-        for key, cat_config in CATEGORIES.items():
-            found = find_cat(all_cats, cat_config["url_path"])
-            if found:
-                cat_config["uid"] = found["uid"]
-                cat_config["magento_id"] = found["id"]
-                logger.info(f"  ✅ {cat_config['name']}: uid={found['uid']}, id={found['id']}, products={found.get('product_count', '?')}")
-            else:
-                logger.warning(f"  ⚠️ 找不到分類: {cat_config['url_path']}")
+        self._apply_category_uids(data)
 
     def _resolve_gender_mapping(self):
         """
@@ -299,39 +607,11 @@ class OnitsukaScraper:
         Magento 的 gender 回傳數字 (如 2787)，需要對應到 MEN/WOMEN/UNISEX
         """
         logger.info("解析 gender 對應表...")
-        query = """
-        {
-            customAttributeMetadata(attributes: [
-                { attribute_code: "gender", entity_type: "catalog_product" }
-            ]) {
-                items {
-                    attribute_code
-                    attribute_options {
-                        value
-                        label
-                    }
-                }
-            }
-        }
-        """
-        data = self._graphql(query)
+        data = self._graphql(GENDER_METADATA_QUERY)
         if not data:
             logger.warning("  ⚠️ 無法查詢 gender 對應表，使用分類 fallback")
             return
-
-        items = data.get("customAttributeMetadata", {}).get("items", [])
-        for item in items:
-            if item.get("attribute_code") == "gender":
-                for opt in item.get("attribute_options", []):
-                    val = str(opt.get("value", ""))
-                    label = str(opt.get("label", "")).strip().upper()
-                    self._gender_map[val] = label
-                    logger.info(f"  gender {val} → {label}")
-
-        if self._gender_map:
-            logger.info(f"  ✅ gender 對應表: {len(self._gender_map)} 個選項")
-        else:
-            logger.warning("  ⚠️ gender attribute 沒有 options，使用分類 fallback")
+        self._apply_gender_mapping(data)
 
     def scrape_category(self, category_key: str, max_pages: int = 0) -> list:
         """
@@ -354,79 +634,14 @@ class OnitsukaScraper:
         page = 1
 
         while True:
-            # 帶 gender 欄位查詢（Magento 自訂屬性可能叫 gender 也可能不存在）
-            items_fields = """
-                        id uid name sku url_key type_id
-                        stock_status
-                        %s
-                        price_range {
-                            minimum_price {
-                                regular_price { value currency }
-                                final_price { value currency }
-                                discount { amount_off percent_off }
-                            }
-                        }
-                        image { url label }
-                        media_gallery { url label position }
-                        short_description { html }
-                        description { html }
-                        ... on ConfigurableProduct {
-                            configurable_options {
-                                attribute_code label
-                                values { value_index label }
-                            }
-                            variants {
-                                product {
-                                    id sku name stock_status
-                                    image { url label }
-                                }
-                                attributes { code label value_index }
-                            }
-                        }
-            """
-
             # 第一次嘗試帶 gender
-            gender_field = "gender" if not hasattr(self, '_gender_field_broken') else ""
-            query = """
-            {
-                products(
-                    filter: { category_uid: { eq: "%s" } }
-                    pageSize: %d
-                    currentPage: %d
-                    sort: { position: ASC }
-                ) {
-                    total_count
-                    items {
-                        %s
-                    }
-                    page_info { current_page page_size total_pages }
-                }
-            }
-            """ % (uid, PAGE_SIZE, page, items_fields % gender_field)
-
-            data = self._graphql(query)
+            data = self._graphql(self._products_query(uid, page, not hasattr(self, '_gender_field_broken')))
 
             # 如果 gender 欄位導致 GraphQL 報錯，標記後不帶 gender 重試
             if data is None and not hasattr(self, '_gender_field_broken'):
                 logger.warning("  ⚠️ GraphQL 查詢失敗，嘗試不帶 gender 欄位...")
                 self._gender_field_broken = True
-                query = """
-                {
-                    products(
-                        filter: { category_uid: { eq: "%s" } }
-                        pageSize: %d
-                        currentPage: %d
-                        sort: { position: ASC }
-                    ) {
-                        total_count
-                        items {
-                            %s
-                        }
-                        page_info { current_page page_size total_pages }
-                    }
-                }
-                """ % (uid, PAGE_SIZE, page, items_fields % "")
-                data = self._graphql(query)
+                data = self._graphql(self._products_query(uid, page, False))
 
             if not data or "products" not in data:
                 logger.error(f"  第 {page} 頁查詢失敗")
@@ -445,7 +660,7 @@ class OnitsukaScraper:
                 product = self._normalize_product(item, category_key)
                 if product:
                     # SKU 去重
-                    if not any(p["sku"] == product["sku"] for p in all_products):
+                    if not any(p.sku == product.sku for p in all_products):
                         all_products.append(product)
 
             logger.info(f"  第 {page}/{total_pages} 頁: +{len(items)} 商品 (累計 {len(all_products)})")
@@ -462,136 +677,29 @@ class OnitsukaScraper:
         logger.info(f"  ✅ {cat['name']} 共取得 {len(all_products)} 個不重複商品")
         return all_products
 
-    def _normalize_product(self, item: dict, category_key: str) -> dict | None:
+    def _normalize_product(self, item: dict, category_key: str) -> OnitsukaProduct | None:
         """將 GraphQL 商品資料正規化為統一格式"""
         sku = item.get("sku", "")
         if not sku:
             return None
 
-        # 價格
-        price_info = item.get("price_range", {}).get("minimum_price", {})
-        regular_price = price_info.get("regular_price", {}).get("value", 0)
-        final_price = price_info.get("final_price", {}).get("value", 0)
-        discount = price_info.get("discount", {})
-
-        # 取整數價格
-        price_jpy = int(round(final_price)) if final_price else int(round(regular_price))
+        price_jpy = self._extract_price(item)
         if price_jpy <= 0:
             return None
 
         # URL（在圖片之前計算，因為 fallback 抓圖需要）
-        url_key = item.get("url_key", "")
-        product_url = f"{BASE_URL}/jp/ja-jp/{url_key}.html" if url_key else ""
+        product_url = self._product_url(item)
 
         # 圖片策略：
         # GraphQL 列表查詢的 media_gallery 只回 1 張縮圖
         # 優先用 Scene7 CDN 組合高畫質圖（商品頁實際使用的圖片來源）
         # Scene7 沒圖時，抓商品頁 HTML 提取實際圖片
-        scene7_images = self._build_scene7_images(sku)
-        if scene7_images:
-            all_images = scene7_images
-            main_image = all_images[0]
-        else:
-            # Scene7 沒圖 → 抓商品頁 HTML 取圖
-            full_images = self._fetch_product_images(sku, product_url)
-            if full_images:
-                all_images = full_images
-                main_image = all_images[0]
-            else:
-                # 最後 fallback: 列表查詢的 media_gallery
-                gallery_images = []
-                for media in sorted(item.get("media_gallery", []), key=lambda x: x.get("position", 99)):
-                    url = media.get("url", "")
-                    if url and url not in gallery_images:
-                        gallery_images.append(url)
-                if gallery_images:
-                    all_images = gallery_images
-                    main_image = all_images[0]
-                    logger.warning(f"  ⚠️ 僅列表縮圖: {len(all_images)} 張 ({sku})")
-                else:
-                    main_image = item.get("image", {}).get("url", "")
-                    all_images = [main_image] if main_image else []
-
-        # 尺寸
-        sizes = []
-        configurable_options = item.get("configurable_options", [])
-        variants = item.get("variants", [])
-
-        for variant in variants:
-            v_product = variant.get("product", {})
-            v_attrs = variant.get("attributes", [])
-            size_label = ""
-            for attr in v_attrs:
-                if attr.get("code", "").lower() in ("size", "shoe_size", "clothing_size"):
-                    size_label = attr.get("label", "")
-                    break
-            # 如果沒有明確 size attribute，用第一個 attribute
-            if not size_label and v_attrs:
-                size_label = v_attrs[0].get("label", "")
-
-            if size_label:
-                sizes.append({
-                    "size": size_label,
-                    "sku": v_product.get("sku", ""),
-                    "available": v_product.get("stock_status") == "IN_STOCK",
-                })
-
-        # 描述
-        desc_html = item.get("description", {}).get("html", "")
-        short_desc_html = item.get("short_description", {}).get("html", "")
-
-        # SKU 解析
-        sku_parts = sku.split("_")
-        item_code = sku_parts[0] if sku_parts else sku
-        color_code = sku_parts[1] if len(sku_parts) > 1 else ""
-
-        # 性別判斷
-        # GraphQL 可能回傳 gender 欄位（數值或文字）
-        # Magento 常見: 1=MEN, 2=WOMEN, 3=UNISEX，或直接文字
-        raw_gender = item.get("gender")
-        gender = self._parse_gender(raw_gender, category_key)
-        # 只對前幾個商品印 debug（避免 log 爆量）
-        if not hasattr(self, '_gender_log_count'):
-            self._gender_log_count = 0
-        if self._gender_log_count < 5:
-            logger.info(f"  👤 {sku}: gender raw={raw_gender} → {gender}")
-            self._gender_log_count += 1
-
-        # 根據性別決定 Collections（可多個）
-        collection_names = self._get_collections_by_gender(gender)
-
-        return {
-            "sku": sku,
-            "item_code": item_code,
-            "color_code": color_code,
-            "title": item.get("name", ""),
-            "price_jpy": price_jpy,
-            "selling_price": calculate_price(price_jpy),
-            "regular_price_jpy": int(round(regular_price)),
-            "discount_percent": discount.get("percent_off", 0),
-            "stock_status": item.get("stock_status", ""),
-            "type": item.get("type_id", ""),
-            "url": product_url,
-            "image": main_image,
-            "images": all_images,
-            "sizes": sizes,
-            "description_html": desc_html,
-            "short_description_html": short_desc_html,
-            "configurable_options": configurable_options,
-            "category": category_key,
-            "gender": gender,
-            "collection_names": collection_names,
-            "scraped_at": datetime.now().isoformat(),
-        }
-
-    @staticmethod
-    def strip_html(html_text: str) -> str:
-        """移除 HTML 標籤，取得純文字"""
-        if not html_text:
-            return ""
-        text = re.sub(r'<[^>]+>', '', html_text)
-        text = unescape(text)
-        return text.strip()
+        all_images = (
+            self._build_scene7_images(sku)
+            or self._fetch_product_images(sku, product_url)
+            or self._listing_images(item, sku)
+        )
+        return self._build_product(item, category_key, price_jpy, product_url, all_images)
 
     def _fetch_product_images(self, sku: str, product_url: str = "") -> list:
         """
@@ -610,49 +718,7 @@ class OnitsukaScraper:
                 logger.warning(f"  ⚠️ 商品頁 {resp.status_code}: {product_url}")
                 return []
 
-            html = resp.text
-            images = []
-
-            # 方法1: 從 pdp-gallery-bigimg 區塊提取 Scene7 圖片
-            # <img src="https://asics.scene7.com/is/image/asics/1182A187_101_SR_RT_GLB-1?$otmag_zoom$&qlt=99,1"
-            gallery_match = re.findall(
-                r'class="pdp-gallery-img"[^>]*>.*?<img[^>]+src="([^"]+)"',
-                html, re.DOTALL
-            )
-            if gallery_match:
-                for url in gallery_match:
-                    if url and url not in images:
-                        images.append(url)
-
-            # 方法2: 從 JSON-LD 或 script 裡的 gallery data 提取
-            if not images:
-                # 有些 Magento 會在 script 裡放 gallery JSON
-                json_match = re.findall(
-                    r'"full"\s*:\s*"(https?://[^"]+(?:scene7|onitsukatiger)[^"]*)"',
-                    html
-                )
-                for url in json_match:
-                    if url and url not in images:
-                        images.append(url)
-
-            # 方法3: 抓所有 scene7 或 media/catalog 圖片 URL
-            if not images:
-                all_img_urls = re.findall(
-                    r'(https://asics\.scene7\.com/is/image/asics/[^"\'&\s]+)',
-                    html
-                )
-                seen = set()
-                for url in all_img_urls:
-                    # 過濾掉 swatch 小圖和重複
-                    if 'swatch' in url.lower() or 'thumbnail' in url.lower():
-                        continue
-                    base_url = url.split('?')[0]  # 去掉 query params 做去重
-                    if base_url not in seen:
-                        seen.add(base_url)
-                        # 加上高畫質參數
-                        final_url = f"{base_url}?$otmag_zoom$&qlt=99,1"
-                        images.append(final_url)
-
+            images = self._extract_page_images(resp.text)
             if images:
                 logger.info(f"  📸 商品頁: {len(images)} 張圖片 ({sku})")
             else:
@@ -665,55 +731,6 @@ class OnitsukaScraper:
             logger.warning(f"  ⚠️ 抓商品頁失敗 ({sku}): {e}")
             return []
 
-    def _parse_gender(self, raw_gender, fallback_category: str = "") -> str:
-        """
-        解析性別欄位
-        Magento gender 回傳的是 attribute option ID (如 2787)
-        需要透過 _gender_map 對應到 MEN/WOMEN/UNISEX
-        """
-        if raw_gender is None:
-            if fallback_category == "men":
-                return "men"
-            elif fallback_category == "women":
-                return "women"
-            return "unisex"
-
-        raw_str = str(raw_gender).strip()
-
-        # 先查對應表（數字 option_id → label）
-        if raw_str in self._gender_map:
-            label = self._gender_map[raw_str]
-        else:
-            label = raw_str.upper()
-
-        # 解析 label
-        if label in ("MEN", "MALE", "M", "メンズ"):
-            return "men"
-        elif label in ("WOMEN", "FEMALE", "W", "F", "レディース", "ウィメンズ"):
-            return "women"
-        elif label in ("UNISEX", "U"):
-            return "unisex"
-        elif label in ("KIDS", "CHILDREN", "キッズ"):
-            return "kids"
-
-        # fallback
-        if fallback_category in ("men", "women"):
-            return fallback_category
-        return "unisex"
-
-    @staticmethod
-    def _get_collections_by_gender(gender: str) -> list:
-        """根據性別決定要加入哪些 Collections"""
-        if gender == "men":
-            return ["Onitsuka Tiger 男裝"]
-        elif gender == "women":
-            return ["Onitsuka Tiger 女裝"]
-        elif gender == "kids":
-            return ["Onitsuka Tiger 童裝"]
-        else:
-            # unisex → 男女都加
-            return ["Onitsuka Tiger 男裝", "Onitsuka Tiger 女裝"]
-
     def _build_scene7_images(self, sku: str) -> list:
         """
         用 ASICS Scene7 CDN 組合商品圖片 URL
@@ -725,21 +742,8 @@ class OnitsukaScraper:
             return []
 
         scene7_base = f"https://asics.scene7.com/is/image/asics/{sku}"
-        quality_param = "?$otmag_zoom$&qlt=99,1"
-
-        # 商品頁實際顯示的 4 個主要角度（從你貼的 HTML 看到的）
-        primary_suffixes = [
-            "SR_RT_GLB-1",   # 右側（主圖）
-            "SB_FR_GLB",     # 正面右
-            "SR_LT_GLB",     # 左側
-            "SB_FL_GLB",     # 正面左
-        ]
-        # 額外角度
-        extra_suffixes = [
-            "SB_TP_GLB",     # 俯視
-            "SB_BT_GLB",     # 底部
-            "SR_BK_GLB",     # 後面
-        ]
+        quality_param = SCENE7_QUALITY_PARAM
+        primary_suffixes = SCENE7_PRIMARY_SUFFIXES
 
         images = []
 
@@ -753,7 +757,7 @@ class OnitsukaScraper:
             else:
                 images.append(alt_main)
                 # 用不帶 -1 的模式繼續
-                for suffix in ["SB_FR_GLB", "SR_LT_GLB", "SB_FL_GLB"]:
+                for suffix in primary_suffixes[1:]:
                     url = f"{scene7_base}_{suffix}{quality_param}"
                     if self._check_image_exists(url):
                         images.append(url)
@@ -767,7 +771,7 @@ class OnitsukaScraper:
             images.append(f"{scene7_base}_{suffix}{quality_param}")
 
         # 額外角度用檢查（可能不存在）
-        for suffix in extra_suffixes:
+        for suffix in SCENE7_EXTRA_SUFFIXES:
             url = f"{scene7_base}_{suffix}{quality_param}"
             if self._check_image_exists(url):
                 images.append(url)
@@ -794,25 +798,34 @@ class OnitsukaScraper:
             )
             # 檢查 Content-Range 或 Content-Length
             if resp.status_code in (200, 206):
-                # 從 Content-Range 取得完整大小: "bytes 0-0/123456"
-                content_range = resp.headers.get("Content-Range", "")
-                if "/" in content_range:
-                    total_size = int(content_range.split("/")[-1])
-                    resp.close()
-                    return total_size > 10000  # > 10KB = 真圖
-                # 沒有 Content-Range，用 Content-Length
-                content_length = int(resp.headers.get("Content-Length", "0"))
                 resp.close()
-                return content_length > 10000
+                return _image_size_from_headers(resp.headers) > 10000  # > 10KB = 真圖
             resp.close()
             return False
         except Exception:
             return False
 
 
+def _image_size_from_headers(headers) -> int:
+    """從 Content-Range（"bytes 0-0/123456"）或 Content-Length 取得圖片完整大小"""
+    content_range = headers.get("Content-Range", "")
+    if "/" in content_range:
+        return int(content_range.split("/")[-1])
+    # 沒有 Content-Range，用 Content-Length
+    return int(headers.get("Content-Length", "0"))
+
+
 # ============================================================
 # Shopify 上架
 # ============================================================
+def _next_page_url(link_header: str) -> str | None:
+    """解析 REST Link header 的下一頁 URL"""
+    if 'rel="next"' not in link_header:
+        return None
+    match = re.search(r'<([^>]+)>;\s*rel="next"', link_header)
+    return match.group(1) if match else None
+
+
 class ShopifyUploader:
     """將商品上架到 Shopify"""
 
@@ -897,12 +910,7 @@ class ShopifyUploader:
                             base_sku = sku.split("-")[0].upper()
                             skus.add(base_sku)
                             skus.add(sku.upper())
-                link_header = resp.headers.get("Link", "")
-                if 'rel="next"' in link_header:
-                    match = re.search(r'<([^>]+)>;\s*rel="next"', link_header)
-                    url = match.group(1) if match else None
-                else:
-                    url = None
+                url = _next_page_url(resp.headers.get("Link", ""))
             except Exception as e:
                 logger.error(f"取得 SKU 失敗: {e}")
                 break
@@ -952,12 +960,7 @@ class ShopifyUploader:
                     else:
                         skipped += 1
                 # 分頁
-                link_header = resp.headers.get("Link", "")
-                if 'rel="next"' in link_header:
-                    match = re.search(r'<([^>]+)>;\s*rel="next"', link_header)
-                    url = match.group(1) if match else None
-                else:
-                    url = None
+                url = _next_page_url(resp.headers.get("Link", ""))
             except Exception as e:
                 logger.error(f"批次更新異常: {e}")
                 break
@@ -1008,20 +1011,14 @@ class ShopifyUploader:
         except Exception:
             pass
 
-    # --- 上架商品 ---
-    def upload_product(self, product: dict, translate: bool = True) -> dict:
-        """上架單個商品到 Shopify"""
-        title = product["title"]
-        sku = product["sku"]
-        desc_html = product.get("description_html", "")
-        short_desc = product.get("short_description_html", "")
-
-        # 翻譯描述
-        if translate and OPENAI_API_KEY:
-            if desc_html:
-                desc_html = translate_ja_to_zhtw(desc_html)
-            if short_desc:
-                short_desc = translate_ja_to_zhtw(short_desc)
+    @staticmethod
+    def _build_product_payload(product: OnitsukaProduct, desc_html: str, short_desc: str, seo: dict) -> tuple:
+        """
+        組合 Shopify REST 商品 payload（描述需已翻譯）
+        回傳 (payload, size_stock)，size_stock 供之後設定庫存
+        """
+        title = product.title
+        sku = product.sku
 
         # 組合 Shopify 標題
         full_title = f"Onitsuka Tiger 鬼塚虎｜{title}"
@@ -1046,41 +1043,39 @@ class ShopifyUploader:
 
         # 商品資訊表
         info_rows = []
-        if product.get("color_code"):
-            info_rows.append(f'<tr><td><strong>色碼</strong></td><td>{product["color_code"]}</td></tr>')
+        if product.color_code:
+            info_rows.append(f'<tr><td><strong>色碼</strong></td><td>{product.color_code}</td></tr>')
         info_rows.append(f'<tr><td><strong>型號</strong></td><td>{sku}</td></tr>')
-        info_rows.append(f'<tr><td><strong>品番</strong></td><td>{product["item_code"]}</td></tr>')
+        info_rows.append(f'<tr><td><strong>品番</strong></td><td>{product.item_code}</td></tr>')
         if info_rows:
             body_html += "\n<br><br>\n<table>" + "".join(info_rows) + "</table>"
 
         # 圖片
         images = []
-        for img_url in product.get("images", [])[:20]:
+        for img_url in product.images[:20]:
             images.append({"src": img_url})
-        if not images and product.get("image"):
-            images.append({"src": product["image"]})
 
         # 建立尺碼 variants
-        sizes = product.get("sizes", [])
+        sizes = product.sizes
         if sizes:
             variants = []
             size_stock = {}
             for s in sizes:
-                size_name = s["size"]
+                size_name = s.size
                 variant_sku = f"{sku}-{size_name.replace('.', '').replace(' ', '')}"
                 variants.append({
                     "option1": size_name,
-                    "price": str(product["selling_price"]),
+                    "price": str(product.selling_price),
                     "compare_at_price": None,
                     "sku": variant_sku,
                     "inventory_management": "shopify",
                     "requires_shipping": True,
                 })
-                size_stock[size_name] = 2 if s.get("available", True) else 0
-            options = [{"name": "尺碼", "values": [s["size"] for s in sizes]}]
+                size_stock[size_name] = 2 if s.available else 0
+            options = [{"name": "尺碼", "values": [s.size for s in sizes]}]
         else:
             variants = [{
-                "price": str(product["selling_price"]),
+                "price": str(product.selling_price),
                 "compare_at_price": None,
                 "sku": sku,
                 "inventory_management": "shopify",
@@ -1089,19 +1084,16 @@ class ShopifyUploader:
             options = []
             size_stock = {"__default__": 2}
 
-        # SEO
-        seo = self._generate_seo(title, short_desc, sku)
-
         # Tags — 用實際性別而非爬取分類
-        gender = product.get("gender", "unisex")
-        tags = ["Onitsuka Tiger", "鬼塚虎", sku, product.get("item_code", "")]
-        if gender == "men":
+        gender = product.gender
+        tags = ["Onitsuka Tiger", "鬼塚虎", sku, product.item_code]
+        if gender is Gender.MEN:
             tags.append("男裝")
-        elif gender == "women":
+        elif gender is Gender.WOMEN:
             tags.append("女裝")
-        elif gender == "unisex":
+        elif gender is Gender.UNISEX:
             tags.extend(["男裝", "女裝", "UNISEX"])
-        elif gender == "kids":
+        elif gender is Gender.KIDS:
             tags.append("童裝")
 
         # Shopify payload
@@ -1124,6 +1116,27 @@ class ShopifyUploader:
         if options:
             payload["product"]["options"] = options
 
+        return payload, size_stock
+
+    # --- 上架商品 ---
+    def upload_product(self, product: OnitsukaProduct, translate: bool = True) -> dict:
+        """上架單個商品到 Shopify"""
+        title = product.title
+        sku = product.sku
+        desc_html = product.description_html
+        short_desc = product.short_description_html
+
+        # 翻譯描述
+        if translate and OPENAI_API_KEY:
+            if desc_html:
+                desc_html = translate_ja_to_zhtw(desc_html)
+            if short_desc:
+                short_desc = translate_ja_to_zhtw(short_desc)
+
+        # SEO
+        seo = self._generate_seo(title, short_desc, sku)
+        payload, size_stock = self._build_product_payload(product, desc_html, short_desc, seo)
+
         try:
             resp = _api_request_with_retry(
                 "POST", f"{self.base_url}/products.json",
@@ -1136,9 +1149,9 @@ class ShopifyUploader:
                 # 設定庫存
                 self._set_inventory_levels(shopify_product, size_stock)
                 # 設定原始連結 metafield
-                self._set_product_metafield(product_id, product.get("url", ""))
+                self._set_product_metafield(product_id, product.url)
                 # 加入所有相關 Collections（根據性別）
-                for col_name in product.get("collection_names", []):
+                for col_name in product.collection_names:
                     col_id = self.get_or_create_collection(col_name)
                     if col_id:
                         self._add_to_collection(product_id, col_id)
@@ -1148,8 +1161,8 @@ class ShopifyUploader:
 
                 gender_label = {"men": "男", "women": "女", "unisex": "男+女", "kids": "童"}
                 logger.info(
-                    f"✅ 上架成功: {sku} - {title} → ¥{product['selling_price']} "
-                    f"[{gender_label.get(gender, '?')}]"
+                    f"✅ 上架成功: {sku} - {title} → ¥{product.selling_price} "
+                    f"[{gender_label.get(product.gender.value, '?')}]"
                 )
                 self._existing_skus.add(sku.upper())
                 return {"success": True, "product_id": product_id}
@@ -1223,40 +1236,49 @@ class ShopifyUploader:
             logger.warning(f"  ⚠️ 庫存設定失敗: {e}")
 
     @staticmethod
-    def _generate_seo(title: str, desc: str, sku: str) -> dict:
-        if not OPENAI_API_KEY:
-            return {}
+    def _seo_payload(title: str, desc: str, sku: str) -> dict:
+        """OpenAI SEO 請求的 JSON body"""
         prompt_text = f"""商品名稱: {title}
 商品描述: {desc[:200] if desc else ''}
 型號: {sku}
 品牌: Onitsuka Tiger (鬼塚虎)
 商店: GOYOUTATI 日本代購"""
+        return {
+            "model": "gpt-4o-mini",
+            "messages": [
+                {"role": "system", "content": (
+                    "你是 SEO 專家。根據商品資訊生成搜尋引擎優化的頁面標題和 Meta 描述。"
+                    "規則："
+                    "1. 頁面標題(title)：最多 60 字元，包含品牌名、商品名、關鍵字。格式範例：Onitsuka Tiger MEXICO 66 經典鞋款｜GOYOUTATI 日本代購"
+                    "2. Meta 描述(description)：最多 155 字元，自然流暢的繁體中文。"
+                    "3. 不要出現日文。4. 只回傳 JSON：{\"title\": \"...\", \"description\": \"...\"}"
+                )},
+                {"role": "user", "content": prompt_text},
+            ],
+            "temperature": 0, "max_tokens": 300,
+        }
+
+    @staticmethod
+    def _parse_seo_content(content: str) -> dict:
+        content = content.strip().replace("```json", "").replace("```", "").strip()
+        return json.loads(content)
+
+    @staticmethod
+    def _generate_seo(title: str, desc: str, sku: str) -> dict:
+        if not OPENAI_API_KEY:
+            return {}
 
         for attempt in range(3):
             try:
                 resp = requests.post(
                     "https://api.openai.com/v1/chat/completions",
                     headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-                    json={
-                        "model": "gpt-4o-mini",
-                        "messages": [
-                            {"role": "system", "content": (
-                                "你是 SEO 專家。根據商品資訊生成搜尋引擎優化的頁面標題和 Meta 描述。"
-                                "規則："
-                                "1. 頁面標題(title)：最多 60 字元，包含品牌名、商品名、關鍵字。格式範例：Onitsuka Tiger MEXICO 66 經典鞋款｜GOYOUTATI 日本代購"
-                                "2. Meta 描述(description)：最多 155 字元，自然流暢的繁體中文。"
-                                "3. 不要出現日文。4. 只回傳 JSON：{\"title\": \"...\", \"description\": \"...\"}"
-                            )},
-                            {"role": "user", "content": prompt_text},
-                        ],
-                        "temperature": 0, "max_tokens": 300,
-                    },
+                    json=ShopifyUploader._seo_payload(title, desc, sku),
                     timeout=30,
                 )
                 if resp.status_code == 200:
-                    content = resp.json()["choices"][0]["message"]["content"].strip()
-                    content = content.replace("```json", "").replace("```", "").strip()
-                    return json.loads(content)
+                    content = resp.json()["choices"][0]["message"]["content"]
+                    return ShopifyUploader._parse_seo_content(content)
                 elif resp.status_code == 429:
                     time.sleep(3 * (attempt + 1))
                     continue